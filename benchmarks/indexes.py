@@ -0,0 +1,152 @@
+"""Index Benchmark
+
+Times the transaction access paths used by the dashboard with and without the
+composite indexes on the transactions table, and prints SQLite's query plan
+for each. A throwaway SQLite database is filled with synthetic transactions
+for each requested size.
+
+Usage:
+    python benchmarks/indexes.py --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from sqlalchemy import event, text
+from dontbudge.database import db
+from dontbudge.api.models import Transaction
+from dontbudge.api import queries
+from dontbudge.dashboard import utility
+
+USERS = 50
+ACCOUNTS = 4
+BUDGETS = 5
+CATEGORIES = 8
+YEARS = 5
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def fill(rows):
+    """Insert rows synthetic transactions spread over USERS users"""
+    random.seed(rows)
+    end = datetime(2022, 6, 1)
+    span = YEARS * 365 * 24 * 60
+    table = Transaction.__table__
+    chunk = []
+    for i in range(rows):
+        user = i % USERS + 1
+        chunk.append({
+            'user_id': user,
+            'account_id': (user - 1) * ACCOUNTS + random.randrange(ACCOUNTS) + 1,
+            'budget_id': (user - 1) * BUDGETS + random.randrange(BUDGETS) + 1 if random.random() < 0.5 else None,
+            'category_id': (user - 1) * CATEGORIES + random.randrange(CATEGORIES) + 1,
+            'description': f'Transaction {i}',
+            'date': end - timedelta(minutes=random.randrange(span)),
+            'amount': Decimal(random.randrange(-20000, 5000)) / 100
+        })
+        if len(chunk) == 50000:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+    db.session.commit()
+
+def get_cases():
+    """Each case is a name and a callable running the access path against user 1"""
+    period = utility.Period(datetime(2022, 5, 1), datetime(2022, 5, 15))
+    userdetails = SimpleNamespace(id=1, range='2W', period_start=period.start)
+    return [
+        ('period listing (user_id, date)', lambda: Transaction.query.filter(
+            Transaction.user_id == 1, Transaction.date >= period.start, Transaction.date < period.end
+        ).order_by(Transaction.date).all()),
+        ('account listing (account_id, date)', lambda: Transaction.query.filter(
+            Transaction.account_id == 1
+        ).order_by(Transaction.date.desc()).limit(50).all()),
+        ('budget transactions (budget_id, date)', lambda: Transaction.query.filter(
+            Transaction.budget_id == 1, Transaction.date >= period.start, Transaction.date < period.end
+        ).count()),
+        ('category transactions (category_id, date)', lambda: Transaction.query.filter(
+            Transaction.category_id == 1, Transaction.date >= period.start, Transaction.date < period.end
+        ).count()),
+        ('grouped budget usage', lambda: queries.get_budget_usage(1, period.start, period.end)),
+        ('latest transaction date', lambda: queries.get_latest_transaction_date(1)),
+        ('period list', lambda: utility.get_periods(userdetails)),
+    ]
+
+def run_cases(repeat):
+    """Time each case and capture the plan of the statements it runs"""
+    results = {}
+    for name, case in get_cases():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        case()
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+        plans = []
+        for statement, parameters in statements:
+            cursor = db.session.connection().connection.cursor()
+            plans.extend(row[-1] for row in cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters))
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            case()
+        elapsed = (time.perf_counter() - start) / repeat
+        results[name] = (elapsed, plans)
+    return results
+
+def set_indexes(enabled):
+    for index in Transaction.__table__.indexes:
+        if enabled:
+            index.create(bind=db.engine, checkfirst=True)
+        else:
+            index.drop(bind=db.engine, checkfirst=True)
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app(os.path.join(directory, 'benchmark.sqlite3'))
+            with app.app_context():
+                db.create_all()
+                fill(rows)
+                set_indexes(False)
+                before = run_cases(args.repeat)
+                set_indexes(True)
+                after = run_cases(args.repeat)
+
+        print(f'\n## {rows} rows\n')
+        print('| Access path | Without indexes | With indexes | Speedup |')
+        print('|---|---:|---:|---:|')
+        for name in before:
+            slow, fast = before[name][0], after[name][0]
+            print(f'| {name} | {slow * 1000:.2f} ms | {fast * 1000:.2f} ms | {slow / fast:.1f}x |')
+        print('\nQuery plans (without -> with):\n')
+        for name in before:
+            print(f'* {name}: `{"; ".join(before[name][1])}` -> `{"; ".join(after[name][1])}`')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Money Benchmark
+
+Times the aggregation work that depends on how amounts are stored: loading
+every amount of a synthetic user as Decimal and as raw integer cents, summing
+them in Python, summing them in SQL (in total and per account), and the
+dashboard aggregation as a whole.
+
+Usage:
+    python benchmarks/money.py --years 10 --per-day 10 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+
+from sqlalchemy import func
+import dontbudge
+from dontbudge.database import db
+from dontbudge.money import cents
+from dontbudge.api.models import UserDetails, Transaction
+from dontbudge.api import balances, queries
+from dontbudge.dashboard import aggregation
+from synthetic import Profile, generate
+
+def measure(f, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--per-day', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        dontbudge.DATABASE_URL = f'sqlite:///{os.path.join(directory, "benchmark.sqlite3")}'
+        app = dontbudge.create_app()
+        with app.app_context():
+            userdetails_id = generate('benchmark', Profile(accounts=8, categories=12, budgets=10, bills=10, years=args.years, per_day=args.per_day), seed=1)
+            userdetails = UserDetails.query.filter_by(id=userdetails_id).first()
+            amounts = [amount for amount, in db.session.query(Transaction.amount).filter_by(user_id=userdetails_id)]
+            raw = [amount for amount, in db.session.query(cents(Transaction.amount)).filter_by(user_id=userdetails_id)]
+            print(f'{len(amounts)} transactions\n')
+
+            cases = [
+                ('Load every amount', lambda: db.session.query(Transaction.amount).filter_by(user_id=userdetails_id).all()),
+                ('Load every amount as cents', lambda: db.session.query(cents(Transaction.amount)).filter_by(user_id=userdetails_id).all()),
+                ('Sum loaded amounts in Python', lambda: sum(amounts)),
+                ('Sum loaded cents in Python', lambda: sum(raw)),
+                ('Sum in SQL', lambda: db.session.query(func.sum(Transaction.amount)).filter_by(user_id=userdetails_id).scalar()),
+                ('balances.get_history_balances', balances.get_history_balances),
+                ('queries.get_income_and_spending', lambda: queries.get_income_and_spending(userdetails_id)),
+                ('aggregation.summarise', lambda: aggregation.summarise(userdetails))
+            ]
+            print('| Case | Median |')
+            print('|---|---:|')
+            for name, f in cases:
+                print(f'| {name} | {measure(f, args.repeat):.2f} ms |')
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Password Hashing Benchmark
+
+Times scrypt password hashing at increasing costs on this host and recommends
+the largest cost (DONTBUDGE_SCRYPT_N) whose hash time stays within a target
+latency.
+
+Usage:
+    python benchmarks/passwords.py --target 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dontbudge.auth import passwords
+
+def time_hash(n, repeat):
+    """Median time in seconds of one hash at cost n"""
+    passwords.configure(n=n)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        passwords.hash_password('correct horse battery staple')
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', type=float, default=100, help='Target hash time in milliseconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('| N | Memory | Hash time |')
+    print('|---:|---:|---:|')
+    chosen = None
+    for power in range(10, 21):
+        n = 2 ** power
+        elapsed = time_hash(n, args.repeat)
+        print(f'| 2^{power} | {128 * passwords.R * n // 1024 // 1024} MB | {elapsed * 1000:.1f} ms |')
+        if elapsed * 1000 <= args.target:
+            chosen = n
+        else:
+            break
+
+    if chosen is None:
+        print(f'\nNo cost hashes within {args.target} ms, try a higher target.')
+        return
+
+    print(f'\nRecommended: DONTBUDGE_SCRYPT_N={chosen}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Reports Benchmark
+
+Compares building each report inline, as a request that streamed it would,
+with queueing it as a background job (see dontbudge.jobs): how long the
+request to queue it takes, and how long until the polled job is done. Every
+snapshot is cleared first each time, so reports over periods start cold.
+
+Usage:
+    python benchmarks/reports.py --years 10 --per-day 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+
+import dontbudge
+from dontbudge.database import db
+from dontbudge.auth.models import User
+from dontbudge.auth.jwt import create_token
+from dontbudge.api.models import UserDetails
+from dontbudge.api import snapshots
+from dontbudge.dashboard import reports, exporter
+from synthetic import Profile, generate
+
+POLL_INTERVAL = 0.05
+
+def clear_snapshots(userdetails_id):
+    snapshots.clear(UserDetails.query.filter_by(id=userdetails_id).first())
+    db.session.commit()
+
+def build_inline(userdetails_id, report):
+    """Build and encode a report in this process, returning the seconds taken and its size"""
+    clear_snapshots(userdetails_id)
+    start = time.perf_counter()
+    userdetails = UserDetails.query.filter_by(id=userdetails_id).first()
+    size = sum(len(chunk.encode()) for chunk in exporter.encode(reports.get_report(userdetails, report), 'csv'))
+    return time.perf_counter() - start, size
+
+def build_job(client, userdetails_id, report):
+    """Queue a report and poll it until done, returning the seconds the request to queue it and the whole job took"""
+    with client.application.app_context():
+        clear_snapshots(userdetails_id)
+    start = time.perf_counter()
+    job = client.post('/api/v1/reports', json={'report': report, 'format': 'csv'}).get_json()
+    queued = time.perf_counter() - start
+    while job['status'] in ('queued', 'running'):
+        time.sleep(POLL_INTERVAL)
+        job = client.get(f'/api/v1/reports/{job["id"]}').get_json()
+    if job['status'] != 'done':
+        raise RuntimeError(f'Report {report} {job["status"]}: {job["error"]}')
+    return queued, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--per-day', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        dontbudge.DATABASE_URL = f'sqlite:///{os.path.join(directory, "benchmark.sqlite3")}'
+        app = dontbudge.create_app()
+        with app.app_context():
+            userdetails_id = generate('benchmark', Profile(accounts=8, categories=12, budgets=10, bills=10, years=args.years, per_day=args.per_day), seed=1)
+            token = create_token(User.query.filter_by(username='benchmark').first(), True)
+        client = app.test_client()
+        client.set_cookie('localhost', 'token', token)
+
+        # Start the worker pool, so its start up is not counted against the first report
+        build_job(client, userdetails_id, 'years')
+
+        print('| Report | Size | Inline | Request to queue | Job done |')
+        print('|---|---:|---:|---:|---:|')
+        for report in reports.REPORTS:
+            with app.app_context():
+                inline, size = build_inline(userdetails_id, report)
+                db.session.remove()
+            queued, done = build_job(client, userdetails_id, report)
+            print(f'| {report} | {size / 1024:.0f} KB | {inline * 1000:.0f} ms | {queued * 1000:.1f} ms | {done * 1000:.0f} ms |')
+
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+if __name__ == '__main__':
+    main()
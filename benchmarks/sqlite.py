@@ -0,0 +1,133 @@
+"""SQLite Profile Benchmark
+
+Measures read and write throughput against a SQLite database with several
+worker processes at once, as under gunicorn, for each SQLite profile. Every
+worker is a separate app with its own connections, requesting transaction
+pages from the JSON API and, for a share of its requests, creating a
+transaction, for a fixed time.
+
+Usage:
+    python benchmarks/sqlite.py --workers 4 --seconds 10 --writes 0.2
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+
+import dontbudge
+from dontbudge.database import db, SQLITE_PROFILES
+from dontbudge.auth.models import User
+from dontbudge.auth.jwt import create_token
+from dontbudge.api.models import UserDetails, Account, Transaction
+
+def create_app(path, profile):
+    dontbudge.DATABASE_URL = f'sqlite:///{path}'
+    dontbudge.SQLITE_PROFILE = profile
+    return dontbudge.create_app()
+
+def seed(path, profile, rows):
+    """Create a user with two accounts and a history of transactions, returning an API token"""
+    app = create_app(path, profile)
+    with app.app_context():
+        user = User('benchmark', 'unused')
+        db.session.add(user)
+        db.session.flush()
+        start = datetime(2020, 1, 1)
+        userdetails = UserDetails('benchmark', user.id, '1M', start, start + timedelta(days=31))
+        db.session.add(userdetails)
+        db.session.flush()
+        accounts = [Account(name, userdetails.id) for name in ('Everyday', 'Savings')]
+        db.session.add_all(accounts)
+        db.session.flush()
+        db.session.execute(Transaction.__table__.insert(), [{
+            'user_id': userdetails.id,
+            'account_id': accounts[i % 2].id,
+            'description': f'Transaction {i}',
+            'date': start + timedelta(hours=i),
+            'amount': Decimal(random.randint(-5000, 5000)) / 100
+        } for i in range(rows)])
+        db.session.commit()
+        return create_token(user, True), [account.id for account in accounts]
+
+def work(path, profile, token, accounts, seconds, writes, results):
+    """Make requests until the time is up, recording their latencies"""
+    app = create_app(path, profile)
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    reads, written, errors = [], [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        account = random.choice(accounts)
+        start = time.perf_counter()
+        if random.random() < writes:
+            response = client.post('/api/v1/transactions', headers=headers, json={
+                'account_id': account,
+                'description': 'Benchmark',
+                'amount': '-1.50'
+            })
+            latencies = written
+        else:
+            response = client.get(f'/api/v1/transactions?account={account}&limit=50', headers=headers)
+            latencies = reads
+        if response.status_code in (200, 201):
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    results.put((reads, written, errors))
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    return sorted(values)[min(int(len(values) * fraction), len(values) - 1)]
+
+def run(profile, args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.sqlite3')
+        token, accounts = seed(path, profile, args.rows)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=work, args=(path, profile, token, accounts, args.seconds, args.writes, results))
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+    reads = [latency for outcome in outcomes for latency in outcome[0]]
+    written = [latency for outcome in outcomes for latency in outcome[1]]
+    errors = sum(outcome[2] for outcome in outcomes)
+    return (
+        f'| {profile} | {len(reads) / args.seconds:.0f} | {len(written) / args.seconds:.0f} '
+        f'| {statistics.median(reads) * 1000 if reads else 0:.1f} ms | {percentile(reads, 0.99) * 1000:.1f} ms '
+        f'| {statistics.median(written) * 1000 if written else 0:.1f} ms | {percentile(written, 0.99) * 1000:.1f} ms | {errors} |'
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Number of worker processes')
+    parser.add_argument('--seconds', type=float, default=10, help='How long each profile is measured for')
+    parser.add_argument('--writes', type=float, default=0.2, help='Share of requests that create a transaction')
+    parser.add_argument('--rows', type=int, default=20000, help='Transactions in the database beforehand')
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    print(f'{args.workers} workers, {args.writes:.0%} writes, {args.rows} transactions\n')
+    print('| Profile | Reads/s | Writes/s | Read p50 | Read p99 | Write p50 | Write p99 | Failed |')
+    print('|---|---:|---:|---:|---:|---:|---:|---:|')
+    for profile in args.profiles:
+        print(run(profile, args), flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Benchmark Suite
+
+Times the dashboard routes and the functions behind them against synthetic
+users of increasing size, and saves the results as JSON so runs from
+different commits can be compared.
+
+Each scale gets a throwaway SQLite database holding one generated user (see
+benchmarks/synthetic.py). Routes are requested through the test client with
+the derived data cache cleared before every request, so each timing includes
+building the page from the database, and once more with the cache warm.
+Every case also records how many SQL queries it issued, and the run fails if
+a route issues more than its bound in QUERY_BOUNDS at any scale, which catches
+pages whose queries grow with the data (N+1 lazy loads). The same bounds are
+checked by tests/test_query_counts.py on every test run.
+
+Usage:
+    python benchmarks/suite.py --scales small medium large --repeat 5
+    python benchmarks/suite.py --compare benchmarks/results/<commit>.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+
+from sqlalchemy import event
+import dontbudge
+from dontbudge.database import db
+from dontbudge.cache import cache
+from dontbudge.auth.models import User
+from dontbudge.auth.jwt import create_token
+from dontbudge.api.models import UserDetails, Account, Transaction
+from dontbudge.api import snapshots
+from dontbudge.dashboard import utility, aggregation, schedule, forecast
+from synthetic import Profile, generate
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results')
+
+SCALES = {
+    'small': Profile(accounts=2, categories=5, budgets=3, bills=3, years=1, per_day=2),
+    'medium': Profile(accounts=4, categories=8, budgets=5, bills=6, years=3, per_day=5),
+    'large': Profile(accounts=8, categories=12, budgets=10, bills=10, years=10, per_day=10)
+}
+
+# Most queries each route may issue, cold or cached, whatever the scale
+QUERY_BOUNDS = {
+    'index': 6,
+    'view_period (current)': 8,
+    'view_period (oldest)': 12,
+    'view_period (rows)': 3,
+    'view_account': 4,
+    'view_budgets': 5,
+    'savings': 4,
+    'edit_transaction': 6
+}
+
+class QueryCounter:
+    """Counts the SQL statements an engine executes"""
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+def measure(f, repeat, counter, before=None):
+    """Time a callable, returning its median and worst times and its queries per call"""
+    times = []
+    queries = 0
+    for _ in range(repeat):
+        if before:
+            before()
+        start_count = counter.count
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+        queries = counter.count - start_count
+    return {
+        'median_ms': round(statistics.median(times) * 1000, 2),
+        'max_ms': round(max(times) * 1000, 2),
+        'queries': queries
+    }
+
+def clear_cache():
+    cache.configure()
+
+def get_route_cases(client, userdetails_id):
+    """Each case is a name and the URL of a dashboard route to request"""
+    with client.application.app_context():
+        userdetails = UserDetails.query.filter_by(id=userdetails_id).first()
+        periods = utility.get_periods(userdetails)
+        account = Account.query.filter_by(user_id=userdetails_id).order_by(Account.id).first()
+        transaction = Transaction.query.filter_by(user_id=userdetails_id).order_by(Transaction.id.desc()).first()
+        page = utility.get_transaction_page(Transaction.query.filter(Transaction.user_id == userdetails_id, Transaction.date >= periods[-1].start))
+    return [
+        ('index', '/'),
+        ('view_period (current)', f'/period/view/{len(periods) - 1}'),
+        ('view_period (oldest)', '/period/view/0'),
+        ('view_period (rows)', f'/period/view/{len(periods) - 1}?rows=1&before={page.cursor or ""}'),
+        ('view_account', f'/account/{account.id}'),
+        ('view_budgets', '/budget/view'),
+        ('savings', '/savings'),
+        ('edit_transaction', f'/transaction/{transaction.id}/edit')
+    ]
+
+def get_function_cases(userdetails):
+    """Each case is a name and a callable running a dashboard function for the user"""
+    periods = utility.get_periods(userdetails)
+    account = Account.query.filter_by(user_id=userdetails.id).order_by(Account.id).first()
+    return [
+        ('utility.get_periods', lambda: utility.get_periods(userdetails)),
+        ('utility.get_transaction_page', lambda: utility.get_transaction_page(Transaction.query.filter_by(account_id=account.id))),
+        ('utility.get_budgets', lambda: utility.get_budgets(userdetails)),
+        ('aggregation.summarise', lambda: aggregation.summarise(userdetails)),
+        ('snapshots.get_totals (current)', lambda: snapshots.get_totals(userdetails, periods[-1])),
+        ('snapshots.get_totals (oldest)', lambda: snapshots.get_totals(userdetails, periods[0])),
+        ('schedule.get_due', lambda: schedule.get_due(userdetails)),
+        ('forecast.project', lambda: forecast.project(userdetails))
+    ]
+
+def run_scale(name, profile, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        dontbudge.DATABASE_URL = f'sqlite:///{os.path.join(directory, "benchmark.sqlite3")}'
+        app = dontbudge.create_app()
+        with app.app_context():
+            userdetails_id = generate('benchmark', profile, seed=1)
+            transactions = Transaction.query.filter_by(user_id=userdetails_id).count()
+            token = create_token(User.query.filter_by(username='benchmark').first(), True)
+            counter = QueryCounter(db.engine)
+
+        client = app.test_client()
+        client.set_cookie('localhost', 'token', token)
+        cases = {}
+        for case, url in get_route_cases(client, userdetails_id):
+            def request(url=url):
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+            cases[case] = measure(request, repeat, counter, before=clear_cache)
+            cases[f'{case} (cached)'] = measure(request, repeat, counter)
+
+        with app.app_context():
+            userdetails = UserDetails.query.filter_by(id=userdetails_id).first()
+            for case, f in get_function_cases(userdetails):
+                cases[case] = measure(f, repeat, counter)
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+    return {'profile': profile._asdict(), 'transactions': transactions, 'cases': cases}
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def print_results(results, baseline=None):
+    for scale, result in results['scales'].items():
+        print(f'\n### {scale} ({result["transactions"]} transactions)\n')
+        if baseline and scale in baseline['scales']:
+            print(f'| Case | {baseline["commit"]} | {results["commit"]} | Change | Queries |')
+            print('|---|---:|---:|---:|---:|')
+        else:
+            print('| Case | Median | Max | Queries |')
+            print('|---|---:|---:|---:|')
+        for case, timing in result['cases'].items():
+            old = baseline['scales'].get(scale, {}).get('cases', {}).get(case) if baseline else None
+            if baseline and scale in baseline['scales']:
+                if old:
+                    change = f'{(timing["median_ms"] / old["median_ms"] - 1) * 100:+.0f}%' if old['median_ms'] else 'n/a'
+                    print(f'| {case} | {old["median_ms"]:.2f} ms | {timing["median_ms"]:.2f} ms | {change} | {old["queries"]} -> {timing["queries"]} |')
+                else:
+                    print(f'| {case} | - | {timing["median_ms"]:.2f} ms | new | {timing["queries"]} |')
+            else:
+                print(f'| {case} | {timing["median_ms"]:.2f} ms | {timing["max_ms"]:.2f} ms | {timing["queries"]} |')
+
+def check_bounds(results):
+    """List the route cases that issued more queries than their bound"""
+    failures = []
+    for scale, result in results['scales'].items():
+        for case, timing in result['cases'].items():
+            bound = QUERY_BOUNDS.get(case.replace(' (cached)', ''))
+            if bound is not None and timing['queries'] > bound:
+                failures.append(f'{scale} {case}: {timing["queries"]} queries, bound is {bound}')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', default=list(SCALES), choices=list(SCALES))
+    parser.add_argument('--repeat', type=int, default=5, help='Times each case is run, the median is reported')
+    parser.add_argument('--output', help='Where to save the results, defaults to benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', help='Results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = {
+        'commit': get_commit(),
+        'date': date.today().isoformat(),
+        'python': platform.python_version(),
+        'scales': {}
+    }
+    for scale in args.scales:
+        print(f'Running {scale}...', file=sys.stderr)
+        results['scales'][scale] = run_scale(scale, SCALES[scale], args.repeat)
+
+    output = args.output or os.path.join(RESULTS, f'{results["commit"]}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Saved results to {output}', file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    failures = check_bounds(results)
+    if failures:
+        print('\nQuery bounds exceeded:', *failures, sep='\n', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Synthetic Users
+
+Generates users with realistic looking data for benchmarking and load testing:
+accounts, categories, budgets and bills, and years of daily transactions up
+to today, with a monthly salary, bill payments and everyday spending spread
+over the categories and budgets. The same seed always generates the same data.
+
+Used by benchmarks/suite.py, or on its own to fill a database for load tests.
+Every generated user's password is 'password'.
+
+Usage:
+    python benchmarks/synthetic.py --database sqlite:////tmp/load.sqlite3 --users 20 --years 3
+"""
+import argparse
+import os
+import random
+import sys
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+
+from dontbudge.database import db
+from dontbudge.auth.models import User
+from dontbudge.auth.passwords import hash_password
+from dontbudge.api.models import UserDetails, Account, Category, Budget, Bill, Transaction
+from dontbudge.api import balances
+
+PASSWORD = 'password'
+CHUNK_SIZE = 10000
+
+ACCOUNT_NAMES = ['Everyday', 'Savings', 'Credit Card', 'Joint', 'Holiday', 'Emergency', 'Investments', 'Business']
+CATEGORY_NAMES = ['Groceries', 'Transport', 'Eating Out', 'Utilities', 'Entertainment', 'Health', 'Clothing', 'Gifts', 'Home', 'Travel', 'Education', 'Pets']
+BILL_NAMES = ['Rent', 'Phone', 'Internet', 'Electricity', 'Insurance', 'Gym', 'Streaming', 'Water', 'Car Loan', 'Council Rates']
+OCCURENCES = ['1W', '2W', '1M', '1M', '1M', '1Q', '1Y']
+
+Profile = namedtuple('Profile', [
+    'accounts',
+    'categories',
+    'budgets',
+    'bills',
+    'years',
+    'per_day'
+], defaults=(3, 8, 5, 6, 2, 4))
+
+def get_name(names, i):
+    return names[i % len(names)] if i < len(names) else f'{names[i % len(names)]} {i // len(names) + 1}'
+
+def generate(username, profile=Profile(), seed=0, today=None):
+    """Create a user with synthetic data and commit it
+
+    Args:
+        username -> String: Username of the new user
+        profile -> benchmarks.synthetic.Profile: How much of everything to generate
+        seed -> Integer: Random seed, the same seed generates the same data
+        today -> date: Last day of the history, defaults to today
+
+    Returns:
+        ID of the user's UserDetails
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    period_start = datetime(today.year, today.month, 1)
+    first = period_start - relativedelta(years=profile.years)
+
+    user = User(username, hash_password(PASSWORD))
+    db.session.add(user)
+    db.session.flush()
+    userdetails = UserDetails(username[:15], user.id, '1M', period_start, period_start + relativedelta(months=1))
+    db.session.add(userdetails)
+    db.session.flush()
+
+    accounts = [Account(get_name(ACCOUNT_NAMES, i), userdetails.id) for i in range(profile.accounts)]
+    categories = [Category(get_name(CATEGORY_NAMES, i), userdetails.id) for i in range(profile.categories)]
+    budgets = [Budget(category.name, userdetails.id, Decimal(rng.randrange(100, 800))) for category in categories[:profile.budgets]]
+    bills = []
+    for i in range(profile.bills):
+        # Bills have been paid up to this period, so only this period's are due
+        occurence = rng.choice(OCCURENCES)
+        start = period_start + timedelta(days=rng.randrange(28))
+        bills.append(Bill(start, get_name(BILL_NAMES, i), occurence, userdetails.id, Decimal(rng.randrange(1000, 150000)) / 100))
+    db.session.add_all(accounts + categories + budgets + bills)
+    db.session.flush()
+
+    def row(account, day, description, amount, category=None, budget=None, bill=None):
+        return {
+            'user_id': userdetails.id,
+            'account_id': account.id,
+            'category_id': category.id if category else None,
+            'budget_id': budget.id if budget else None,
+            'bill_id': bill.id if bill else None,
+            'description': description,
+            'date': day,
+            'amount': amount
+        }
+
+    chunk = [row(account, first, f'{account.name} Initial Balance', Decimal(rng.randrange(0, 500000)) / 100) for account in accounts]
+    day = first
+    end = datetime(today.year, today.month, today.day)
+    while day <= end:
+        if day.day == 1:
+            chunk.append(row(accounts[0], day, 'Salary', Decimal(rng.randrange(300000, 600000)) / 100))
+            for bill in bills:
+                if bill.occurence in ('1M', '1Q', '1Y') and day < period_start:
+                    chunk.append(row(accounts[0], day, bill.name, -bill.amount, bill=bill))
+        for _ in range(rng.randrange(profile.per_day * 2 + 1)):
+            category = rng.choice(categories) if categories and rng.random() < 0.8 else None
+            budget = budgets[categories.index(category)] if category and categories.index(category) < len(budgets) and rng.random() < 0.7 else None
+            moment = day + timedelta(minutes=rng.randrange(24 * 60))
+            chunk.append(row(rng.choice(accounts), moment, f'{category.name if category else "Sundry"} purchase', Decimal(-rng.randrange(100, 5000)) / 100, category, budget))
+        if len(chunk) >= CHUNK_SIZE:
+            db.session.execute(Transaction.__table__.insert(), chunk)
+            chunk = []
+        day += timedelta(days=1)
+    if chunk:
+        db.session.execute(Transaction.__table__.insert(), chunk)
+
+    # Materialise the balances of the new accounts in one go
+    totals = balances.get_history_balances()
+    for account in accounts:
+        account.balance = totals.get(account.id, 0)
+    db.session.commit()
+    return userdetails.id
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLAlchemy URL of the database to fill')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--prefix', default='user', help='Users are named <prefix>1, <prefix>2, ...')
+    parser.add_argument('--accounts', type=int, default=Profile().accounts)
+    parser.add_argument('--categories', type=int, default=Profile().categories)
+    parser.add_argument('--budgets', type=int, default=Profile().budgets)
+    parser.add_argument('--bills', type=int, default=Profile().bills)
+    parser.add_argument('--years', type=int, default=Profile().years)
+    parser.add_argument('--per-day', type=int, default=Profile().per_day, help='Average spending transactions per day')
+    args = parser.parse_args()
+
+    import dontbudge
+    dontbudge.DATABASE_URL = args.database
+    app = dontbudge.create_app()
+    profile = Profile(args.accounts, args.categories, args.budgets, args.bills, args.years, args.per_day)
+    with app.app_context():
+        for i in range(1, args.users + 1):
+            generate(f'{args.prefix}{i}', profile, seed=i)
+            print(f'Created {args.prefix}{i}')
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,66 @@ from os import environ
 from dontbudge.api.routes import api
 from dontbudge.auth.routes import auth
 from dontbudge.dashboard import dashboard
-from dontbudge import database
+from dontbudge.auth import passwords
+from dontbudge import database, migrations, commands, cache, etags, instrumentation, scheduler, jobs
 
 SECRET = environ.get('FLASK_SECRET_KEY')
 DEBUG = environ.get('DONTBUDGE_DEBUG')
+DATABASE_URL = environ.get('DONTBUDGE_DATABASE_URL', 'sqlite:///../db/dontbudge.sqlite3')
+DB_POOL_SIZE = environ.get('DONTBUDGE_DB_POOL_SIZE')
+DB_MAX_OVERFLOW = environ.get('DONTBUDGE_DB_MAX_OVERFLOW')
+DB_POOL_RECYCLE = environ.get('DONTBUDGE_DB_POOL_RECYCLE')
+SQLITE_PROFILE = environ.get('DONTBUDGE_SQLITE_PROFILE')
+CACHE = environ.get('DONTBUDGE_CACHE')
+SCRYPT_N = environ.get('DONTBUDGE_SCRYPT_N')
+INSTRUMENTATION = environ.get('DONTBUDGE_INSTRUMENTATION')
+SLOW_REQUEST_MS = environ.get('DONTBUDGE_SLOW_REQUEST_MS')
+PROFILE_RATE = environ.get('DONTBUDGE_PROFILE_RATE')
+PROFILE_DIR = environ.get('DONTBUDGE_PROFILE_DIR')
+SCHEDULER = environ.get('DONTBUDGE_SCHEDULER')
+SCHEDULER_INTERVAL = environ.get('DONTBUDGE_SCHEDULER_INTERVAL')
+REPORT_WORKERS = environ.get('DONTBUDGE_REPORT_WORKERS')
+REPORT_USER_LIMIT = environ.get('DONTBUDGE_REPORT_USER_LIMIT')
 
 def create_app():
     app = Flask(__name__)
     app.config['DEBUG'] = True if DEBUG else False
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///../db/dontbudge.sqlite3'
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    if DB_POOL_SIZE:
+        app.config['DB_POOL_SIZE'] = int(DB_POOL_SIZE)
+    if DB_MAX_OVERFLOW:
+        app.config['DB_MAX_OVERFLOW'] = int(DB_MAX_OVERFLOW)
+    if DB_POOL_RECYCLE:
+        app.config['DB_POOL_RECYCLE'] = int(DB_POOL_RECYCLE)
+    if SQLITE_PROFILE:
+        app.config['SQLITE_PROFILE'] = SQLITE_PROFILE
     app.config['SECRET_KEY'] = SECRET
+    app.config['CACHE_PATH'] = CACHE
+    if SCRYPT_N:
+        app.config['SCRYPT_N'] = int(SCRYPT_N)
+    app.config['INSTRUMENTATION'] = True if INSTRUMENTATION else False
+    if SLOW_REQUEST_MS:
+        app.config['SLOW_REQUEST_MS'] = float(SLOW_REQUEST_MS)
+    if PROFILE_RATE:
+        app.config['PROFILE_RATE'] = float(PROFILE_RATE)
+    app.config['PROFILE_DIR'] = PROFILE_DIR
+    app.config['SCHEDULER'] = True if SCHEDULER else False
+    if SCHEDULER_INTERVAL:
+        app.config['SCHEDULER_INTERVAL'] = int(SCHEDULER_INTERVAL)
+    if REPORT_WORKERS:
+        app.config['REPORT_WORKERS'] = int(REPORT_WORKERS)
+    if REPORT_USER_LIMIT:
+        app.config['REPORT_USER_LIMIT'] = int(REPORT_USER_LIMIT)
     app.register_blueprint(api)
     app.register_blueprint(auth)
     app.register_blueprint(dashboard)
     database.init_app(app)
+    migrations.init_app(app)
+    commands.init_app(app)
+    cache.init_app(app)
+    passwords.init_app(app)
+    etags.init_app(app)
+    instrumentation.init_app(app)
+    scheduler.init_app(app)
+    jobs.init_app(app)
     return app
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""Balances
+
+Maintains the materialised Account.balance column. Every write path that
+creates, edits or deletes a Transaction applies the change to its account's
+balance in the same database transaction, so reading a balance is a single
+column lookup no matter how long the account's history is.
+
+Balances are updated in SQL (balance = balance + amount) so concurrent workers
+cannot lose each other's updates. Accounts created before balances were
+maintained have a NULL balance; those are left alone by updates, rebuilt from
+history once by the account_balances migration, and otherwise rebuilt in the
+session when they are read. Nothing here commits, so balances change in the
+same database transaction as the write that caused them.
+"""
+from sqlalchemy import func
+from dontbudge.database import db
+from dontbudge.api.models import Account, Transaction, UserDetails
+from dontbudge.api import versions
+
+def adjust(account_id, amount):
+    """Add an amount to the balance of an account
+
+    Args:
+        account_id -> Integer: ID of the Account to adjust
+        amount -> Decimal: Amount to add, negative to take money off
+    """
+    Account.query.filter(
+        Account.id == account_id,
+        Account.balance.isnot(None)
+    ).update(
+        {Account.balance: Account.balance + amount},
+        synchronize_session=False
+    )
+
+def apply(transaction):
+    """Apply a new or edited Transaction to its account's balance"""
+    adjust(transaction.account_id, transaction.amount)
+
+def revert(transaction):
+    """Take a Transaction that is being edited or deleted off its account's balance"""
+    adjust(transaction.account_id, transaction.amount * -1)
+
+def get_history_balances():
+    """Get the balance of every account as recalculated from its transactions
+
+    Returns:
+        Dictionary of account ID to the sum of its transactions
+    """
+    query = db.session.query(
+        Transaction.account_id, func.sum(Transaction.amount)
+    ).group_by(
+        Transaction.account_id
+    )
+    return {account_id: total for account_id, total in query}
+
+def get_balance(account):
+    """Get the balance of an account
+
+    Reads the materialised balance, rebuilding it from the account's history
+    first if it has never been set. The rebuilt balance is only flushed, it is
+    saved if the caller commits.
+
+    Args:
+        account -> dontbudge.api.models.Account: Account to get the balance of
+
+    Returns:
+        The balance of the account
+    """
+    if account.balance is None:
+        balance = db.session.query(
+            func.sum(Transaction.amount)
+        ).filter(
+            Transaction.account_id == account.id
+        ).scalar()
+        account.balance = balance if balance is not None else 0
+        db.session.flush()
+    return account.balance
+
+def verify(fix=False):
+    """Compare every materialised balance against its account's history
+
+    Fixing a balance bumps its user's data version, so data cached from the
+    drifted balance is not served again.
+
+    Args:
+        fix -> Boolean: Whether to overwrite balances that have drifted
+
+    Returns:
+        List of (account, stored balance, recalculated balance) for each account that differs
+    """
+    history = get_history_balances()
+    drifted = []
+    for account in Account.query.all():
+        expected = history.get(account.id, 0)
+        if account.balance is None or account.balance != expected:
+            drifted.append((account, account.balance, expected))
+            if fix:
+                account.balance = expected
+
+    if fix and drifted:
+        user_ids = {account.user_id for account, stored, expected in drifted}
+        for userdetails in UserDetails.query.filter(UserDetails.id.in_(user_ids)):
+            versions.bump(userdetails)
+        db.session.commit()
+    return drifted
@@ -0,0 +1,320 @@
+"""Importer
+
+Bulk imports transactions from bank export files into an account. CSV, OFX
+(and QFX) and QIF files are supported.
+
+Files are parsed as a stream into rows, which are inserted a chunk at a time
+with a single executemany insert and a commit per chunk. Memory use is bounded
+by the chunk size rather than the size of the file. Each chunk also updates
+the account balance, period snapshots and the user's data version, so a
+failed import leaves the account consistent with the chunks that made it in.
+
+Every imported transaction stores an import_hash identifying its source row:
+the OFX FITID if there is one, otherwise its date, amount and description
+along with how many identical rows came before it on the same day. Importing
+an overlapping or repeated export therefore only adds the rows that are new.
+"""
+import csv
+import hashlib
+import re
+from collections import namedtuple
+from functools import lru_cache
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from dontbudge.database import db
+from dontbudge.money import CENT, MAX_AMOUNT
+from dontbudge.api.models import Transaction
+from dontbudge.api import balances, snapshots, versions
+
+FORMATS = ('csv', 'ofx', 'qif')
+CHUNK_SIZE = 5000
+LOOKUP_SIZE = 500
+READ_SIZE = 64 * 1024
+DESCRIPTION_LENGTH = 100
+
+Row = namedtuple('Row', [
+    'date',
+    'description',
+    'amount',
+    'category',
+    'reference'
+])
+
+Columns = namedtuple('Columns', [
+    'date',
+    'description',
+    'amount',
+    'debit',
+    'credit',
+    'category'
+], defaults=('date', 'description', 'amount', None, None, None))
+
+ImportResult = namedtuple('ImportResult', [
+    'read',
+    'imported',
+    'duplicates',
+    'skipped'
+])
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+def detect_format(filename):
+    """Guess the format of an export file from its extension, or None"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'qfx':
+        return 'ofx'
+    return extension if extension in FORMATS else None
+
+def parse_amount(text):
+    """Parse an amount like '1,234.50', '$-12.00' or '(12.00)' into a Decimal, or None
+
+    Amounts are kept to the cent, as they are stored, so '12.5' and '12.50'
+    are the same amount. Amounts smaller than a cent can not be stored and are
+    not accepted.
+    """
+    text = text.strip() if text else ''
+    negative = text.startswith('(') and text.endswith(')')
+    text = re.sub(r'[^0-9.\-+]', '', text)
+    if not text:
+        return None
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    if abs(amount) >= MAX_AMOUNT or amount != amount.quantize(CENT):
+        return None
+    amount = amount.quantize(CENT)
+    return amount * -1 if negative else amount
+
+@lru_cache(maxsize=4096)
+def parse_date(text, date_format):
+    """Parse a date with the given format, or None
+
+    Exports repeat the same few dates many times, so parsed dates are cached.
+    """
+    try:
+        return datetime.strptime(text.strip(), date_format)
+    except (ValueError, AttributeError):
+        return None
+
+def parse_csv(stream, columns=Columns(), date_format='%Y-%m-%d'):
+    """Parse a CSV export with a header row
+
+    Args:
+        stream -> Text file object: Export to parse
+        columns -> dontbudge.api.importer.Columns: Header names of each field, matched
+            case-insensitively. Either amount, or debit and credit columns are used.
+        date_format -> String: strptime format of the dates
+
+    Returns:
+        Generator of dontbudge.api.importer.Row's, with None for rows that could not be parsed
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    positions = {name.strip().lower(): i for i, name in enumerate(header)}
+
+    def position(name):
+        return positions.get(name.lower()) if name else None
+
+    date, description, amount = position(columns.date), position(columns.description), position(columns.amount)
+    debit, credit, category = position(columns.debit), position(columns.credit), position(columns.category)
+
+    def field(values, i):
+        return values[i] if i is not None and i < len(values) else ''
+
+    for values in reader:
+        if not values:
+            continue
+        if amount is not None:
+            value = parse_amount(field(values, amount))
+        else:
+            spent, received = parse_amount(field(values, debit)), parse_amount(field(values, credit))
+            value = None if spent is None and received is None else (received or 0) - abs(spent or 0)
+        day = parse_date(field(values, date), date_format)
+        if day is None or value is None:
+            yield None
+            continue
+        yield Row(day, field(values, description).strip(), value, field(values, category).strip() or None, None)
+
+def parse_ofx(stream):
+    """Parse an OFX or QFX export, in either its SGML or XML form
+
+    The file is read in blocks and scanned for <STMTTRN> records, so it is
+    never held in memory whole.
+
+    Returns:
+        Generator of dontbudge.api.importer.Row's, with None for records that could not be parsed
+    """
+    buffer = ''
+    record = None
+    while True:
+        data = stream.read(READ_SIZE)
+        buffer += data
+        # Anything after the last '<' may be cut short, so it waits for the next block
+        cut = buffer.rfind('<') if data else len(buffer)
+        for closing, tag, value in OFX_TAG.findall(buffer[:max(cut, 0)]):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and record is not None:
+                    day = parse_date(record.get('DTPOSTED', '')[:8], '%Y%m%d')
+                    amount = parse_amount(record.get('TRNAMT'))
+                    if day is None or amount is None:
+                        yield None
+                    else:
+                        description = record.get('NAME') or record.get('MEMO') or ''
+                        yield Row(day, description, amount, None, record.get('FITID'))
+                record = None if closing else {}
+            elif record is not None and not closing and value.strip():
+                record[tag] = value.strip()
+        buffer = buffer[max(cut, 0):]
+        if not data:
+            break
+
+def parse_qif(stream, date_format='%m/%d/%Y'):
+    """Parse a QIF export
+
+    Dates written like 1/ 5'22 are normalised to 1/05/22, and two digit years
+    are accepted if the format has a four digit one.
+
+    Returns:
+        Generator of dontbudge.api.importer.Row's, with None for records that could not be parsed
+    """
+    short_format = date_format.replace('%Y', '%y')
+    record = {}
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        code, value = line[0], line[1:].strip()
+        if code != '^':
+            record.setdefault(code, value)
+            continue
+
+        text = record.get('D', '').replace("'", '/').replace(' ', '0')
+        day = parse_date(text, date_format) or parse_date(text, short_format)
+        amount = parse_amount(record.get('T') or record.get('U'))
+        if day is None or amount is None:
+            yield None
+        else:
+            yield Row(day, record.get('P') or record.get('M') or '', amount, record.get('L') or None, None)
+        record = {}
+
+def parse(stream, format, columns=None, date_format=None):
+    """Parse an export file of any supported format into rows"""
+    if format == 'csv':
+        return parse_csv(stream, columns or Columns(), date_format or '%Y-%m-%d')
+    if format == 'ofx':
+        return parse_ofx(stream)
+    if format == 'qif':
+        return parse_qif(stream, date_format or '%m/%d/%Y')
+    raise ValueError(f'Unsupported import format {format}')
+
+def get_hashes(account_id, rows):
+    """Get the import hash of each parsed row
+
+    Identical rows are numbered by how many came before them on the same day.
+    Only the current day's counts are kept, which assumes the export is
+    ordered by date, as bank exports are.
+    """
+    day = None
+    counts = {}
+    for row in rows:
+        if row.reference:
+            key = f'{account_id}|ref|{row.reference}'
+        else:
+            if row.date != day:
+                day = row.date
+                counts = {}
+            base = f'{account_id}|{row.date.isoformat()}|{row.amount}|{row.description}'
+            counts[base] = counts.get(base, 0) + 1
+            key = f'{base}|{counts[base]}'
+        yield row, hashlib.sha1(key.encode()).hexdigest()
+
+def get_existing(hashes):
+    """Get which of the given import hashes are already in the database"""
+    existing = set()
+    for i in range(0, len(hashes), LOOKUP_SIZE):
+        existing.update(
+            import_hash for import_hash, in db.session.query(Transaction.import_hash).filter(
+                Transaction.import_hash.in_(hashes[i:i + LOOKUP_SIZE])
+            )
+        )
+    return existing
+
+def insert(userdetails, account_id, chunk):
+    """Insert a chunk of new transactions and commit them
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: Owner of the account
+        account_id -> Integer: ID of the Account to import into
+        chunk -> List of dictionaries: Transaction table rows, with import_hash set
+
+    Returns:
+        Number of transactions inserted, the rest were duplicates
+    """
+    existing = get_existing([values['import_hash'] for values in chunk])
+    fresh = []
+    for values in chunk:
+        if values['import_hash'] not in existing:
+            existing.add(values['import_hash'])
+            fresh.append(values)
+
+    if fresh:
+        db.session.execute(Transaction.__table__.insert(), fresh)
+        balances.adjust(account_id, sum(values['amount'] for values in fresh))
+        snapshots.invalidate_from(userdetails, min(values['date'] for values in fresh))
+        versions.bump(userdetails)
+        db.session.commit()
+    return len(fresh)
+
+def import_transactions(userdetails, account, stream, format, columns=None, date_format=None, chunk_size=CHUNK_SIZE):
+    """Import an export file into an account
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: Owner of the account
+        account -> dontbudge.api.models.Account: Account to import into
+        stream -> Text file object: Export to import
+        format -> String: One of FORMATS
+        columns -> dontbudge.api.importer.Columns: CSV header names, if not the defaults
+        date_format -> String: strptime format of CSV and QIF dates, if not the defaults
+        chunk_size -> Integer: Number of rows to insert per commit
+
+    Returns:
+        A dontbudge.api.importer.ImportResult with the number of rows read,
+        imported, skipped as duplicates and skipped as unreadable
+    """
+    categories = {str(category.name).lower(): category.id for category in userdetails.categories}
+    account_id = account.id
+    counts = {'read': 0, 'imported': 0, 'skipped': 0}
+
+    def readable(rows):
+        for row in rows:
+            counts['read'] += 1
+            if row is None:
+                counts['skipped'] += 1
+            else:
+                yield row
+
+    chunk = []
+    for row, import_hash in get_hashes(account_id, readable(parse(stream, format, columns, date_format))):
+        chunk.append({
+            'user_id': userdetails.id,
+            'account_id': account_id,
+            'bill_id': None,
+            'category_id': categories.get(row.category.lower()) if row.category else None,
+            'budget_id': None,
+            'description': row.description[:DESCRIPTION_LENGTH],
+            'date': row.date,
+            'amount': row.amount,
+            'import_hash': import_hash
+        })
+        if len(chunk) >= chunk_size:
+            counts['imported'] += insert(userdetails, account_id, chunk)
+            chunk = []
+    if chunk:
+        counts['imported'] += insert(userdetails, account_id, chunk)
+
+    duplicates = counts['read'] - counts['skipped'] - counts['imported']
+    return ImportResult(counts['read'], counts['imported'], duplicates, counts['skipped'])
@@ -1,7 +1,8 @@
 from decimal import Decimal
-from datetime import date
-from sqlalchemy.orm import relationship
+from datetime import date, datetime
+from sqlalchemy.orm import relationship, deferred
 from dontbudge.database import db
+from dontbudge.money import Money
 
 class Bill(db.Model):
     __tablename__ = 'bills'
@@ -10,22 +11,24 @@ class Bill(db.Model):
     start = db.Column(db.DateTime)
     name = db.Column(db.String(50))
     occurence = db.Column(db.String(4))
-    amount = db.Column(db.Numeric(scale=2))
+    amount = db.Column(Money)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'))
     transactions = relationship('Transaction', backref='bill')
 
-    def __init__(self, start: date, name: str, occurence: str, user_id: int, amount: Decimal):
+    def __init__(self, start: date, name: str, occurence: str, user_id: int, amount: Decimal, account_id: int = None):
         self.start = start
         self.name = name
         self.occurence = occurence
         self.user_id = user_id
         self.amount = amount
+        self.account_id = account_id
 
 class Budget(db.Model):
     __tablename__ = 'budgets'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('userdetails.id'))
-    name = db.Column(db.Integer)
-    amount = db.Column(db.Numeric(scale=2))
+    name = db.Column(db.String(100))
+    amount = db.Column(Money)
     transactions = relationship('Transaction', backref='budget')
 
     def __init__(self, name: str, user_id: int, amount: Decimal):
@@ -37,7 +40,7 @@ class Category(db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('userdetails.id'))
-    name = db.Column(db.Integer)
+    name = db.Column(db.String(100))
     transactions = relationship('Transaction', backref='category')
 
     def __init__(self, name: str, user_id: int):
@@ -46,6 +49,13 @@ class Category(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_user_id_date', 'user_id', 'date'),
+        db.Index('ix_transactions_account_id_date', 'account_id', 'date'),
+        db.Index('ix_transactions_budget_id_date', 'budget_id', 'date'),
+        db.Index('ix_transactions_category_id_date', 'category_id', 'date'),
+        db.Index('ix_transactions_import_hash', 'import_hash'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('userdetails.id'))
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'))
@@ -54,7 +64,8 @@ class Transaction(db.Model):
     budget_id = db.Column(db.Integer, db.ForeignKey('budgets.id'))
     description = db.Column(db.String(100))
     date = db.Column(db.DateTime)
-    amount = db.Column(db.Numeric(scale=2))
+    amount = db.Column(Money)
+    import_hash = db.Column(db.String(40))
 
     def __init__(self, user_id: int, account_id: int, description: str, date: date, amount: Decimal, bill_id: int = None, category_id: int = None, budget_id: int = None):
         self.user_id = user_id
@@ -71,26 +82,84 @@ class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('userdetails.id', ondelete='CASCADE'))
     name = db.Column(db.String(100))
-    balance = db.Column(db.Numeric(scale=2))
+    balance = db.Column(Money)
     transactions = relationship('Transaction', backref='account', cascade='delete')
+    bills = relationship('Bill', backref='account')
 
     def __init__(self, name: str, user_id: id):
         self.name = name
         self.user_id = user_id
+        self.balance = 0
+
+class PeriodSummary(db.Model):
+    __tablename__ = 'period_summaries'
+    __table_args__ = (
+        db.Index('ix_period_summaries_user_id_start', 'user_id', 'start'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('userdetails.id'))
+    start = db.Column(db.DateTime)
+    end = db.Column(db.DateTime)
+    income = db.Column(Money)
+    spending = db.Column(Money)
+    categories = db.Column(db.JSON)
+    budgets = db.Column(db.JSON)
+
+    def __init__(self, user_id: int, start: date, end: date, income: Decimal, spending: Decimal, categories: dict, budgets: dict):
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+        self.income = income
+        self.spending = spending
+        self.categories = categories
+        self.budgets = budgets
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status', 'status'),
+        db.Index('ix_jobs_user_id', 'user_id')
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('userdetails.id'))
+    report = db.Column(db.String(20))
+    format = db.Column(db.String(10))
+    params = db.Column(db.JSON)
+    status = db.Column(db.String(10))
+    error = db.Column(db.String(100))
+    size = db.Column(db.Integer)
+    result = deferred(db.Column(db.LargeBinary))
+    created = db.Column(db.DateTime)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+
+    def __init__(self, user_id: int, report: str, format: str, params: dict, status: str, created: datetime):
+        self.user_id = user_id
+        self.report = report
+        self.format = format
+        self.params = params
+        self.status = status
+        self.created = created
 
 class UserDetails(db.Model):
     __tablename__ = 'userdetails'
+    __table_args__ = (
+        db.Index('ix_userdetails_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     name = db.Column(db.String(15))
     range = db.Column(db.String(4))
     period_start = db.Column(db.DateTime)
     period_end = db.Column(db.DateTime)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     accounts = relationship('Account', backref='user', cascade='delete')
     bills = relationship('Bill', backref='user', cascade='delete')
     categories = relationship('Category', backref='user', cascade='delete')
     budgets = relationship('Budget', backref='user', cascade='delete')
     transactions = relationship('Transaction', backref='user', cascade='delete')
+    period_summaries = relationship('PeriodSummary', backref='user', cascade='delete')
+    jobs = relationship('Job', backref='user', cascade='delete')
 
     def __init__(self, name: str, user_id: int, range: str, period_start: date, period_end: date):
         self.name = name
@@ -98,3 +167,4 @@ class UserDetails(db.Model):
         self.range = range
         self.period_start = period_start
         self.period_end = period_end
+        self.version = 0
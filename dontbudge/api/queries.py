@@ -0,0 +1,161 @@
+"""Queries
+
+Reusable aggregate queries over the models. Totals are summed by the database
+with GROUP BY rather than by loading relationship collections and adding up
+each Transaction in Python, so every function here is a single query no matter
+how many accounts, budgets or transactions a user has.
+"""
+from sqlalchemy import func, case
+from dontbudge.database import db
+from dontbudge.api.models import Transaction, Category, Bill, Budget
+
+def _in_range(query, start, end):
+    """Restrict a Transaction query to start <= date < end, if given"""
+    if start is not None:
+        query = query.filter(Transaction.date >= start)
+    if end is not None:
+        query = query.filter(Transaction.date < end)
+    return query
+
+def get_budget_usage(user_id, start=None, end=None):
+    """Get how much of each budget of a user has been used
+
+    Withdrawals count towards a budget and deposits are taken off it, so the
+    used amount is the negated sum of the budget's transactions.
+
+    Args:
+        user_id -> Integer: ID of the UserDetails owning the budgets
+        start -> datetime: Optional inclusive lower bound on transaction dates
+        end -> datetime: Optional exclusive upper bound on transaction dates
+
+    Returns:
+        Dictionary of budget ID to used amount. Unused budgets are absent.
+    """
+    query = db.session.query(
+        Transaction.budget_id, func.sum(Transaction.amount)
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.budget_id.isnot(None)
+    )
+    query = _in_range(query, start, end).group_by(Transaction.budget_id)
+    return {budget_id: total * -1 for budget_id, total in query}
+
+def get_category_spending(user_id, start=None, end=None):
+    """Get the total spent (withdrawn) in each category of a user
+
+    Args:
+        user_id -> Integer: ID of the UserDetails owning the transactions
+        start -> datetime: Optional inclusive lower bound on transaction dates
+        end -> datetime: Optional exclusive upper bound on transaction dates
+
+    Returns:
+        Dictionary of category name to amount spent, with uncategorised spending under 'None'
+    """
+    query = db.session.query(
+        Category.name, func.sum(Transaction.amount)
+    ).outerjoin(
+        Category, Transaction.category_id == Category.id
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.amount < 0
+    )
+    query = _in_range(query, start, end).group_by(Category.name)
+    spending = {}
+    for name, total in query:
+        name = name if name else 'None'
+        spending[name] = spending.get(name, 0) + total * -1
+    return spending
+
+def get_income_and_spending(user_id, start=None, end=None):
+    """Get the total deposited and withdrawn by a user
+
+    Args:
+        user_id -> Integer: ID of the UserDetails owning the transactions
+        start -> datetime: Optional inclusive lower bound on transaction dates
+        end -> datetime: Optional exclusive upper bound on transaction dates
+
+    Returns:
+        Tuple of (income, spending), both positive
+    """
+    query = db.session.query(
+        func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)),
+        func.sum(case((Transaction.amount < 0, Transaction.amount), else_=0))
+    ).filter(
+        Transaction.user_id == user_id
+    )
+    income, spending = _in_range(query, start, end).one()
+    return income if income is not None else 0, spending * -1 if spending is not None else 0
+
+def get_latest_transaction_date(user_id):
+    """Get the date of the most recent transaction of a user, or None if there are none"""
+    return db.session.query(
+        func.max(Transaction.date)
+    ).filter(
+        Transaction.user_id == user_id
+    ).scalar()
+
+def get_earliest_transaction_date(user_id):
+    """Get the date of the oldest transaction of a user, or None if there are none"""
+    return db.session.query(
+        func.min(Transaction.date)
+    ).filter(
+        Transaction.user_id == user_id
+    ).scalar()
+
+def get_unplanned_flow(user_id, start=None, end=None):
+    """Get the net amount of every account of a user not paid to a bill or budget
+
+    Transactions linked to one of the user's bills or budgets are left out, as
+    is the initial balance each account is opened with (its first transaction).
+
+    Args:
+        user_id -> Integer: ID of the UserDetails owning the accounts
+        start -> datetime: Optional inclusive lower bound on transaction dates
+        end -> datetime: Optional exclusive upper bound on transaction dates
+
+    Returns:
+        Dictionary of account ID to net amount. Accounts without such transactions are absent.
+    """
+    opening = db.session.query(
+        func.min(Transaction.id)
+    ).filter(
+        Transaction.user_id == user_id
+    ).group_by(Transaction.account_id)
+    query = db.session.query(
+        Transaction.account_id, func.sum(Transaction.amount)
+    ).outerjoin(
+        Bill, Transaction.bill_id == Bill.id
+    ).outerjoin(
+        Budget, Transaction.budget_id == Budget.id
+    ).filter(
+        Transaction.user_id == user_id,
+        Bill.id.is_(None),
+        Budget.id.is_(None),
+        Transaction.id.notin_(opening)
+    )
+    query = _in_range(query, start, end).group_by(Transaction.account_id)
+    return {account_id: total for account_id, total in query}
+
+def get_usual_accounts(user_id, column):
+    """Get the account each bill or budget of a user is most often paid from
+
+    Args:
+        user_id -> Integer: ID of the UserDetails owning the transactions
+        column -> Transaction.bill_id or Transaction.budget_id: What to group the transactions by
+
+    Returns:
+        Dictionary of bill or budget ID to account ID. Ones never paid are absent.
+    """
+    query = db.session.query(
+        column, Transaction.account_id, func.count()
+    ).filter(
+        Transaction.user_id == user_id,
+        column.isnot(None)
+    ).group_by(column, Transaction.account_id)
+    usual = {}
+    counts = {}
+    for key, account_id, count in query:
+        if count > counts.get(key, 0):
+            usual[key] = account_id
+            counts[key] = count
+    return usual
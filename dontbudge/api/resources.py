@@ -0,0 +1,333 @@
+"""Resources
+
+The models exposed by the JSON API, with how each is listed, serialised,
+created, updated and deleted. Writes keep balances and snapshots in step the
+same way the dashboard does, but never commit, so the API can apply a single
+change or a whole batch of them in one database transaction.
+
+Invalid requests raise ApiError, which the API turns into a JSON error
+response.
+"""
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from dontbudge.database import db
+from dontbudge.money import CENT, MAX_AMOUNT
+from dontbudge.api.models import Account, Transaction, Bill, Budget, Category
+from dontbudge.api import balances, snapshots
+from dontbudge.dashboard import utility
+
+OCCURENCES = ('1W', '2W', '1M', '1Q', '1Y')
+DATE_FORMAT = '%Y-%m-%d'
+
+Resource = namedtuple('Resource', [
+    'model',
+    'serialise',
+    'create',
+    'update',
+    'delete'
+])
+
+class ApiError(Exception):
+    """An invalid API request, reported to the client with a status code"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def format_day(day):
+    return day.strftime(DATE_FORMAT) if day else None
+
+def format_amount(amount):
+    """Format an amount, or a percentage, as a string with two decimal places
+
+    Totals that nothing was added to are plain 0 integers, so they are
+    converted to Decimal first to give every amount the same type.
+    """
+    return str(Decimal(amount).quantize(CENT))
+
+def format_reference(value):
+    """Format an optional foreign key as an integer or None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def get_text(data, key, required=False, length=100):
+    value = data.get(key)
+    if value is None:
+        if required:
+            raise ApiError(f'{key} is required')
+        return None
+    if not isinstance(value, str) or not value.strip():
+        raise ApiError(f'{key} must be a non-empty string')
+    if len(value) > length:
+        raise ApiError(f'{key} must be at most {length} characters')
+    return value.strip()
+
+def get_amount(data, key, required=False, positive=False):
+    value = data.get(key)
+    if value is None:
+        if required:
+            raise ApiError(f'{key} is required')
+        return None
+    try:
+        amount = Decimal(str(value))
+        if not amount.is_finite():
+            raise InvalidOperation
+    except InvalidOperation:
+        raise ApiError(f'{key} must be a number')
+    if abs(amount) >= MAX_AMOUNT:
+        raise ApiError(f'{key} must be less than {MAX_AMOUNT}')
+    if amount != amount.quantize(CENT):
+        raise ApiError(f'{key} can not be smaller than a cent')
+    if positive and amount <= 0:
+        raise ApiError(f'{key} must be more than 0')
+    return amount.quantize(CENT)
+
+def get_day(data, key, required=False):
+    value = data.get(key)
+    if value is None:
+        if required:
+            raise ApiError(f'{key} is required')
+        return None
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except (TypeError, ValueError):
+        raise ApiError(f'{key} must be a date formatted as YYYY-MM-DD')
+
+def get_reference(data, key, model, userdetails, required=False):
+    """Get the ID of a row of the user's referenced by a field, checking they own it"""
+    value = data.get(key)
+    if value is None:
+        if required:
+            raise ApiError(f'{key} is required')
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or not utility.get_owned(model, userdetails, value):
+        raise ApiError(f'{key} does not refer to one of your {model.__tablename__}')
+    return value
+
+def get_occurence(data, key, required=False):
+    value = data.get(key)
+    if value is None:
+        if required:
+            raise ApiError(f'{key} is required')
+        return None
+    if value not in OCCURENCES:
+        raise ApiError(f'{key} must be one of {", ".join(OCCURENCES)}')
+    return value
+
+def serialise_account(account):
+    return {'id': account.id, 'name': account.name, 'balance': balances.get_balance(account)}
+
+def create_account(userdetails, data):
+    account = Account(get_text(data, 'name', required=True), userdetails.id)
+    db.session.add(account)
+    db.session.flush()
+    balance = get_amount(data, 'balance')
+    if balance:
+        initial_balance = Transaction(userdetails.id, account.id, f'{account.name} Initial Balance', datetime.combine(date.today(), datetime.min.time()), balance)
+        db.session.add(initial_balance)
+        balances.apply(initial_balance)
+        db.session.expire(account, ['balance'])
+    return account
+
+def update_account(userdetails, account, data):
+    name = get_text(data, 'name')
+    if name is not None:
+        account.name = name
+
+def delete_account(userdetails, account):
+    db.session.delete(account)
+    snapshots.clear(userdetails)
+
+def serialise_transaction(transaction):
+    return {
+        'id': transaction.id,
+        'account_id': transaction.account_id,
+        'date': format_day(transaction.date),
+        'description': transaction.description,
+        'amount': transaction.amount,
+        'category_id': format_reference(transaction.category_id),
+        'budget_id': format_reference(transaction.budget_id),
+        'bill_id': format_reference(transaction.bill_id)
+    }
+
+def pay_bill(bill_id):
+    """Move a bill on to its next occurence, since this one has been paid"""
+    bill = Bill.query.filter_by(id=bill_id).first()
+    if bill:
+        bill.start = bill.start + utility.get_relative(bill.occurence)
+
+def create_transaction(userdetails, data):
+    transaction = Transaction(
+        userdetails.id,
+        get_reference(data, 'account_id', Account, userdetails, required=True),
+        get_text(data, 'description', required=True),
+        get_day(data, 'date') or datetime.combine(date.today(), datetime.min.time()),
+        get_amount(data, 'amount', required=True),
+        get_reference(data, 'bill_id', Bill, userdetails),
+        get_reference(data, 'category_id', Category, userdetails),
+        get_reference(data, 'budget_id', Budget, userdetails)
+    )
+    db.session.add(transaction)
+    if transaction.bill_id:
+        pay_bill(transaction.bill_id)
+    balances.apply(transaction)
+    snapshots.invalidate(userdetails, transaction.date)
+    return transaction
+
+def update_transaction(userdetails, transaction, data):
+    # Take the transaction off its current account, it is applied again once
+    # updated in case the amount or account changes
+    balances.revert(transaction)
+    previous_date = transaction.date
+
+    if 'account_id' in data:
+        transaction.account_id = get_reference(data, 'account_id', Account, userdetails, required=True)
+    if 'description' in data:
+        transaction.description = get_text(data, 'description', required=True)
+    if 'date' in data:
+        transaction.date = get_day(data, 'date', required=True)
+    if 'amount' in data:
+        transaction.amount = get_amount(data, 'amount', required=True)
+    if 'category_id' in data:
+        transaction.category_id = get_reference(data, 'category_id', Category, userdetails)
+    if 'budget_id' in data:
+        transaction.budget_id = get_reference(data, 'budget_id', Budget, userdetails)
+    if 'bill_id' in data:
+        bill_id = get_reference(data, 'bill_id', Bill, userdetails)
+        if bill_id and bill_id != format_reference(transaction.bill_id):
+            pay_bill(bill_id)
+        transaction.bill_id = bill_id
+
+    balances.apply(transaction)
+    snapshots.invalidate(userdetails, previous_date, transaction.date)
+
+def delete_transaction(userdetails, transaction):
+    balances.revert(transaction)
+    snapshots.invalidate(userdetails, transaction.date)
+    db.session.delete(transaction)
+
+def serialise_bill(bill):
+    return {'id': bill.id, 'name': bill.name, 'start': format_day(bill.start), 'occurence': bill.occurence, 'amount': bill.amount, 'account_id': bill.account_id}
+
+def create_bill(userdetails, data):
+    bill = Bill(
+        get_day(data, 'start', required=True),
+        get_text(data, 'name', required=True, length=50),
+        get_occurence(data, 'occurence', required=True),
+        userdetails.id,
+        get_amount(data, 'amount', required=True, positive=True),
+        get_reference(data, 'account_id', Account, userdetails)
+    )
+    db.session.add(bill)
+    return bill
+
+def update_bill(userdetails, bill, data):
+    if 'name' in data:
+        bill.name = get_text(data, 'name', required=True, length=50)
+    if 'start' in data:
+        bill.start = get_day(data, 'start', required=True)
+    if 'occurence' in data:
+        bill.occurence = get_occurence(data, 'occurence', required=True)
+    if 'amount' in data:
+        bill.amount = get_amount(data, 'amount', required=True, positive=True)
+    if 'account_id' in data:
+        bill.account_id = get_reference(data, 'account_id', Account, userdetails)
+
+def delete_bill(userdetails, bill):
+    db.session.delete(bill)
+
+def serialise_budget(budget):
+    return {'id': budget.id, 'name': budget.name, 'amount': budget.amount}
+
+def create_budget(userdetails, data):
+    budget = Budget(get_text(data, 'name', required=True), userdetails.id, get_amount(data, 'amount', required=True, positive=True))
+    db.session.add(budget)
+    return budget
+
+def update_budget(userdetails, budget, data):
+    if 'name' in data:
+        budget.name = get_text(data, 'name', required=True)
+    if 'amount' in data:
+        budget.amount = get_amount(data, 'amount', required=True, positive=True)
+
+def delete_budget(userdetails, budget):
+    db.session.delete(budget)
+
+def serialise_category(category):
+    return {'id': category.id, 'name': category.name}
+
+def create_category(userdetails, data):
+    category = Category(get_text(data, 'name', required=True), userdetails.id)
+    db.session.add(category)
+    return category
+
+def update_category(userdetails, category, data):
+    if 'name' in data:
+        category.name = get_text(data, 'name', required=True)
+        snapshots.clear(userdetails)
+
+def delete_category(userdetails, category):
+    db.session.delete(category)
+    snapshots.clear(userdetails)
+
+RESOURCES = {
+    'accounts': Resource(Account, serialise_account, create_account, update_account, delete_account),
+    'transactions': Resource(Transaction, serialise_transaction, create_transaction, update_transaction, delete_transaction),
+    'bills': Resource(Bill, serialise_bill, create_bill, update_bill, delete_bill),
+    'budgets': Resource(Budget, serialise_budget, create_budget, update_budget, delete_budget),
+    'categories': Resource(Category, serialise_category, create_category, update_category, delete_category)
+}
+
+def get_resource(name):
+    """Get a resource by its name in the URL"""
+    if name not in RESOURCES:
+        raise ApiError(f'Unknown resource {name}', 404)
+    return RESOURCES[name]
+
+def get_item(resource, userdetails, id):
+    """Get a row of a resource owned by the user"""
+    item = utility.get_owned(resource.model, userdetails, id)
+    if not item:
+        raise ApiError(f'{resource.model.__name__} {id} not found', 404)
+    return item
+
+def apply(userdetails, operation):
+    """Apply one create, update or delete operation
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User making the change
+        operation -> Dictionary: With the action (create, update or delete), the
+            resource name, the id of the row for updates and deletes, and the
+            data for creates and updates
+
+    Returns:
+        The serialised row, or just its id if it was deleted
+    """
+    if not isinstance(operation, dict):
+        raise ApiError('Each operation must be an object')
+    resource = get_resource(operation.get('resource'))
+    action = operation.get('action')
+    data = operation.get('data') or {}
+    if not isinstance(data, dict):
+        raise ApiError('data must be an object')
+
+    if action == 'create':
+        item = resource.create(userdetails, data)
+        db.session.flush()
+        return resource.serialise(item)
+
+    id = operation.get('id')
+    if isinstance(id, bool) or not isinstance(id, int):
+        raise ApiError('id must be an integer')
+    item = get_item(resource, userdetails, id)
+    if action == 'update':
+        resource.update(userdetails, item, data)
+        db.session.flush()
+        return resource.serialise(item)
+    if action == 'delete':
+        resource.delete(userdetails, item)
+        return {'id': item.id, 'deleted': True}
+    raise ApiError('action must be one of create, update or delete')
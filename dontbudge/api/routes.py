@@ -1,85 +1,390 @@
-from flask import request, Blueprint
+from flask import request, Blueprint, Response
 from flask.json import jsonify
-from datetime import date, timedelta
-from dontbudge.api import models
 from dontbudge.database import db
-from dontbudge.auth.jwt import token_required
+from dontbudge.auth.jwt import api_token_required, create_token
+from dontbudge.auth.models import User
+from dontbudge.auth.passwords import check_user_password
+from dontbudge.api.models import Transaction, Account, Job
+from dontbudge.api import resources, snapshots, versions
+from dontbudge.api.resources import ApiError
+from dontbudge.dashboard import forecast, utility, aggregation, reports, exporter
+from dontbudge import jobs
+from dontbudge.cache import cache
+from dontbudge.etags import conditional
 
 api = Blueprint('api', __name__)
 
-@api.route('/api/account', methods=['GET', 'POST'])
-@token_required
-def account():
+# Largest number of operations accepted in a single batch request
+MAX_BATCH = 1000
+MAX_PAGE_SIZE = 500
+MAX_JOBS = 50
+# Seconds a client is asked to wait before polling an unfinished report again
+POLL_INTERVAL = 2
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    db.session.rollback()
+    return jsonify({'error': error.message}), error.status
+
+def get_json():
+    """Get the JSON object body of the request"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError('Request body must be a JSON object')
+    return data
+
+@api.route('/api/v1/token', methods=['POST'])
+def create_api_token():
+    """Token
+
+    Exchanges a username and password for a token, to be sent with other API
+    requests in an 'Authorization: Bearer <token>' header.
+
+    Returns:
+        JSON with the token
+    """
+    data = get_json()
+    username = str(data.get('username', '')).lower()
+    password = str(data.get('password', ''))
+    user = User.query.filter_by(username=username).first()
+    if not user or not check_user_password(user, password):
+        raise ApiError('Incorrect username or password', 401)
+    db.session.commit()
+    return jsonify({'token': create_token(user, bool(data.get('remember')))})
+
+@api.route('/api/v1/periods', methods=['GET'])
+@api_token_required
+@conditional
+def list_periods(user):
+    """List every period of the user, oldest first"""
+    periods = cache.get('periods', user.userdetails, utility.get_periods)
+    return jsonify([
+        {'index': index, 'start': resources.format_day(period.start), 'end': resources.format_day(period.end)}
+        for index, period in enumerate(periods)
+    ])
+
+@api.route('/api/v1/periods/<int:index>', methods=['GET'])
+@api_token_required
+@conditional
+def view_period(user, index):
+    """View the totals of a period by its index in the list of periods"""
+    userdetails = user.userdetails
+    periods = cache.get('periods', userdetails, utility.get_periods)
+    if index >= len(periods):
+        raise ApiError('Period not found', 404)
+    period = periods[index]
+    totals = cache.get('totals', userdetails, snapshots.get_totals, period)
+    return jsonify({
+        'index': index,
+        'start': resources.format_day(period.start),
+        'end': resources.format_day(period.end),
+        'income': totals.income,
+        'spending': totals.spending,
+        'categories': {str(name): used for name, used in totals.categories.items()},
+        'budgets': {str(budget_id): used for budget_id, used in totals.budgets.items()}
+    })
+
+def serialise_occurrence(occurrence):
+    return {'bill_id': occurrence.bill_id, 'name': occurrence.name, 'amount': resources.format_amount(occurrence.amount), 'date': resources.format_day(occurrence.date)}
+
+@api.route('/api/v1/summary', methods=['GET'])
+@api_token_required
+@conditional
+def view_summary(user):
+    """Summary
+
+    Everything the dashboard index displays: account balances with their
+    recent transactions, budget usage, bills due and the chart data. Send the
+    returned ETag back in If-None-Match to get a 304 while nothing has changed.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+
+    Returns:
+        JSON summary of the user's current period
+    """
+    userdetails = user.userdetails
+    aggregation.update_period(userdetails)
+    summary = cache.get('summary', userdetails, aggregation.summarise)
+    format_amount = resources.format_amount
+    return jsonify({
+        'period': {'start': resources.format_day(userdetails.period_start), 'end': resources.format_day(userdetails.period_end)},
+        'accounts': [{
+            'id': account.id,
+            'name': account.name,
+            'balance': format_amount(account.balance),
+            'transactions': [{
+                'id': transaction.id,
+                'description': transaction.description,
+                'amount': format_amount(transaction.amount),
+                'date': resources.format_day(transaction.date)
+            } for transaction in account.transactions]
+        } for account in summary.accounts],
+        'budgets': [{
+            'id': budget.id,
+            'name': budget.name,
+            'amount': format_amount(budget.amount),
+            'used': format_amount(budget.used)
+        } for budget in summary.budgets],
+        'bills': [serialise_occurrence(occurrence) for occurrence in summary.bills],
+        'previous_bills': [serialise_occurrence(occurrence) for occurrence in summary.previous_bills],
+        'total_bill_amount': format_amount(summary.total_bill_amount),
+        'budget_chart': [{'name': budget['name'], 'percent': format_amount(budget['percent'])} for budget in summary.budget_chart],
+        'category_chart': {str(name): format_amount(amount) for name, amount in summary.category_chart.items()},
+        'overview_chart': {name: format_amount(amount) for name, amount in summary.overview_chart.items()}
+    })
+
+def list_transactions(userdetails):
+    """List a page of the user's transactions, newest first
+
+    Filtered by the account, start and end query arguments, and paged with
+    the limit and before arguments, before being the cursor returned as next
+    with the previous page.
+    """
+    query = Transaction.query.filter_by(user_id=userdetails.id)
+    account_id = request.args.get('account', type=int)
+    if account_id is not None:
+        query = query.filter(Transaction.account_id == account_id)
+    start = resources.get_day(request.args, 'start')
+    if start is not None:
+        query = query.filter(Transaction.date >= start)
+    end = resources.get_day(request.args, 'end')
+    if end is not None:
+        query = query.filter(Transaction.date < end)
+
+    size = min(max(request.args.get('limit', utility.PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    page = utility.get_transaction_page(query, request.args.get('before'), size)
+    return jsonify({
+        'items': [resources.serialise_transaction(transaction) for transaction in page.items],
+        'next': page.cursor
+    })
+
+@api.route('/api/v1/<name>', methods=['GET', 'POST'])
+@api_token_required
+def collection(user, name):
+    """List or create rows of a resource
+
+    GET lists every row of the user's, except transactions which are listed a
+    page at a time. POST creates a row from the JSON body.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+        name -> String: Resource name, one of accounts, transactions, bills, budgets or categories
+    """
+    userdetails = user.userdetails
+    resource = resources.get_resource(name)
+    if request.method == 'GET':
+        if name == 'transactions':
+            return list_transactions(userdetails)
+        rows = resource.model.query.filter_by(user_id=userdetails.id).order_by(resource.model.id)
+        return jsonify([resource.serialise(row) for row in rows])
+
+    result = resources.apply(userdetails, {'action': 'create', 'resource': name, 'data': get_json()})
+    versions.bump(userdetails)
+    db.session.commit()
+    return jsonify(result), 201
+
+@api.route('/api/v1/<name>/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
+@api_token_required
+def item(user, name, id):
+    """View, update or delete a single row of a resource
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+        name -> String: Resource name, one of accounts, transactions, bills, budgets or categories
+        id -> Integer: ID of the row
+    """
+    userdetails = user.userdetails
+    resource = resources.get_resource(name)
     if request.method == 'GET':
-        return jsonify('nothing here')
-    elif request.method == 'POST':
-        data = request.get_json()
-        name = data['name']
-        balance = data['balance']
-        user = data['user']
-        u = models.UserDetails.query.filter_by(name=user).first()
-        if u:
-            account = models.Account(name, int(balance), u.id)
-            db.session.add(account)
-        else:
-            # Create user
-            u = models.UserDetails(user)
-            db.session.add(u)
-            db.session.commit()
-
-            # Initial period
-            start = date.today()
-            range_delta = timedelta(days=u.range)
-            end = start + range_delta
-            period = models.Period(start, end, u.id)
-            db.session.add(period)
-            db.session.commit()
-
-            # add account
-            account = models.Account(name, int(balance), u.id)
-            db.session.add(account)
-        db.session.commit()  
-        d={'user':u.name,'accounts': [], 'periods': []}
-        for a in models.Account.query.filter_by(user=u.id).all():
-            d['accounts'].append({'name': a.name, 'balance': a.balance})
-        for p in models.Period.query.filter_by(user=u.id).all():
-            d['periods'].append({'start': p.start, 'end': p.end})
-        return jsonify(d)
-
-@api.route('/api/withdraw', methods=['GET', 'POST'])
-@token_required
-def withdraw(user):
-    # View withdrawals
+        return jsonify(resource.serialise(resources.get_item(resource, userdetails, id)))
+
+    action = 'update' if request.method == 'PATCH' else 'delete'
+    data = get_json() if action == 'update' else None
+    result = resources.apply(userdetails, {'action': action, 'resource': name, 'id': id, 'data': data})
+    versions.bump(userdetails)
+    db.session.commit()
+    return jsonify(result)
+
+@api.route('/api/v1/batch', methods=['POST'])
+@api_token_required
+def batch(user):
+    """Batch
+
+    Applies many create, update and delete operations in one request and one
+    database transaction. Either every operation is applied or, if any fails,
+    none are.
+
+    The body is {"operations": [{"action", "resource", "id", "data"}, ...]},
+    with the same resources and data as the single row endpoints.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+
+    Returns:
+        JSON with the result of each operation in order, or the error and the
+        index of the operation that failed
+    """
+    userdetails = user.userdetails
+    operations = get_json().get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise ApiError('operations must be a non-empty list')
+    if len(operations) > MAX_BATCH:
+        raise ApiError(f'A batch can have at most {MAX_BATCH} operations', 413)
+
+    results = []
+    for index, operation in enumerate(operations):
+        try:
+            results.append(resources.apply(userdetails, operation))
+        except ApiError as error:
+            db.session.rollback()
+            return jsonify({'error': error.message, 'index': index}), error.status
+
+    versions.bump(userdetails)
+    db.session.commit()
+    return jsonify({'results': results})
+
+@api.route('/api/v1/forecast', methods=['GET'])
+@api_token_required
+@conditional
+def view_forecast(user):
+    """Forecast
+
+    Projects the daily balance of every account of the user. The number of
+    periods to forecast after the current one and the days of history to
+    average spending over can be given with the periods and history query
+    arguments.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+
+    Returns:
+        JSON with the first day of the forecast, the number of days, each
+        account's projected daily balances and the projected daily total
+    """
+    periods = min(max(request.args.get('periods', forecast.PERIODS, type=int), 0), forecast.MAX_PERIODS)
+    history = min(max(request.args.get('history', forecast.HISTORY, type=int), 1), forecast.MAX_HISTORY)
+    result = forecast.get_forecast(user.userdetails, periods, history)
+    return jsonify({
+        'start': result.start.strftime('%Y-%m-%d'),
+        'days': result.days,
+        'accounts': [account._asdict() for account in result.accounts],
+        'total': result.total
+    })
+
+def format_time(moment):
+    return moment.isoformat(timespec='seconds') + 'Z' if moment else None
+
+def serialise_job(job):
+    return {
+        'id': job.id,
+        'report': job.report,
+        'format': job.format,
+        'params': job.params,
+        'status': job.status,
+        'error': job.error,
+        'size': job.size,
+        'created': format_time(job.created),
+        'started': format_time(job.started),
+        'finished': format_time(job.finished),
+        'result': f'/api/v1/reports/{job.id}/result' if job.status == jobs.DONE else None
+    }
+
+def get_job(userdetails, id):
+    job = utility.get_owned(Job, userdetails, id)
+    if not job:
+        raise ApiError('Report not found', 404)
+    return job
+
+@api.route('/api/v1/reports', methods=['GET', 'POST'])
+@api_token_required
+def report_jobs(user):
+    """Reports
+
+    Reports over the user's whole history are built in the background. POST
+    queues one, from a body of {"report", "format"} where report is one of
+    years, categories, transactions, periods or budgets and format is csv or
+    ndjson. A transactions report also takes the account_id, start and end
+    filters. Poll the returned job until its status is done, then download its
+    result. GET lists the user's recent jobs, newest first.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+
+    Returns:
+        JSON of the queued job, with its URL in the Location header, or a list of jobs
+    """
+    userdetails = user.userdetails
     if request.method == 'GET':
-        userdetails = models.UserDetails.query.filter_by(id=user.userdetails_id).first()
-        withdrawals = {}
-        for period in userdetails.periods:
-            transactions = []
-            for transaction in period.transactions:
-                transactions.append({
-                    'date': transaction.date,
-                    'description': transaction.description
-                })
-            withdrawals[period.id] = {
-                'start': period.start,
-                'end': period.end,
-                'transactions': transactions
-            }   
-        return jsonify(withdrawals)
-    elif request.method == 'POST':
-        data = request.get_json()
-        amount = int(data['amount'])
-        #u.balance -= amount
-        return jsonify('dummy')
-    else:
-        return 'invalid method'
-
-@api.route('/api/deposit', methods=['GET', 'POST'])
-@token_required
-def deposit():
-    return 'none'
-
-@api.route('/api/bill', methods=['GET', 'POST'])
-@token_required
-def bill():
-    return 'none'
\ No newline at end of file
+        rows = Job.query.filter_by(user_id=userdetails.id).order_by(Job.id.desc()).limit(MAX_JOBS)
+        return jsonify([serialise_job(job) for job in rows])
+
+    data = get_json()
+    report = data.get('report')
+    if report not in reports.REPORTS:
+        raise ApiError(f'report must be one of {", ".join(reports.REPORTS)}')
+    format = data.get('format', 'csv')
+    if format not in exporter.FORMATS:
+        raise ApiError(f'format must be one of {", ".join(exporter.FORMATS)}')
+    params = {}
+    if report == 'transactions':
+        params = {
+            'account_id': resources.get_reference(data, 'account_id', Account, userdetails),
+            'start': resources.format_day(resources.get_day(data, 'start')),
+            'end': resources.format_day(resources.get_day(data, 'end'))
+        }
+
+    job = jobs.enqueue(userdetails, report, format, params)
+    if job is None:
+        raise ApiError('Too many reports are queued or running, wait for one to finish', 429)
+    return jsonify(serialise_job(job)), 202, {'Location': f'/api/v1/reports/{job.id}', 'Retry-After': str(POLL_INTERVAL)}
+
+@api.route('/api/v1/reports/<int:id>', methods=['GET', 'DELETE'])
+@api_token_required
+def report_job(user, id):
+    """View or cancel a report job
+
+    GET gives the job's status, with a Retry-After header while it is queued
+    or running. DELETE cancels a queued or running job, or deletes a finished
+    one and its result.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+        id -> Integer: ID of the job
+    """
+    userdetails = user.userdetails
+    job = get_job(userdetails, id)
+    if request.method == 'DELETE':
+        if job.status in jobs.ACTIVE and jobs.cancel(job.id):
+            return jsonify(serialise_job(get_job(userdetails, id)))
+        db.session.delete(job)
+        db.session.commit()
+        return jsonify({'deleted': True, 'id': id})
+
+    if job.status == jobs.QUEUED:
+        jobs.dispatch()
+    elif job.status == jobs.RUNNING:
+        jobs.expire()
+    job = get_job(userdetails, id)
+    if job.status in jobs.ACTIVE:
+        return jsonify(serialise_job(job)), 200, {'Retry-After': str(POLL_INTERVAL)}
+    return jsonify(serialise_job(job))
+
+@api.route('/api/v1/reports/<int:id>/result', methods=['GET'])
+@api_token_required
+def report_result(user, id):
+    """Download the result of a finished report job
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+        id -> Integer: ID of the job
+
+    Returns:
+        The report as a CSV or NDJSON file download
+    """
+    job = get_job(user.userdetails, id)
+    if job.status != jobs.DONE:
+        raise ApiError(f'Report is {job.status}, not done', 409)
+    return Response(job.result, mimetype=exporter.FORMATS[job.format], headers={
+        'Content-Disposition': f'attachment; filename={job.report}.{job.format}'
+    })
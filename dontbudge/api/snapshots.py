@@ -0,0 +1,130 @@
+"""Snapshots
+
+Stores the totals of closed periods in the PeriodSummary table. Once a period
+has ended its transactions rarely change, so its income, spending, category
+spending and budget usage are calculated once and then read back, and only the
+open period is summed from raw transactions.
+
+A snapshot is written when the index rolls a user into a new period, or the
+first time a closed period without one is requested. Any change to a
+transaction dated inside a closed period deletes that period's snapshot so it
+is recalculated on next read, and changes that affect every period (renaming
+categories, changing the period settings, ...) clear all of a user's snapshots.
+"""
+from collections import namedtuple
+from decimal import Decimal
+from dontbudge.database import db
+from dontbudge.api.models import PeriodSummary
+from dontbudge.api import queries
+
+Totals = namedtuple('Totals', [
+    'income',
+    'spending',
+    'categories',
+    'budgets'
+])
+
+def is_closed(userdetails, period):
+    """Check whether a period ended before the user's current period"""
+    return period.end <= userdetails.period_start
+
+def calculate(userdetails, period):
+    """Calculate the totals of a period from its transactions
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to calculate totals of
+        period -> dontbudge.dashboard.utility.Period: Period to calculate totals of
+
+    Returns:
+        A dontbudge.api.snapshots.Totals with category spending keyed by
+        category name and budget usage keyed by budget ID
+    """
+    income, spending = queries.get_income_and_spending(userdetails.id, period.start, period.end)
+    categories = queries.get_category_spending(userdetails.id, period.start, period.end)
+    usage = queries.get_budget_usage(userdetails.id, period.start, period.end)
+    budgets = {budget.id: usage.get(budget.id, 0) for budget in userdetails.budgets}
+    return Totals(income, spending, categories, budgets)
+
+def take(userdetails, period):
+    """Calculate and store the totals of a closed period
+
+    Replaces any existing snapshot of the period. The caller is responsible
+    for committing.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to snapshot
+        period -> dontbudge.dashboard.utility.Period: Period to snapshot
+
+    Returns:
+        The calculated dontbudge.api.snapshots.Totals
+    """
+    totals = calculate(userdetails, period)
+    PeriodSummary.query.filter_by(user_id=userdetails.id, start=period.start).delete()
+    db.session.add(PeriodSummary(
+        userdetails.id,
+        period.start,
+        period.end,
+        totals.income,
+        totals.spending,
+        {name: str(amount) for name, amount in totals.categories.items()},
+        {str(budget_id): str(used) for budget_id, used in totals.budgets.items()}
+    ))
+    return totals
+
+def get_totals(userdetails, period):
+    """Get the totals of a period
+
+    Closed periods are read from their snapshot, taking one first if needed.
+    The open period is always calculated from its transactions.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to get totals of
+        period -> dontbudge.dashboard.utility.Period: Period to get totals of
+
+    Returns:
+        A dontbudge.api.snapshots.Totals
+    """
+    if not is_closed(userdetails, period):
+        return calculate(userdetails, period)
+
+    summary = PeriodSummary.query.filter_by(user_id=userdetails.id, start=period.start, end=period.end).first()
+    if summary is None:
+        totals = take(userdetails, period)
+        db.session.commit()
+        return totals
+
+    return Totals(
+        summary.income,
+        summary.spending,
+        {name: Decimal(amount) for name, amount in summary.categories.items()},
+        {int(budget_id): Decimal(used) for budget_id, used in summary.budgets.items()}
+    )
+
+def invalidate(userdetails, *dates):
+    """Delete the snapshots of the periods containing any of the given dates
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User whose snapshots to delete
+        dates -> datetime: Dates of transactions that were created, edited or deleted
+    """
+    for day in dates:
+        PeriodSummary.query.filter(
+            PeriodSummary.user_id == userdetails.id,
+            PeriodSummary.start <= day,
+            PeriodSummary.end > day
+        ).delete(synchronize_session=False)
+
+def invalidate_from(userdetails, day):
+    """Delete the snapshots of the period containing a date and every later period
+
+    Used by bulk writes, where invalidating each changed date separately
+    would cost a query per transaction.
+    """
+    PeriodSummary.query.filter(
+        PeriodSummary.user_id == userdetails.id,
+        PeriodSummary.end > day
+    ).delete(synchronize_session=False)
+
+def clear(userdetails):
+    """Delete every snapshot of a user"""
+    PeriodSummary.query.filter_by(user_id=userdetails.id).delete(synchronize_session=False)
@@ -0,0 +1,22 @@
+"""Versions
+
+Every user has a data version, UserDetails.version, which is bumped by every
+write to anything they own. Derived data such as forecasts is cached under the
+version it was built from, so a cached value stays valid for exactly as long
+as that version is current and never has to be evicted explicitly.
+"""
+from dontbudge.api.models import UserDetails
+
+def bump(userdetails):
+    """Increment the data version of a user
+
+    The increment is done in SQL so concurrent writes cannot lose each other's
+    bumps. The caller is responsible for committing.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User whose data changed
+    """
+    UserDetails.query.filter_by(id=userdetails.id).update(
+        {UserDetails.version: UserDetails.version + 1},
+        synchronize_session=False
+    )
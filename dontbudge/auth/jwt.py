@@ -1,34 +1,209 @@
-from flask import request, redirect
+from flask import request, redirect, jsonify
+from collections import namedtuple
 from functools import wraps
 import datetime
+import secrets
+import time
 import jwt
 import dontbudge
-from dontbudge.auth.models import User
+from dontbudge.database import db
+from dontbudge.auth.models import User, RevokedToken
+from dontbudge.api.models import UserDetails
+from dontbudge.cache import MemoryBackend
+
+# Verified tokens are remembered for this many seconds, so the signature of a
+# token is only checked once in a while rather than on every request
+TOKEN_TTL = 300
+TOKEN_CACHE_SIZE = 4096
+# Users' token versions and revoked tokens are remembered for this many
+# seconds, so a logout handled by another process is seen within this long
+VERSION_TTL = 60
+SESSION_LENGTH = datetime.timedelta(days=1)
+
+_verified = MemoryBackend(TOKEN_CACHE_SIZE)
+_versions = MemoryBackend(TOKEN_CACHE_SIZE)
+
+TokenState = namedtuple('TokenState', [
+    'version',
+    'revoked'
+])
+
+class CurrentUser:
+    """The user a request is authenticated as
+
+    Made from the claims of a token whose version has been checked, so
+    authenticating only loads the UserDetails, which nearly every handler uses
+    anyway. The User row is loaded the first time it is used.
+    """
+    def __init__(self, id, username, token_version, claims=None):
+        self.id = id
+        self.username = username
+        self.token_version = token_version
+        self.claims = claims or {}
+        self._userdetails = None
+        self._model = None
+
+    @property
+    def userdetails(self):
+        """The user's dontbudge.api.models.UserDetails"""
+        if self._userdetails is None:
+            self._userdetails = UserDetails.query.filter_by(user_id=self.id).first()
+        return self._userdetails
+
+    @property
+    def model(self):
+        """The user's dontbudge.auth.models.User row"""
+        if self._model is None:
+            self._model = User.query.filter_by(id=self.id).first()
+        return self._model
+
+def verify_token(token):
+    """Get the claims of a token, if it is valid
+
+    Decoded claims are cached for TOKEN_TTL seconds, or until the token
+    expires if that is sooner.
+
+    Args:
+        token -> String: Encoded JWT token
+
+    Returns:
+        Dictionary of the token's claims, or None if the token is invalid or expired
+    """
+    now = time.time()
+    cached = _verified.get(token)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    try:
+        data = jwt.decode(token, dontbudge.SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+
+    expires = min(now + TOKEN_TTL, data.get('exp', now + TOKEN_TTL))
+    _verified.set(token, data.get('id'), data.get('ver', 0), (data, expires))
+    return data
+
+def forget_token(token):
+    """Drop a token from the verified token cache"""
+    _verified.delete(token)
+
+def get_token_state(user_id):
+    """Get the current token version of a user and the IDs of their revoked tokens
+
+    Both are read in one query and cached for VERSION_TTL seconds, so they are
+    only queried once in a while rather than on every request.
+
+    Args:
+        user_id -> Integer: ID of the User
+
+    Returns:
+        A TokenState, or None if the user does not exist
+    """
+    now = time.time()
+    cached = _versions.get(user_id)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    rows = db.session.query(User.token_version, RevokedToken.id).outerjoin(
+        RevokedToken,
+        (RevokedToken.user_id == User.id) & (RevokedToken.expires > datetime.datetime.utcnow())
+    ).filter(
+        User.id == user_id
+    ).all()
+    state = TokenState(rows[0][0], frozenset(id for version, id in rows if id)) if rows else None
+    _versions.set(user_id, user_id, state and state.version, (state, now + VERSION_TTL))
+    return state
+
+def forget_user(user_id):
+    """Drop a user's token version from the cache, after it changed or the user was deleted"""
+    _versions.delete(user_id)
+
+def revoke_token(claims):
+    """Revoke a single token, e.g. the one being logged out
+
+    Tokens issued before tokens had IDs can only be revoked along with every
+    other token of their user. The caller is responsible for committing.
+
+    Args:
+        claims -> Dictionary: Claims of the token, from verify_token
+    """
+    user_id = claims.get('id')
+    if not claims.get('jti'):
+        revoke(user_id)
+        return
+
+    now = datetime.datetime.utcnow()
+    RevokedToken.query.filter(
+        RevokedToken.user_id == user_id,
+        RevokedToken.expires <= now
+    ).delete(synchronize_session=False)
+    db.session.add(RevokedToken(claims['jti'], user_id, datetime.datetime.utcfromtimestamp(claims['exp'])))
+    forget_user(user_id)
+
+def revoke(user_id):
+    """Revoke every token issued to a user so far
+
+    Bumps the user's token version in SQL. The caller is responsible for
+    committing.
+    """
+    User.query.filter_by(id=user_id).update(
+        {User.token_version: User.token_version + 1},
+        synchronize_session=False
+    )
+    forget_user(user_id)
+
+def authenticate():
+    """Get the user a request is authenticated as, or None
+
+    The token is read from the token cookie, or from an 'Authorization: Bearer'
+    header for API clients. Tokens carry the user's token_version, which is
+    bumped on logout, so tokens issued before then are rejected even though
+    their signature is still valid. The version is checked against the
+    cached one from get_token_state, along with whether the token itself was
+    revoked by logging out. A user deleted since their state was cached has no
+    UserDetails any more, and is not authenticated either.
+    """
+    token = request.cookies.get('token')
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        token = header[len('Bearer '):]
+    if not token:
+        return None
+
+    data = verify_token(token)
+    if not data:
+        return None
+
+    state = get_token_state(data.get('id'))
+    if state is None or state.version != data.get('ver', 0) or data.get('jti') in state.revoked:
+        return None
+    user = CurrentUser(data['id'], data.get('username'), state.version, data)
+    if user.userdetails is None:
+        return None
+    return user
 
 def token_required(f):
+    """Requires an authenticated user, redirecting to the login page if there is none"""
     @wraps(f)
     def decorator(*args, **kwargs):
-        token = None
-        try:
-            token = request.cookies.get('token')
-        except:
-            pass
-
-        if not token:
-            return redirect('/login')
-        try:
-            data = jwt.decode(token, dontbudge.SECRET, algorithms=['HS256'])
-            user = User.query.filter_by(id=data['id']).first()
-        except:
+        user = authenticate()
+        if not user:
             return redirect('/login')
+        return f(user, *args, **kwargs)
+    return decorator
 
+def api_token_required(f):
+    """Requires an authenticated user, responding with a JSON 401 if there is none"""
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        user = authenticate()
         if not user:
-            return redirect('/login')
- 
+            return jsonify({'error': 'Authentication required'}), 401
         return f(user, *args, **kwargs)
     return decorator
 
 def create_token(user, remember):
-    exp = 9999999999 if remember else datetime.now()
-    token = jwt.encode({'id': user.id, 'username': user.username, 'exp': exp}, dontbudge.SECRET)
-    return token
\ No newline at end of file
+    now = datetime.datetime.now(datetime.timezone.utc)
+    exp = 9999999999 if remember else now + SESSION_LENGTH
+    token = jwt.encode({'id': user.id, 'username': user.username, 'ver': user.token_version, 'jti': secrets.token_hex(16), 'exp': exp}, dontbudge.SECRET)
+    return token
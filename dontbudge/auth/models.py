@@ -6,8 +6,24 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True)
     password = db.Column(db.String(100))
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     userdetails = relationship('UserDetails', uselist=False, backref='user', cascade='delete')
 
     def __init__(self, username, password):
         self.username = username
-        self.password = password
\ No newline at end of file
+        self.password = password
+        self.token_version = 0
+class RevokedToken(db.Model):
+    """A token revoked before it expired, by logging out"""
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        db.Index('ix_revoked_tokens_user_id', 'user_id'),
+    )
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
+    expires = db.Column(db.DateTime)
+
+    def __init__(self, id, user_id, expires):
+        self.id = id
+        self.user_id = user_id
+        self.expires = expires
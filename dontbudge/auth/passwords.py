@@ -0,0 +1,106 @@
+"""Passwords
+
+Hashes and verifies passwords with scrypt, a memory-hard key derivation
+function. Hashes are stored as 'scrypt$n$r$p$salt$hash', with the salt and hash
+in unpadded base64, so the cost a hash was made with is kept alongside it and
+can be raised later without breaking existing passwords.
+
+Passwords hashed before this module existed are unsalted MD5 hex digests.
+They still verify, and are reported as needing a rehash so login can replace
+them with an scrypt hash while the plain password is at hand.
+
+Hashing is deliberately slow, and runs in the request's own thread. Gunicorn's
+sync workers handle one request at a time, so at most one hash runs in each
+worker and the number of workers bounds how many run at once.
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+# Defaults cost tens of milliseconds and 16MB per hash, see benchmarks/passwords.py to tune
+N = 2 ** 14
+R = 8
+P = 1
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+_cost = (N, R, P)
+
+def configure(n=N, r=R, p=P):
+    """Set the scrypt cost of new hashes"""
+    global _cost
+    _cost = (n, r, p)
+
+def _encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+def _decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def derive(password, salt, n, r, p):
+    """Derive the scrypt key of a password"""
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=KEY_SIZE)
+
+def hash_password(password):
+    """Hash a password with the configured cost
+
+    Args:
+        password -> String: Plain text password
+
+    Returns:
+        String hash to store in User.password
+    """
+    n, r, p = _cost
+    salt = os.urandom(SALT_SIZE)
+    return f'scrypt${n}${r}${p}${_encode(salt)}${_encode(derive(password, salt, n, r, p))}'
+
+def verify_password(password, stored):
+    """Check a password against a stored hash
+
+    Args:
+        password -> String: Plain text password
+        stored -> String: Hash from User.password, either scrypt or legacy MD5
+
+    Returns:
+        Tuple of whether the password matches, and whether the stored hash is
+        a legacy hash or was made with a different cost and should be replaced
+    """
+    if not stored.startswith('scrypt$'):
+        legacy = hashlib.md5(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+
+    try:
+        _, n, r, p, salt, key = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+    except ValueError:
+        return False, False
+    matches = hmac.compare_digest(derive(password, _decode(salt), n, r, p), _decode(key))
+    return matches, (n, r, p) != _cost
+
+def check_user_password(user, password):
+    """Check the password of a User, upgrading their stored hash if it is outdated
+
+    Legacy MD5 hashes and hashes made with a different cost are replaced on
+    the User while the plain password is at hand. The caller is responsible
+    for committing.
+
+    Args:
+        user -> dontbudge.auth.models.User: User logging in
+        password -> String: Plain text password
+
+    Returns:
+        Boolean whether the password matches
+    """
+    matches, outdated = verify_password(password, user.password)
+    if matches and outdated:
+        user.password = hash_password(password)
+    return matches
+
+def init_app(app):
+    """Configures password hashing from the Flask app's config"""
+    configure(
+        app.config.get('SCRYPT_N', N),
+        app.config.get('SCRYPT_R', R),
+        app.config.get('SCRYPT_P', P)
+    )
@@ -1,13 +1,13 @@
 from flask import Blueprint, request, render_template, flash, redirect, session
 from datetime import date
-import hashlib
 from flask.helpers import make_response
 from dontbudge.auth.forms import RegisterForm, LoginForm
 from dontbudge.database import db
 from dontbudge.api.models import UserDetails
 from dontbudge.auth.models import User
 from dateutil.relativedelta import relativedelta
-from dontbudge.auth.jwt import create_token, token_required
+from dontbudge.auth.jwt import create_token, forget_token, revoke_token, token_required
+from dontbudge.auth.passwords import hash_password, check_user_password
 
 auth = Blueprint('auth', __name__, template_folder='templates')
 
@@ -22,9 +22,8 @@ def register():
                 flash('User already exists.')
                 return redirect('/register')
             password = form.password.data
-            password_hash = hashlib.md5(password.encode())
 
-            user = User(username, password_hash.hexdigest())
+            user = User(username, hash_password(password))
             db.session.add(user)
             db.session.commit()
 
@@ -46,18 +45,19 @@ def login():
         if form.validate_on_submit():
             # Check user exists
             username = form.username.data.lower()
-            if not User.query.filter_by(username=username).first():
+            user = User.query.filter_by(username=username).first()
+            if not user:
                 flash('Incorrect username or password.')
                 return redirect('/login')
-            password = form.password.data
-            password_hash = hashlib.md5(password.encode())
 
-            user = User.query.filter_by(username=username).first()
-            if password_hash.hexdigest() == user.password:
+            if check_user_password(user, form.password.data):
+                # Saves the upgraded hash of a legacy or outdated password
+                db.session.commit()
+
                 expires = None
-                if form.remember:
+                if form.remember.data:
                     expires = date.today() + relativedelta(months=1)
-                token = create_token(user, form.remember)
+                token = create_token(user, form.remember.data)
                 response = make_response(redirect('/'))
                 response.set_cookie('token', token, expires=expires)
                 return response
@@ -69,6 +69,10 @@ def login():
 @auth.route('/logout')
 @token_required
 def logout(user):
+    revoke_token(user.claims)
+    db.session.commit()
+    forget_token(request.cookies.get('token'))
+
     response = make_response(redirect('/login'))
     response.delete_cookie('token')
     return response
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""Cache
+
+Caches data derived from a user's transactions, such as the dashboard summary,
+budget usage and period totals, so pages can be rendered again without
+rebuilding it while nothing has changed.
+
+Entries are keyed by the user's data version (see dontbudge.api.versions),
+which every write bumps, so an entry is never stale and never has to be
+evicted by hand: the next read after a write simply misses and rebuilds.
+
+Every process keeps its own in-memory LRU. When DONTBUDGE_CACHE is set to a
+file path, entries are also stored in a SQLite file there, shared by every
+gunicorn worker on the machine, so a value built by one worker is reused by
+the others. Cached values must be picklable plain data, e.g. named tuples,
+and never models, which belong to the session that loaded them.
+"""
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_SIZE = 1024
+
+class MemoryBackend:
+    """In-process least recently used cache"""
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, user_id, version, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class SQLiteBackend:
+    """Cache stored in a SQLite file, shared between processes
+
+    Storing an entry deletes the user's entries from older versions, so the
+    file only ever holds entries that can still be read. Any error reading or
+    writing the file is treated as a miss, the cache is never required for a
+    request to succeed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        if getattr(self.local, 'connection', None) is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, user_id INTEGER, version INTEGER, value BLOB)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_cache_user_id_version ON cache (user_id, version)')
+            self.local.connection = connection
+        return self.local.connection
+
+    def get(self, key):
+        try:
+            row = self.connect().execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            return pickle.loads(row[0]) if row else None
+        except (sqlite3.Error, pickle.PickleError, EOFError, AttributeError):
+            return None
+
+    def set(self, key, user_id, version, value):
+        try:
+            connection = self.connect()
+            with connection:
+                connection.execute('BEGIN')
+                connection.execute('DELETE FROM cache WHERE user_id = ? AND version < ?', (user_id, version))
+                connection.execute(
+                    'INSERT OR REPLACE INTO cache (key, user_id, version, value) VALUES (?, ?, ?, ?)',
+                    (key, user_id, version, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                )
+        except sqlite3.Error:
+            pass
+
+class Cache:
+    """Per-user derived data cache with an optional shared second tier"""
+    def __init__(self):
+        self.memory = MemoryBackend()
+        self.shared = None
+
+    def configure(self, size=CACHE_SIZE, path=None):
+        self.memory = MemoryBackend(size)
+        self.shared = SQLiteBackend(path) if path else None
+
+    def get(self, name, userdetails, build, *args):
+        """Get a value derived from a user's data, building it on a miss
+
+        Args:
+            name -> String: Name of the derived value, unique to its build function
+            userdetails -> dontbudge.api.models.UserDetails: User the value is derived from
+            build -> Function: Called with userdetails and args to build the value
+            args -> Hashable: Any other arguments the value depends on
+
+        Returns:
+            The cached or newly built value
+        """
+        version = userdetails.version
+        key = f'{name}:{userdetails.id}:{version}:{args!r}'
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.shared:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.set(key, userdetails.id, version, value)
+                return value
+
+        value = build(userdetails, *args)
+        self.memory.set(key, userdetails.id, version, value)
+        if self.shared:
+            self.shared.set(key, userdetails.id, version, value)
+        return value
+
+cache = Cache()
+
+def init_app(app):
+    """Configures the cache from the Flask app's config"""
+    cache.configure(app.config.get('CACHE_SIZE', CACHE_SIZE), app.config.get('CACHE_PATH'))
@@ -0,0 +1,116 @@
+"""Commands
+
+Maintenance commands available through the flask CLI, e.g.
+`FLASK_APP=run flask balances verify`.
+"""
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from dontbudge import migrations, scheduler
+from dontbudge.database import db
+from dontbudge.api import balances, importer
+from dontbudge.api.models import Account
+from dontbudge.auth.models import User
+
+balances_cli = AppGroup('balances', help='Check or rebuild materialised account balances.')
+
+@balances_cli.command('verify')
+@click.option('--fix', is_flag=True, help='Overwrite drifted balances with the recalculated value.')
+def verify_balances(fix):
+    """Recalculate every account balance from its transactions and report drift"""
+    drifted = balances.verify(fix=fix)
+    for account, stored, expected in drifted:
+        click.echo(f'Account {account.id} ({account.name}): stored {stored}, expected {expected}')
+
+    if not drifted:
+        click.echo('All balances match their transaction history.')
+    elif fix:
+        click.echo(f'Rebuilt {len(drifted)} balance(s).')
+    else:
+        raise SystemExit(1)
+
+@balances_cli.command('rebuild')
+def rebuild_balances():
+    """Rebuild every account balance from its transactions"""
+    drifted = balances.verify(fix=True)
+    click.echo(f'Rebuilt {len(drifted)} balance(s).')
+
+schema_cli = AppGroup('schema', help='Inspect or apply schema migrations.')
+
+@schema_cli.command('pending')
+def pending_migrations():
+    """List the migrations that have not been applied"""
+    for f in migrations.get_pending():
+        click.echo(f.__name__)
+
+@schema_cli.command('upgrade')
+def upgrade_schema():
+    """Apply every pending migration"""
+    for name in migrations.upgrade():
+        click.echo(f'Applied {name}')
+
+transactions_cli = AppGroup('transactions', help='Bulk transaction tools.')
+
+@transactions_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username of the account owner.')
+@click.option('--account', 'account_name', required=True, help='Name or ID of the account to import into.')
+@click.option('--format', 'format', type=click.Choice(importer.FORMATS), help='Export format, guessed from the file extension if not given.')
+@click.option('--date-format', help='strptime format of CSV and QIF dates.')
+@click.option('--date-column', default='date', show_default=True, help='CSV header of the date column.')
+@click.option('--description-column', default='description', show_default=True, help='CSV header of the description column.')
+@click.option('--amount-column', default='amount', show_default=True, help='CSV header of the signed amount column.')
+@click.option('--debit-column', help='CSV header of the money out column, if there is no amount column.')
+@click.option('--credit-column', help='CSV header of the money in column, if there is no amount column.')
+@click.option('--category-column', help='CSV header of a column of category names.')
+def import_transactions(path, username, account_name, format, date_format, date_column, description_column, amount_column, debit_column, credit_column, category_column):
+    """Import transactions from a CSV, OFX or QIF export"""
+    user = User.query.filter_by(username=username.lower()).first()
+    if not user:
+        raise click.ClickException(f'User {username} not found')
+    userdetails = user.userdetails
+
+    account = Account.query.filter_by(user_id=userdetails.id, name=account_name).first()
+    if not account and account_name.isdigit():
+        account = Account.query.filter_by(user_id=userdetails.id, id=int(account_name)).first()
+    if not account:
+        raise click.ClickException(f'Account {account_name} not found')
+
+    format = format or importer.detect_format(path)
+    if not format:
+        raise click.ClickException('Could not tell the format from the file extension, use --format')
+
+    if debit_column or credit_column:
+        amount_column = None
+    columns = importer.Columns(date_column, description_column, amount_column, debit_column, credit_column, category_column)
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as stream:
+        result = importer.import_transactions(userdetails, account, stream, format, columns, date_format)
+    click.echo(f'Read {result.read} row(s): imported {result.imported}, {result.duplicates} duplicate(s), {result.skipped} unreadable.')
+
+scheduler_cli = AppGroup('scheduler', help='Run the background jobs.')
+
+@scheduler_cli.command('run')
+@click.option('--once', is_flag=True, help='Run once and exit, e.g. from cron, rather than every interval.')
+@click.option('--interval', type=int, help='Seconds between runs, defaults to DONTBUDGE_SCHEDULER_INTERVAL or an hour.')
+def run_scheduler(once, interval):
+    """Pay due bills, roll periods over and take snapshots for every user"""
+    interval = interval or current_app.config.get('SCHEDULER_INTERVAL', scheduler.INTERVAL)
+    while True:
+        # A single run releases the lease straight away, ready for the next
+        result = scheduler.run(0 if once else interval)
+        if result is None:
+            click.echo('Another process holds the scheduler lease.')
+        else:
+            click.echo(f'Updated {result.users} user(s): paid {result.payments} bill(s), closed {result.periods} period(s) and took {result.snapshots} snapshot(s).')
+        if once:
+            raise SystemExit(0 if result else 1)
+        db.session.remove()
+        time.sleep(interval)
+
+def init_app(app):
+    """Registers the CLI commands with the Flask app"""
+    app.cli.add_command(balances_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(transactions_cli)
+    app.cli.add_command(scheduler_cli)
@@ -0,0 +1,202 @@
+"""Dashboard Aggregation
+
+Builds everything the dashboard index displays from a single ordered walk over
+a user's transactions. The most recent transactions of each account, category
+spending and budget usage for the latest period are all collected together,
+rather than re-sorting and re-filtering every account's transactions once per
+figure. The walk adds up integer cents, and only the totals are converted to
+Decimal. Balances come from the materialised Account.balance column.
+
+The results are plain named tuples so they can be handed straight to templates.
+"""
+from collections import namedtuple, deque
+from datetime import date
+from dontbudge.database import db
+from dontbudge.money import cents, from_cents
+from dontbudge.api.models import Transaction, Category
+from dontbudge.api import balances, snapshots, versions
+from dontbudge.dashboard import utility, schedule
+
+Summary = namedtuple('Summary', [
+    'accounts',
+    'budgets',
+    'budget_chart',
+    'category_chart',
+    'bills',
+    'previous_bills',
+    'total_bill_amount',
+    'overview_chart'
+])
+
+AccountSummary = namedtuple('AccountSummary', [
+    'id',
+    'name',
+    'balance',
+    'transactions'
+])
+
+BudgetSummary = namedtuple('BudgetSummary', [
+    'id',
+    'name',
+    'amount',
+    'used'
+])
+
+TransactionSummary = namedtuple('TransactionSummary', [
+    'id',
+    'description',
+    'amount',
+    'date'
+])
+
+def update_period(userdetails, today=None):
+    """Move a user on to the period containing today, if their current one has ended
+
+    Catches up on every period that ended since, for users who have not been
+    seen for a while. A snapshot is kept of each period closed, and the change
+    is committed.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to update
+        today -> date: Date to update to, defaults to today
+
+    Returns:
+        Integer number of periods closed
+    """
+    today = today or date.today()
+    range = utility.get_relative(userdetails.range)
+    closed = 0
+    while today >= userdetails.period_end.date():
+        period = utility.Period(userdetails.period_start, userdetails.period_end)
+        userdetails.period_start = userdetails.period_end
+        userdetails.period_end += range
+        snapshots.take(userdetails, period)
+        closed += 1
+
+    if closed:
+        versions.bump(userdetails)
+        db.session.commit()
+    return closed
+
+def get_transaction_rows(userdetails):
+    """Get the columns of every transaction of a user needed for aggregation
+
+    Issues one query, ordered by date, that also resolves the category name so
+    no relationship has to be lazily loaded per transaction. Amounts are
+    selected as raw integer cents.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to get transactions of
+
+    Returns:
+        List of rows with id, account_id, budget_id, description, date, cents and category
+    """
+    return db.session.query(
+        Transaction.id,
+        Transaction.account_id,
+        Transaction.budget_id,
+        Transaction.description,
+        Transaction.date,
+        cents(Transaction.amount).label('cents'),
+        Category.name.label('category')
+    ).outerjoin(
+        Category, Transaction.category_id == Category.id
+    ).filter(
+        Transaction.user_id == userdetails.id
+    ).order_by(
+        Transaction.date, Transaction.id
+    ).all()
+
+def summarise(userdetails, recent=5):
+    """Summarise a user for the dashboard index
+
+    Walks the user's transactions once in date order. The last few
+    transactions of each account are collected on the way through, and
+    since the latest period is always a suffix of the ordered transactions,
+    category spending and budget usage are found by stepping back from the end,
+    or read from the period's snapshot if it has closed.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to summarise
+        recent -> Integer: Number of recent transactions to keep per account
+
+    Returns:
+        A dontbudge.dashboard.aggregation.Summary
+    """
+    rows = get_transaction_rows(userdetails)
+
+    latest = {}
+    for row in rows:
+        if row.account_id not in latest:
+            latest[row.account_id] = deque(maxlen=recent)
+        latest[row.account_id].append(row)
+
+    # Category spending and budget usage in the latest period, read from its
+    # snapshot if the period has already closed
+    used = {}
+    category_chart = {}
+    if rows:
+        period = utility.get_period(userdetails, rows[-1].date)
+        if snapshots.is_closed(userdetails, period):
+            totals = snapshots.get_totals(userdetails, period)
+            used = totals.budgets
+            category_chart = totals.categories
+        else:
+            for row in reversed(rows):
+                if row.date < period.start:
+                    break
+                if row.date >= period.end:
+                    continue
+                if row.budget_id is not None:
+                    used[row.budget_id] = used.get(row.budget_id, 0) - row.cents
+                if row.cents < 0:
+                    category = row.category if row.category else 'None'
+                    category_chart[category] = category_chart.get(category, 0) - row.cents
+            used = {budget_id: from_cents(total) for budget_id, total in used.items()}
+            category_chart = {category: from_cents(total) for category, total in category_chart.items()}
+
+    accounts = []
+    total_balance = 0
+    for account in userdetails.accounts:
+        balance = balances.get_balance(account)
+        total_balance += balance
+        transactions = [
+            TransactionSummary(row.id, row.description, from_cents(row.cents), row.date)
+            for row in reversed(latest.get(account.id, ()))
+        ]
+        accounts.append(AccountSummary(account.id, account.name, balance, transactions))
+
+    budgets = []
+    budget_total = 0
+    used_total = 0
+    budget_chart = []
+    for budget in userdetails.budgets:
+        budget_used = used.get(budget.id, 0)
+        budget_total += budget.amount
+        used_total += budget_used
+        percent = (budget_used / budget.amount) * 100 if budget.amount else 0
+        budget_chart.append({'name': budget.name, 'percent': percent})
+        budgets.append(BudgetSummary(budget.id, budget.name, budget.amount, budget_used))
+    budgets.append(BudgetSummary(None, 'Total', budget_total, used_total))
+
+    bills, previous_bills, total_bill_amount = schedule.get_due(userdetails)
+
+    # Period overview chart
+    overview_chart = {
+        'Budgets': budget_total - used_total,
+        'Bills': total_bill_amount,
+        'Remaining': total_balance - (budget_total - used_total) - total_bill_amount
+    }
+
+    return Summary(accounts, budgets, budget_chart, category_chart, bills, previous_bills, total_bill_amount, overview_chart)
+
+def summarise_budgets(userdetails):
+    """Get every budget of a user with how much of it is used
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to get budgets of
+
+    Returns:
+        List of dontbudge.dashboard.aggregation.BudgetSummary's
+    """
+    return [BudgetSummary(budget.id, budget.name, budget.amount, used) for budget, used in utility.get_budgets(userdetails)]
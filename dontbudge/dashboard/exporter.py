@@ -0,0 +1,144 @@
+"""Exporter
+
+Exports a user's transactions, period totals and budget reports as CSV or
+newline delimited JSON (NDJSON).
+
+Exports are generators meant to be streamed straight into a response. Rows
+are fetched from the database in batches through a streaming result and
+encoded a few at a time, so memory use does not grow with the length of the
+history and the first bytes reach the client before the last rows are read.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from dontbudge.database import db
+from dontbudge.api.models import Transaction, Account, Category, Budget, Bill
+from dontbudge.api import snapshots
+from dontbudge.dashboard import utility
+
+REPORTS = ('transactions', 'periods', 'budgets')
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+BATCH_SIZE = 1000
+
+Report = namedtuple('Report', [
+    'fields',
+    'rows'
+])
+
+def get_transactions(userdetails, account_id=None, start=None, end=None):
+    """Report every transaction of a user, oldest first
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to export
+        account_id -> Integer: Optionally only export one account
+        start -> datetime: Optional inclusive lower bound on transaction dates
+        end -> datetime: Optional exclusive upper bound on transaction dates
+
+    Returns:
+        A dontbudge.dashboard.exporter.Report
+    """
+    account, category, budget, bill = aliased(Account), aliased(Category), aliased(Budget), aliased(Bill)
+    statement = select(
+        Transaction.id,
+        Transaction.date,
+        Transaction.description,
+        Transaction.amount,
+        account.name,
+        category.name,
+        budget.name,
+        bill.name
+    ).outerjoin(
+        account, Transaction.account_id == account.id
+    ).outerjoin(
+        category, Transaction.category_id == category.id
+    ).outerjoin(
+        budget, Transaction.budget_id == budget.id
+    ).outerjoin(
+        bill, Transaction.bill_id == bill.id
+    ).where(
+        Transaction.user_id == userdetails.id
+    ).order_by(
+        Transaction.date, Transaction.id
+    )
+    if account_id is not None:
+        statement = statement.where(Transaction.account_id == account_id)
+    if start is not None:
+        statement = statement.where(Transaction.date >= start)
+    if end is not None:
+        statement = statement.where(Transaction.date < end)
+
+    def rows():
+        result = db.session.execute(statement.execution_options(stream_results=True)).yield_per(BATCH_SIZE)
+        for row in result:
+            yield tuple(row)
+
+    return Report(['id', 'date', 'description', 'amount', 'account', 'category', 'budget', 'bill'], rows())
+
+def get_periods(userdetails):
+    """Report the income and spending of every period a user has transactions in
+
+    Closed periods are read from their snapshots, one period at a time.
+    """
+    def rows():
+        for period in utility.get_periods(userdetails):
+            totals = snapshots.get_totals(userdetails, period)
+            yield (period.start, period.end, totals.income, totals.spending, totals.income - totals.spending)
+
+    return Report(['start', 'end', 'income', 'spending', 'net'], rows())
+
+def get_budgets(userdetails):
+    """Report how much of each budget was used in every period a user has transactions in"""
+    budgets = [(budget.id, budget.name, budget.amount) for budget in userdetails.budgets]
+
+    def rows():
+        for period in utility.get_periods(userdetails):
+            used = snapshots.get_totals(userdetails, period).budgets
+            for id, name, amount in budgets:
+                spent = used.get(id, 0)
+                yield (period.start, period.end, name, amount, spent, amount - spent)
+
+    return Report(['start', 'end', 'budget', 'amount', 'used', 'remaining'], rows())
+
+def get_report(userdetails, report, **filters):
+    """Get a report by name, one of REPORTS"""
+    if report == 'transactions':
+        return get_transactions(userdetails, **filters)
+    if report == 'periods':
+        return get_periods(userdetails)
+    if report == 'budgets':
+        return get_budgets(userdetails)
+    raise ValueError(f'Unknown report {report}')
+
+def to_csv(report):
+    """Encode a report as CSV, a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(report.fields)
+    for i, row in enumerate(report.rows, 1):
+        writer.writerow(row)
+        if i % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def to_ndjson(report):
+    """Encode a report as one JSON object per line, a chunk of rows at a time"""
+    lines = []
+    for row in report.rows:
+        lines.append(json.dumps(dict(zip(report.fields, row)), default=str))
+        if len(lines) == BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def encode(report, format):
+    """Encode a report in a format, one of FORMATS"""
+    return to_csv(report) if format == 'csv' else to_ndjson(report)
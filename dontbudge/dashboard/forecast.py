@@ -0,0 +1,159 @@
+"""Cashflow Forecast
+
+Projects the daily balance of every account of a user a number of periods
+ahead. Starting from its current balance, each day an account:
+
+* gains or loses its average unplanned flow, the daily net amount of its
+  recent transactions that were not paid to a bill or budget,
+* pays any bills that fall due, and
+* spends an even share of each budget over the days of the budget's period.
+
+Bills and budgets are paid from the account they are usually paid from, or the
+user's first account if they have never been paid.
+
+Each account's projection is a list of daily changes turned into balances with
+itertools.accumulate, so the cost grows with the number of days and accounts
+rather than with the number of transactions or bill occurences. Forecasts are
+cached (see dontbudge.cache), so repeat requests do no work until something
+changes.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from dontbudge.cache import cache
+from dontbudge.api.models import Transaction
+from dontbudge.api import queries, balances
+from dontbudge.dashboard import utility, schedule
+
+PERIODS = 6
+MAX_PERIODS = 260
+HISTORY = 90
+MAX_HISTORY = 3650
+
+Forecast = namedtuple('Forecast', [
+    'start',
+    'days',
+    'accounts',
+    'total'
+])
+
+AccountForecast = namedtuple('AccountForecast', [
+    'id',
+    'name',
+    'balance',
+    'flow',
+    'balances'
+])
+
+def get_current_period(userdetails, day):
+    """Get the period containing a date on or after the start of the current period
+
+    Unlike utility.get_period this also works for dates after the current
+    period, for users the index has not rolled forward yet.
+    """
+    steps = utility.get_steps(userdetails.period_start, utility.get_relative(userdetails.range), day)
+    return utility.get_period_from_index(userdetails, max(steps, 0))
+
+def get_flows(userdetails, start, history):
+    """Get the average daily unplanned flow of each account over the history before start"""
+    earliest = queries.get_earliest_transaction_date(userdetails.id)
+    if earliest is None:
+        return {}
+    lookback = start - timedelta(days=history)
+    span = max((start - max(lookback, earliest)).days, 1)
+    totals = queries.get_unplanned_flow(userdetails.id, lookback, start)
+    return {account_id: float(total) / span for account_id, total in totals.items()}
+
+def add_bills(userdetails, changes, default, start, days):
+    """Take every bill occurence in the window off the account it is paid from
+
+    Occurences before the window are overdue and taken off on the first day.
+    """
+    usual = queries.get_usual_accounts(userdetails.id, Transaction.bill_id)
+    grouped = {}
+    for bill in userdetails.bills:
+        account_id = usual.get(bill.id)
+        grouped.setdefault(account_id if account_id in changes else default, []).append(bill)
+
+    for account_id, bills in grouped.items():
+        column = changes[account_id]
+        column[0] -= sum(float(bill.amount) * schedule.count_occurrences(bill, bill.start, start) for bill in bills)
+        for i, amount in enumerate(schedule.get_daily_totals(bills, start, days)):
+            if amount:
+                column[i] -= float(amount)
+
+def add_budgets(userdetails, changes, default, start, days, current, periods):
+    """Spread every budget over the days of each period in the window
+
+    What is left of a budget in the current period is spread over the days
+    left in it, and the full amount over the days of every later period.
+    """
+    usage = queries.get_budget_usage(userdetails.id, current.start, current.end)
+    usual = queries.get_usual_accounts(userdetails.id, Transaction.budget_id)
+    remaining = {}
+    full = {}
+    for budget in userdetails.budgets:
+        account_id = usual.get(budget.id)
+        account_id = account_id if account_id in changes else default
+        left = max(budget.amount - usage.get(budget.id, 0), 0)
+        remaining[account_id] = remaining.get(account_id, 0) + float(left)
+        full[account_id] = full.get(account_id, 0) + float(budget.amount)
+
+    # Day indexes each period covers within the window, shared by every account
+    step = utility.get_relative(userdetails.range)
+    first_index = utility.get_steps(userdetails.period_start, step, current.start)
+    boundaries = [userdetails.period_start + step * (first_index + index) for index in range(periods + 2)]
+    windows = [(max((boundaries[i] - start).days, 0), min((boundaries[i + 1] - start).days, days)) for i in range(periods + 1)]
+
+    for account_id, column in changes.items():
+        for index, (first, last) in enumerate(windows):
+            amount = remaining.get(account_id, 0) if index == 0 else full.get(account_id, 0)
+            if amount and last > first:
+                daily = amount / (last - first)
+                for i in range(first, last):
+                    column[i] -= daily
+
+def project(userdetails, periods=PERIODS, history=HISTORY, today=None):
+    """Project the daily balance of every account of a user
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to forecast
+        periods -> Integer: Number of periods to forecast after the current one
+        history -> Integer: Number of days of history to average unplanned flow over
+        today -> date: Day to start the forecast from, defaults to today
+
+    Returns:
+        A dontbudge.dashboard.forecast.Forecast, with each account's projected
+        balance at the end of every day from today until the end of the last
+        period, and the total of all accounts on each of those days
+    """
+    today = today if today else date.today()
+    start = datetime(today.year, today.month, today.day)
+    current = get_current_period(userdetails, start)
+    end = current.end + utility.get_relative(userdetails.range) * periods
+    days = (end - start).days
+
+    accounts = sorted(userdetails.accounts, key=lambda account: account.id)
+    if not accounts:
+        return Forecast(start, days, [], [0.0] * days)
+
+    flows = get_flows(userdetails, start, history)
+    changes = {account.id: [flows.get(account.id, 0.0)] * days for account in accounts}
+    add_bills(userdetails, changes, accounts[0].id, start, days)
+    add_budgets(userdetails, changes, accounts[0].id, start, days, current, periods)
+
+    projections = []
+    for account in accounts:
+        balance = float(balances.get_balance(account))
+        projected = [round(value, 2) for value in accumulate(changes[account.id], initial=balance)]
+        projections.append(AccountForecast(account.id, account.name, balance, round(flows.get(account.id, 0.0), 2), projected[1:]))
+
+    total = [round(sum(day), 2) for day in zip(*(projection.balances for projection in projections))]
+    return Forecast(start, days, projections, total)
+
+def get_forecast(userdetails, periods=PERIODS, history=HISTORY):
+    """Get the forecast of a user, reusing a cached one while their data is unchanged
+
+    Args and returns are the same as project.
+    """
+    return cache.get('forecast', userdetails, project, periods, history, date.today())
@@ -7,25 +7,47 @@ validation.
 Author: Josh Rogers (2021)
 """
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired
 from wtforms import StringField, SubmitField, DateField, SelectField, DecimalField
 from wtforms.fields.simple import HiddenField
-from wtforms.validators import DataRequired, NumberRange, Optional, AnyOf
+from wtforms.validators import DataRequired, InputRequired, NumberRange, Optional, AnyOf
+from dontbudge.money import CENT, MAX_AMOUNT
+
+class MoneyField(DecimalField):
+    """Decimal field for an amount of money, allowing at most cents"""
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, places=2, **kwargs)
+
+    def process_formdata(self, valuelist):
+        super().process_formdata(valuelist)
+        if self.data is not None and self.data != self.data.quantize(CENT):
+            self.data = None
+            raise ValueError(self.gettext('Amounts can not be smaller than a cent.'))
+        if self.data is not None and abs(self.data) >= MAX_AMOUNT:
+            self.data = None
+            raise ValueError(self.gettext('Amount is too large.'))
+
+def optional_id(value):
+    """Coerce a select field's value to a row ID, with the 'None' option as None"""
+    if value is None or value in ('', 'None'):
+        return None
+    return int(value)
 
 class AccountForm(FlaskForm):
     """Form for creating a new Account"""
     name = StringField('Account Name', validators=[DataRequired()])
-    starting_balance = DecimalField('Starting Balance', validators=[DataRequired()])
+    starting_balance = MoneyField('Starting Balance', validators=[DataRequired()])
     submit = SubmitField('Submit')
 
 class TransactionForm(FlaskForm):
     """Form for creating a new Transaction"""
     description = StringField('Description', validators=[DataRequired()])
-    account = SelectField('Account', validators=[DataRequired()])
-    amount = DecimalField('Amount', validators=[DataRequired(), NumberRange(min=0)])
+    account = SelectField('Account', coerce=optional_id, validators=[InputRequired()])
+    amount = MoneyField('Amount', validators=[DataRequired(), NumberRange(min=0)])
     date = DateField('Date', validators=[DataRequired()])
-    category = SelectField('Category', validators=[Optional()])
-    budget = SelectField('Budget', validators=[Optional()])
-    bill = SelectField('Bill', validators=[Optional()])
+    category = SelectField('Category', coerce=optional_id, validators=[Optional()])
+    budget = SelectField('Budget', coerce=optional_id, validators=[Optional()])
+    bill = SelectField('Bill', coerce=optional_id, validators=[Optional()])
     type = HiddenField('type', validators=[AnyOf(('deposit', 'withdraw'))])
     submit = SubmitField('Submit')
 
@@ -44,7 +66,8 @@ class BillForm(FlaskForm):
         ],
         validators = [DataRequired()]
     )
-    amount = DecimalField('Amount', validators=[DataRequired(), NumberRange(min=0)])
+    amount = MoneyField('Amount', validators=[DataRequired(), NumberRange(min=0)])
+    account = SelectField('Pay Automatically From', coerce=optional_id, validators=[Optional()])
     submit = SubmitField('Submit')
 
 class SettingsForm(FlaskForm):
@@ -71,9 +94,29 @@ class CategoryForm(FlaskForm):
 class BudgetForm(FlaskForm):
     """Form for creating a Budget"""
     name = StringField('Name', validators=[DataRequired()])
-    amount = DecimalField('Amount', validators=[DataRequired(), NumberRange(min=0)])
+    amount = MoneyField('Amount', validators=[DataRequired(), NumberRange(min=0)])
     submit = SubmitField('Submit')
 
+class ImportForm(FlaskForm):
+    """Form for importing a bank export file"""
+    file = FileField('Export File', validators=[FileRequired()])
+    account = SelectField('Account', coerce=int, validators=[DataRequired()])
+    format = SelectField(
+        'Format',
+        choices = [
+            ('auto', 'From File Extension'),
+            ('csv', 'CSV'),
+            ('ofx', 'OFX / QFX'),
+            ('qif', 'QIF')
+        ],
+        validators = [DataRequired()]
+    )
+    date_format = StringField('Date Format', validators=[Optional()])
+    date_column = StringField('Date Column', default='date', validators=[Optional()])
+    description_column = StringField('Description Column', default='description', validators=[Optional()])
+    amount_column = StringField('Amount Column', default='amount', validators=[Optional()])
+    submit = SubmitField('Import')
+
 class DeleteForm(FlaskForm):
     """Form for deleting an Object"""
     submit = SubmitField('Yes')
\ No newline at end of file
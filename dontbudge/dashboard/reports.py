@@ -0,0 +1,68 @@
+"""Reports
+
+Reports over a user's whole history, too slow to build within a request, which
+are built by background jobs instead (see dontbudge.jobs):
+
+* years: Income, spending and net of every calendar year, with the change
+  from the year before.
+* categories: Spending in each category in every period, with its share of
+  the period's spending. Closed periods are read from their snapshots.
+
+Along with the exports of dontbudge.dashboard.exporter, they are exporter
+Reports, so they are encoded as CSV or NDJSON in the same way.
+"""
+from datetime import datetime
+from decimal import Decimal
+from dontbudge.api import queries, snapshots
+from dontbudge.dashboard import utility, exporter
+
+REPORTS = exporter.REPORTS + ('years', 'categories')
+
+def get_years(userdetails):
+    """Report the income and spending of every calendar year a user has transactions in"""
+    def rows():
+        earliest = queries.get_earliest_transaction_date(userdetails.id)
+        latest = queries.get_latest_transaction_date(userdetails.id)
+        if earliest is None:
+            return
+
+        previous = None
+        for year in range(earliest.year, latest.year + 1):
+            income, spending = queries.get_income_and_spending(userdetails.id, datetime(year, 1, 1), datetime(year + 1, 1, 1))
+            if previous:
+                income_change, spending_change = income - previous[0], spending - previous[1]
+            else:
+                income_change, spending_change = None, None
+            yield (year, income, spending, income - spending, income_change, spending_change)
+            previous = (income, spending)
+
+    return exporter.Report(['year', 'income', 'spending', 'net', 'income_change', 'spending_change'], rows())
+
+def get_categories(userdetails):
+    """Report the spending in each category in every period a user has transactions in"""
+    def rows():
+        for period in utility.get_periods(userdetails):
+            categories = snapshots.get_totals(userdetails, period).categories
+            total = sum(categories.values())
+            for name, spent in sorted(categories.items(), key=lambda item: item[1], reverse=True):
+                share = (spent * 100 / total).quantize(Decimal('0.1')) if total else None
+                yield (period.start, period.end, name, spent, share)
+
+    return exporter.Report(['start', 'end', 'category', 'spent', 'percent'], rows())
+
+def get_report(userdetails, report, **filters):
+    """Get a report by name, one of REPORTS
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to report on
+        report -> String: Name of the report
+        filters -> Filters of the transactions export, see exporter.get_transactions
+
+    Returns:
+        A dontbudge.dashboard.exporter.Report
+    """
+    if report == 'years':
+        return get_years(userdetails)
+    if report == 'categories':
+        return get_categories(userdetails)
+    return exporter.get_report(userdetails, report, **filters)
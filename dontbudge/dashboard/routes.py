@@ -4,113 +4,54 @@ Contains the routes for the dashboard.
 
 Author: Josh Rogers (2022)
 """
+import io
 from datetime import datetime, date
 from multiprocessing.sharedctypes import Value
-from flask import request, redirect, render_template, flash
+from flask import request, redirect, render_template, flash, make_response, stream_with_context
 from werkzeug.wrappers.response import Response
+from sqlalchemy.orm import joinedload
 from dontbudge.database import db
-from dontbudge.dashboard import dashboard, forms, utility
-from dontbudge.auth.jwt import token_required
-from dontbudge.auth.models import User
+from dontbudge.cache import cache
+from dontbudge.dashboard import dashboard, forms, utility, aggregation, exporter
+from dontbudge.auth.jwt import token_required, forget_user, CurrentUser
+from dontbudge.etags import conditional
 from dontbudge.api.models import Account, Category, Transaction, Budget, Bill
+from dontbudge.api import balances, snapshots, versions, importer
 
 @dashboard.route('/')
 @token_required
-def index(user: User) -> str:
+@conditional
+def index(user: CurrentUser) -> str:
     """Renders index
 
     The index contains basic user information such as accounts and recent 
     transactions in the current period.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
 
     Returns:
         A rendered index.html template
     """
     userdetails = user.userdetails
-    
-    # Update period if needed
-    if date.today() >= userdetails.period_end.date():
-        userdetails.period_start = userdetails.period_end
-        userdetails.period_end += utility.get_relative(userdetails.range)
-        db.session.commit()
+    aggregation.update_period(userdetails)
 
-    # Check what bills will be due in the current period and previous.
-    # The while loop finds bills that may occur more than once in the
-    # same period.
-    active_bills = []
-    previous_bills = []
-    total_bill_amount = 0
-    for bill in userdetails.bills:
-        temp_date = bill.start
-        while temp_date < userdetails.period_end:
-            temp_bill = Bill(temp_date, bill.name, bill.occurence, userdetails.id, bill.amount)
-            if userdetails.period_start <= temp_date < userdetails.period_end:
-                active_bills.append(temp_bill)
-            elif temp_date < userdetails.period_start:
-                previous_bills.append(temp_bill)
-            total_bill_amount += bill.amount
-            temp_date += utility.get_relative(bill.occurence)
-
-    # Sort bills by date
-    active_bills = sorted(active_bills, key=lambda b: datetime.strftime(b.start, '%Y/%m/%d'))
-                
-    # Get budgets
-    budgets = utility.get_budgets(userdetails)
-    budget_total = 0
-    used_total = 0
-    budget_chart = []
-    for budget, used in budgets:
-        budget_total += budget.amount
-        used_total += used
-        budget_chart.append({'name': budget.name, 'percent': (used / budget.amount) * 100})
-    budgets.append((Budget('Total', None, budget_total), used_total))
-
-    
-
-    # Get account information and category spending for chart
-    accounts = []
-    category_chart = {}
-    total_balance = 0
-    for account in userdetails.accounts:
-        transactions = utility.get_account_transactions(account)[-5:]
-        balance = utility.get_account_balance(account)
-        total_balance += balance
-        accounts.append((account, balance, reversed(transactions)))
-
-        # Category spending
-        period = utility.get_periods(userdetails)[-1]
-        for transaction in utility.get_account_transactions(account):
-            if period.start <= transaction.date < period.end and transaction.amount < 0:
-                if transaction.category:
-                    if transaction.category.name not in category_chart:
-                        category_chart[transaction.category.name] = transaction.amount * -1
-                    else:
-                        category_chart[transaction.category.name] += transaction.amount * -1
-                else:
-                    if 'None' not in category_chart:
-                        category_chart['None'] = transaction.amount * -1
-                    else:
-                        category_chart['None'] += transaction.amount * -1
-
-    # Period overview chart
-    overview_chart = {'Budgets': budget_total - used_total, 'Bills': total_bill_amount, 'Remaining': total_balance - (budget_total - used_total) - total_bill_amount}
+    summary = cache.get('summary', userdetails, aggregation.summarise)
 
     title = f'{userdetails.period_start.strftime("%d %B, %Y")} - {userdetails.period_end.strftime("%d %B, %Y")}'
 
-    return render_template('index.html', title=title, accounts=accounts, bills=active_bills, previous_bills=previous_bills, total_bill_amount=total_bill_amount, budgets=budgets, budget_chart=budget_chart, category_chart=category_chart, overview_chart=overview_chart, logged_in=True)
+    return render_template('index.html', title=title, accounts=summary.accounts, bills=summary.bills, previous_bills=summary.previous_bills, total_bill_amount=summary.total_bill_amount, budgets=summary.budgets, budget_chart=summary.budget_chart, category_chart=summary.category_chart, overview_chart=summary.overview_chart, logged_in=True)
 
 @dashboard.route('/account/create', methods=['GET', 'POST'])
 @token_required
-def create_account(user: User) -> str:
+def create_account(user: CurrentUser) -> str:
     """Create Account
 
     Renders the page for creating an account. A valid JWT token is required to access
     this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
 
     Returns:
         A rendered create_account.html page
@@ -125,6 +66,8 @@ def create_account(user: User) -> str:
         db.session.commit()
         initial_balance = Transaction(userdetails.id, account.id, f'{name} Initial Balance', date.today(), new_account_form.starting_balance.data)
         db.session.add(initial_balance)
+        balances.apply(initial_balance)
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/')
 
@@ -132,14 +75,15 @@ def create_account(user: User) -> str:
 
 @dashboard.route('/account/view')
 @token_required
-def view_accounts(user: User) -> str:
+@conditional
+def view_accounts(user: CurrentUser) -> str:
     """View accounts summary
 
     Renders a page that gives a brief summary of all accounts, i.e. their name
     and balance. A valid JWT token is required to access this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
 
     Returns:
         Rendered accounts.html template
@@ -147,49 +91,59 @@ def view_accounts(user: User) -> str:
     userdetails = user.userdetails
     accounts = []
     for account in userdetails.accounts:
-        balance = utility.get_account_balance(account)
-        accounts.append((account, balance))
+        accounts.append((account, balances.get_balance(account)))
 
     return render_template('accounts.html', title='Accounts', accounts=accounts, logged_in=True)
 
-@dashboard.route('/account/view/<account_index>')
+def render_transaction_rows(page, show_account):
+    """Render just the table rows of a page of transactions
+
+    Used when the account and period pages load further pages on demand. The
+    cursor of the following page is returned in the X-Next-Cursor header.
+    """
+    response = make_response(render_template('transaction_rows.html', transactions=page.items, show_account=show_account))
+    if page.cursor:
+        response.headers['X-Next-Cursor'] = page.cursor
+    return response
+
+@dashboard.route('/account/<int:account_id>')
 @token_required
-def view_account(user: User, account_index: int) -> str:
+@conditional
+def view_account(user: CurrentUser, account_id: int) -> str:
     """Detailed account summary
 
     Renders a page that gives a detailed view of a specific account, including
-    all transactions of that account. A valid JWT token is required to access
-    this endpoint.
+    its transactions a page at a time. Further pages are requested with the
+    'before' cursor, and only the rows are rendered if 'rows' is also given.
+    A valid JWT token is required to access this endpoint.
 
     Args:
-        user: dontbudge.auth.models.User: Authenticated User model
-        account_index -> Integer: Index of the account in the UserDetails.accounts list
+        user: dontbudge.auth.jwt.CurrentUser: Authenticated user
+        account_id -> Integer: ID of the account
 
     Returns:
         Rendered account.html template
     """
     userdetails = user.userdetails
-    try:
-        account = userdetails.accounts[int(account_index)]
-    except ValueError:
-        return redirect('/')
-    except IndexError:
+    account = utility.get_owned(Account, userdetails, account_id)
+    if not account:
         return redirect('/')
 
-    transactions = utility.get_account_transactions(account)
-    balance = utility.get_account_balance(account)
+    query = utility.load_rows(Transaction.query.filter_by(account_id=account.id), show_account=False)
+    page = utility.get_transaction_page(query, request.args.get('before'))
+    if request.args.get('rows'):
+        return render_transaction_rows(page, show_account=False)
 
-    return render_template('account.html', title=f'Transactions for {account.name}', account=account, balance=balance, transactions=reversed(transactions), logged_in=True)
+    balance = balances.get_balance(account)
 
-@dashboard.route('/account/edit/<account_index>', methods=['GET', 'POST'])
+    return render_template('account.html', title=f'Transactions for {account.name}', account=account, balance=balance, transactions=page.items, cursor=page.cursor, logged_in=True)
+
+@dashboard.route('/account/<int:account_id>/edit', methods=['GET', 'POST'])
 @token_required
-def edit_account(user, account_index):
+def edit_account(user, account_id):
     userdetails = user.userdetails
-    try:
-        account = userdetails.accounts[int(account_index)]
-    except ValueError:
-        return redirect('/')
-    except IndexError:
+    account = utility.get_owned(Account, userdetails, account_id)
+    if not account:
         return redirect('/')
     form = forms.AccountForm()
 
@@ -198,6 +152,7 @@ def edit_account(user, account_index):
         if account.name != form.name.data:
             account.name = form.name.data
 
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/')
 
@@ -207,51 +162,50 @@ def edit_account(user, account_index):
 
     return render_template('account_edit_form.html', title='Edit Account', form=form, logged_in=True)
 
-@dashboard.route('/account/delete/<account_index>', methods=['GET', 'POST'])
+@dashboard.route('/account/<int:account_id>/delete', methods=['GET', 'POST'])
 @token_required
-def delete_account(user, account_index):
+def delete_account(user, account_id):
     userdetails = user.userdetails
     form = forms.DeleteForm()
-    try:
-        account = userdetails.accounts[int(account_index)]
-    except ValueError:
-        return 'Account not found'
-    except IndexError:
+    account = utility.get_owned(Account, userdetails, account_id)
+    if not account:
         return 'Account not found'
 
     if form.validate_on_submit():
         db.session.delete(account)
+        snapshots.clear(userdetails)
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/account/view')
 
     return render_template('delete.html', title=f'Delete Account { account.name }', form=form, object=account.name, logged_in=True)
 
-@dashboard.route('/transaction/edit/<transaction_index>', methods=['GET', 'POST'])
+@dashboard.route('/transaction/<int:transaction_id>/edit', methods=['GET', 'POST'])
 @token_required
-def edit_transaction(user: User, transaction_index: int) -> str:
+def edit_transaction(user: CurrentUser, transaction_id: int) -> str:
     """View a given transaction of an account
 
     Renders a page for viewing and editing the details of an existing transaction.
     A valid JWT token is required to access this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
-        transaction_index -> Integer: Index of the transaction in the UserDetails.transactions list
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+        transaction_id -> Integer: ID of the transaction
 
     Returns:
         A rendered create_transaction.html template
     """
     # Get current details
     userdetails = user.userdetails
-    try:
-        transaction = userdetails.transactions[int(transaction_index)]
-    except ValueError:
-        return redirect('/')
-    except IndexError:
+    transaction = utility.get_owned(
+        Transaction, userdetails, transaction_id,
+        joinedload(Transaction.bill), joinedload(Transaction.budget), joinedload(Transaction.category)
+    )
+    if not transaction:
         return redirect('/')
     
     # Create form
-    transaction_form = forms.TransactionForm(account=transaction.account.id)
+    transaction_form = forms.TransactionForm(account=transaction.account_id)
     transaction_form.account.choices = [(account.id, account.name) for account in userdetails.accounts]
     transaction_form.bill.choices = [(bill.id, bill.name) for bill in userdetails.bills]
     transaction_form.bill.choices.insert(0, (None, 'None'))
@@ -262,6 +216,11 @@ def edit_transaction(user: User, transaction_index: int) -> str:
 
     # Update transaction details if any changed
     if transaction_form.validate_on_submit():
+        # Take the transaction off its current account, it is applied again
+        # once edited in case the amount or account changes
+        balances.revert(transaction)
+        previous_date = transaction.date
+
         # Description
         if transaction.description != transaction_form.description.data:
             transaction.description = transaction_form.description.data
@@ -287,16 +246,17 @@ def edit_transaction(user: User, transaction_index: int) -> str:
             transaction.date = transaction_form.date.data
         
         # Bill
-        try:
-            if transaction.bill_id != int(transaction_form.bill.data):
-                transaction.bill_id = transaction_form.bill.data
-                bill = Bill.query.filter_by(id=transaction_form.bill.data).first()
-                if bill:
-                    bill.start = bill.start + utility.get_relative(bill.occurence)
-        except ValueError:
-            pass
+        bill_id = transaction_form.bill.data
+        if bill_id is not None and transaction.bill_id != bill_id:
+            transaction.bill_id = bill_id
+            bill = Bill.query.filter_by(id=bill_id).first()
+            if bill:
+                bill.start = bill.start + utility.get_relative(bill.occurence)
 
         # Commit the changes
+        balances.apply(transaction)
+        snapshots.invalidate(userdetails, previous_date, transaction.date)
+        versions.bump(userdetails)
         db.session.commit()
 
         return redirect('/')
@@ -321,7 +281,7 @@ def edit_transaction(user: User, transaction_index: int) -> str:
 
 @dashboard.route('/transaction/create/<type>', methods=['GET', 'POST'])
 @token_required
-def create_transaction(user: User, type: str) -> str:
+def create_transaction(user: CurrentUser, type: str) -> str:
     """Create Transaction
 
     Renders the page for creating a transaction as well as processing
@@ -331,7 +291,7 @@ def create_transaction(user: User, type: str) -> str:
     form. A valid JWT token is required to use this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
         type -> String: Type of transaction; either deposit or withdraw
 
     Returns:
@@ -363,7 +323,7 @@ def create_transaction(user: User, type: str) -> str:
             category_id = transaction_form.category.data
             budget_id = transaction_form.budget.data
 
-            if account_id == 'None':
+            if account_id is None:
                 flash('Please select an account.')
                 transaction_form.date.data = datetime.today()
                 return render_template('transaction_form.html', title=type.capitalize(), form=transaction_form, logged_in=True)
@@ -381,6 +341,9 @@ def create_transaction(user: User, type: str) -> str:
                 bill.start = bill.start + utility.get_relative(bill.occurence)
 
             db.session.add(transaction)
+            balances.apply(transaction)
+            snapshots.invalidate(userdetails, transaction.date)
+            versions.bump(userdetails)
             db.session.commit()
 
             return redirect('/')
@@ -389,110 +352,204 @@ def create_transaction(user: User, type: str) -> str:
 
     return render_template('transaction_form.html', title=type.capitalize(), form=transaction_form, logged_in=True)
 
-@dashboard.route('/transaction/delete/<transaction_index>', methods=['GET', 'POST'])
+@dashboard.route('/transaction/<int:transaction_id>/delete', methods=['GET', 'POST'])
 @token_required
-def delete_transaction(user, transaction_index):
+def delete_transaction(user, transaction_id):
     userdetails = user.userdetails
     form = forms.DeleteForm()
-    try:
-        transaction = userdetails.transactions[int(transaction_index)]
-    except ValueError:
-        return 'Transaction not found'
-    except IndexError:
+    transaction = utility.get_owned(Transaction, userdetails, transaction_id)
+    if not transaction:
         return 'Transaction not found'
 
     if form.validate_on_submit():
         # Delete transaction and commit
+        balances.revert(transaction)
+        snapshots.invalidate(userdetails, transaction.date)
         db.session.delete(transaction)
+        versions.bump(userdetails)
         db.session.commit()
 
         return redirect('/period/view')
 
     return render_template('delete.html', title=f'Delete Transaction { transaction.description }', form=form, object=transaction.description, logged_in=True)
 
+@dashboard.route('/transaction/import', methods=['GET', 'POST'])
+@token_required
+def import_transactions(user: CurrentUser) -> str:
+    """Import Transactions
+
+    Renders the page for uploading a bank export file and imports its
+    transactions into the chosen account. Rows that were already imported are
+    skipped. A valid JWT token is required to use this endpoint.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+
+    Returns:
+        Rendered import_form.html page, or a redirect to the account once imported
+    """
+    userdetails = user.userdetails
+    import_form = forms.ImportForm()
+    import_form.account.choices = [(account.id, account.name) for account in userdetails.accounts]
+
+    if import_form.validate_on_submit():
+        account = utility.get_owned(Account, userdetails, import_form.account.data)
+        upload = import_form.file.data
+        format = import_form.format.data
+        if format == 'auto':
+            format = importer.detect_format(upload.filename)
+        if not account or not format:
+            flash('Please select an account and the format of the file.')
+            return render_template('import_form.html', title='Import Transactions', form=import_form, logged_in=True)
+
+        columns = importer.Columns(
+            import_form.date_column.data or 'date',
+            import_form.description_column.data or 'description',
+            import_form.amount_column.data or 'amount'
+        )
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+        result = importer.import_transactions(userdetails, account, stream, format, columns, import_form.date_format.data or None)
+        flash(f'Imported {result.imported} of {result.read} transaction(s), skipping {result.duplicates} already imported and {result.skipped} unreadable.')
+        return redirect(f'/account/{account.id}')
+
+    return render_template('import_form.html', title='Import Transactions', form=import_form, logged_in=True)
+
+@dashboard.route('/export/<report>.<format>')
+@token_required
+def export(user: CurrentUser, report: str, format: str) -> Response:
+    """Export a report
+
+    Streams the user's transactions, period totals or budget usage per period
+    as CSV or NDJSON. Transactions can be limited to one account with the
+    'account' argument and to a date range with 'start' and 'end' (YYYY-MM-DD).
+    A valid JWT token is required to access this endpoint.
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+        report -> String: One of transactions, periods or budgets
+        format -> String: Either csv or ndjson
+
+    Returns:
+        A streamed file download
+    """
+    if report not in exporter.REPORTS or format not in exporter.FORMATS:
+        return redirect('/')
+
+    filters = {}
+    if report == 'transactions':
+        parse_date = lambda text: datetime.strptime(text, '%Y-%m-%d')
+        filters = {
+            'account_id': request.args.get('account', type=int),
+            'start': request.args.get('start', type=parse_date),
+            'end': request.args.get('end', type=parse_date)
+        }
+
+    rows = exporter.encode(exporter.get_report(user.userdetails, report, **filters), format)
+    return Response(stream_with_context(rows), mimetype=exporter.FORMATS[format], headers={
+        'Content-Disposition': f'attachment; filename={report}.{format}'
+    })
+
 @dashboard.route('/period/view')
 @token_required
-def view_transactions(user: User) -> Response:
+def view_transactions(user: CurrentUser) -> Response:
     """View all transactions in the current period
 
     Redirects the user to the endpoint that renders the current periods transactions.
     A valid JWT token is required to access this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
 
     Returns:
         A redirection to the endpoint containing the current period
     """
     userdetails = user.userdetails
-    periods = utility.get_periods(userdetails)
+    periods = cache.get('periods', userdetails, utility.get_periods)
     return redirect(f'/period/view/{len(periods) - 1}')
 
 @dashboard.route('/period/view/<period_index>')
 @token_required
-def view_period(user: User, period_index: int) -> str:
+@conditional
+def view_period(user: CurrentUser, period_index: int) -> str:
     """View all transactions in a given period
 
-    Renders a page that displays a list of all transaction within a given period.
-    A valid JWT token is required to access this endpoint.
+    Renders a page that displays the transactions within a given period a page
+    at a time. Further pages are requested with the 'before' cursor, and only
+    the rows are rendered if 'rows' is also given. A valid JWT token is required
+    to access this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
         period_index -> Integer: Index of the period in the UserDetails.periods list
 
     Returns:
         Rendered period.html template
     """
     userdetails = user.userdetails
-    periods = utility.get_periods(userdetails)
+    periods = cache.get('periods', userdetails, utility.get_periods)
     try:
         period = periods[int(period_index)]
     except ValueError:
         return redirect('/')
     except IndexError:
         return render_template('period.html', title="No transactions", transactions=[], logged_in=True)
-    transactions = utility.get_transactions(userdetails)
 
     # Get transactions in this period
-    period_transactions = []
-    for transaction in transactions:
-        if period.start <= transaction.date < period.end:
-            period_transactions.append(transaction)
+    query = utility.load_rows(Transaction.query.filter(
+        Transaction.user_id == userdetails.id,
+        Transaction.date >= period.start,
+        Transaction.date < period.end
+    ))
+    if request.args.get('rows'):
+        return render_transaction_rows(utility.get_transaction_page(query, request.args.get('before')), show_account=True)
+
+    # Totals come first, as taking a snapshot commits and would expire the page
+    totals = cache.get('totals', userdetails, snapshots.get_totals, period)
+    page = utility.get_transaction_page(query, request.args.get('before'))
 
     title = f'{period.start.strftime("%d %B, %Y")} - {period.end.strftime("%d %B, %Y")}'
     menu_items = [
         utility.Menu('Select Period', reversed([
-            utility.MenuItem(f'{p.start.strftime("%d %B, %Y")} - {p.end.strftime("%d %B, %Y")}', f'/period/view/{periods.index(p)}') for p in periods
+            utility.MenuItem(f'{p.start.strftime("%d %B, %Y")} - {p.end.strftime("%d %B, %Y")}', f'/period/view/{i}') for i, p in enumerate(periods)
         ]))
     ]
 
-    return render_template('period.html', title=title, menu_items=menu_items, transactions=reversed(period_transactions), logged_in=True)
+    return render_template('period.html', title=title, menu_items=menu_items, totals=totals, transactions=page.items, cursor=page.cursor, logged_in=True)
+
+def get_autopay_choices(userdetails):
+    """Choices of account a bill can be paid from automatically, or none"""
+    choices = [(account.id, account.name) for account in userdetails.accounts]
+    choices.insert(0, (None, 'Do Not Pay Automatically'))
+    return choices
 
 @dashboard.route('/bill/create', methods=['GET', 'POST'])
 @token_required
-def create_bill(user: User) -> str:
+def create_bill(user: CurrentUser) -> str:
     """Create Bill
     
     Renders the page for creating a reoccuring bill. A valid JWT token is required
     to access this endpoint.
 
     Args:
-        user -> dontbudge.auth.models.User: Authenticated User model
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
 
     Returns:
         Rendered create_bill.html template
     """
     userdetails = user.userdetails
     bill_form = forms.BillForm()
+    bill_form.account.choices = get_autopay_choices(userdetails)
     
     if bill_form.validate_on_submit():
         name = bill_form.name.data
         occurence = bill_form.occurence.data
         start = bill_form.start.data
         amount = bill_form.amount.data
+        account_id = bill_form.account.data
 
-        bill = Bill(start, name, occurence, userdetails.id, amount)
+        bill = Bill(start, name, occurence, userdetails.id, amount, account_id)
         db.session.add(bill)
+        versions.bump(userdetails)
         db.session.commit()
 
         return redirect('/')
@@ -501,6 +558,7 @@ def create_bill(user: User) -> str:
 
 @dashboard.route('/bill/view')
 @token_required
+@conditional
 def view_bills(user):
     userdetails = user.userdetails
 
@@ -518,17 +576,15 @@ def view_bills(user):
 
     return render_template('bills.html', title='Bills', bills=bills, logged_in=True)
 
-@dashboard.route('/bill/edit/<bill_index>', methods=['GET', 'POST'])
+@dashboard.route('/bill/<int:bill_id>/edit', methods=['GET', 'POST'])
 @token_required
-def edit_bill(user, bill_index):
+def edit_bill(user, bill_id):
     userdetails = user.userdetails
-    try:
-        bill = userdetails.bills[int(bill_index)]
-    except ValueError:
-        return redirect ('/')
-    except IndexError:
+    bill = utility.get_owned(Bill, userdetails, bill_id)
+    if not bill:
         return redirect('/')
     bill_form = forms.BillForm()
+    bill_form.account.choices = get_autopay_choices(userdetails)
 
     if bill_form.validate_on_submit():
         if bill.name != bill_form.name.data:
@@ -543,6 +599,10 @@ def edit_bill(user, bill_index):
         if bill.amount != bill_form.amount.data:
             bill.amount = bill_form.amount.data
 
+        if bill.account_id != bill_form.account.data:
+            bill.account_id = bill_form.account.data
+
+        versions.bump(userdetails)
         db.session.commit()
 
         return redirect('/')
@@ -551,22 +611,21 @@ def edit_bill(user, bill_index):
     bill_form.start.data = bill.start
     bill_form.occurence.data = bill.occurence
     bill_form.amount.data = bill.amount
+    bill_form.account.data = bill.account_id
     return render_template('bill_form.html', title='Edit Bill', form=bill_form, logged_in=True)
 
-@dashboard.route('/bill/delete/<bill_index>', methods=['GET', 'POST'])
+@dashboard.route('/bill/<int:bill_id>/delete', methods=['GET', 'POST'])
 @token_required
-def delete_bill(user, bill_index):
+def delete_bill(user, bill_id):
     userdetails = user.userdetails
     form = forms.DeleteForm()
-    try:
-        bill = userdetails.bills[int(bill_index)]
-    except ValueError:
-        return 'Bill not found'
-    except IndexError:
+    bill = utility.get_owned(Bill, userdetails, bill_id)
+    if not bill:
         return 'Bill not found'
 
     if form.validate_on_submit():
         db.session.delete(bill)
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/bill/view')
 
@@ -574,28 +633,28 @@ def delete_bill(user, bill_index):
 
 @dashboard.route('/category/view')
 @token_required
+@conditional
 def view_categories(user):
     userdetails = user.userdetails
     categories = userdetails.categories
 
     return render_template('categories.html', title='Categories', categories=categories, logged_in=True)
 
-@dashboard.route('/category/edit/<category_index>', methods=['GET', 'POST'])
+@dashboard.route('/category/<int:category_id>/edit', methods=['GET', 'POST'])
 @token_required
-def edit_category(user, category_index):
+def edit_category(user, category_id):
     userdetails = user.userdetails
     category_form = forms.CategoryForm()
-    try:
-        category = userdetails.categories[int(category_index)]
-    except ValueError:
-        return redirect('/')
-    except IndexError:
+    category = utility.get_owned(Category, userdetails, category_id)
+    if not category:
         return redirect('/')
 
     if category_form.validate_on_submit():
         if category.name != category_form.name.data:
             category.name = category_form.name.data
+            snapshots.clear(userdetails)
 
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/')
 
@@ -612,25 +671,25 @@ def create_category(user):
     if category_form.validate_on_submit():
         category = Category(category_form.name.data, userdetails.id)
         db.session.add(category)
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/')
 
     return render_template('category_form.html', title='Create Category', form=category_form, logged_in=True)
 
-@dashboard.route('/category/delete/<category_index>', methods=['GET', 'POST'])
+@dashboard.route('/category/<int:category_id>/delete', methods=['GET', 'POST'])
 @token_required
-def delete_category(user, category_index):
+def delete_category(user, category_id):
     userdetails = user.userdetails
     form = forms.DeleteForm()
-    try:
-        category = userdetails.categories[int(category_index)]
-    except ValueError:
-        return 'Category not found'
-    except IndexError:
+    category = utility.get_owned(Category, userdetails, category_id)
+    if not category:
         return 'Category not found'
 
     if form.validate_on_submit():
         db.session.delete(category)
+        snapshots.clear(userdetails)
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/category/view')
 
@@ -638,9 +697,10 @@ def delete_category(user, category_index):
 
 @dashboard.route('/budget/view')
 @token_required
+@conditional
 def view_budgets(user):
     userdetails = user.userdetails
-    budgets = utility.get_budgets(userdetails)
+    budgets = cache.get('budgets', userdetails, aggregation.summarise_budgets)
 
     return render_template('budgets.html', title='Budgets', budgets=budgets, logged_in=True)
 
@@ -653,21 +713,19 @@ def create_budget(user):
     if budget_form.validate_on_submit():
         budget = Budget(budget_form.name.data, userdetails.id, budget_form.amount.data)
         db.session.add(budget)
+        versions.bump(userdetails)
         db.session.commit()
 
         return redirect('/')
 
     return render_template('budget_form.html', title='Create Budget', form=budget_form, logged_in=True)
 
-@dashboard.route('/budget/edit/<budget_index>', methods=['GET', 'POST'])
+@dashboard.route('/budget/<int:budget_id>/edit', methods=['GET', 'POST'])
 @token_required
-def edit_budget(user, budget_index):
+def edit_budget(user, budget_id):
     userdetails = user.userdetails
-    try:
-        budget = userdetails.budgets[int(budget_index)]
-    except ValueError:
-        return redirect('/')
-    except IndexError:
+    budget = utility.get_owned(Budget, userdetails, budget_id)
+    if not budget:
         return redirect('/')
     form = forms.BudgetForm()
 
@@ -680,6 +738,7 @@ def edit_budget(user, budget_index):
         if budget.amount != form.amount.data:
             budget.amount = form.amount.data
 
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/')
 
@@ -689,20 +748,18 @@ def edit_budget(user, budget_index):
 
     return render_template('budget_form.html', title='Edit Budget', form=form, logged_in=True)
 
-@dashboard.route('/budget/delete/<budget_index>', methods=['GET', 'POST'])
+@dashboard.route('/budget/<int:budget_id>/delete', methods=['GET', 'POST'])
 @token_required
-def delete_budget(user, budget_index):
+def delete_budget(user, budget_id):
     userdetails = user.userdetails
     form = forms.DeleteForm()
-    try:
-        budget = userdetails.budgets[int(budget_index)]
-    except ValueError:
-        return 'Budget not found'
-    except IndexError:
+    budget = utility.get_owned(Budget, userdetails, budget_id)
+    if not budget:
         return 'Budget not found'
 
     if form.validate_on_submit():
         db.session.delete(budget)
+        versions.bump(userdetails)
         db.session.commit()
         return redirect('/budget/view')
 
@@ -722,12 +779,16 @@ def settings(user):
         if userdetails.period_start != period_start:
             userdetails.period_start = period_start
             userdetails.period_end = userdetails.period_start + utility.get_relative(userdetails.range)
+            snapshots.clear(userdetails)
+            versions.bump(userdetails)
             db.session.commit()
 
         # Range
         if userdetails.range != range:
             userdetails.range = range
             userdetails.period_end = userdetails.period_start + utility.get_relative(range)
+            snapshots.clear(userdetails)
+            versions.bump(userdetails)
             db.session.commit()
 
         return redirect('/')
@@ -743,14 +804,16 @@ def settings(user):
 def delete(user):
     form = forms.DeleteForm()
     if form.validate_on_submit():
-        db.session.delete(user)
+        db.session.delete(user.model)
         db.session.commit()
+        forget_user(user.id)
         return redirect('/logout')
 
     return render_template('delete.html', title=f'Delete Account {user.username}', form=form, object='your account', logged_in=True)
 
 @dashboard.route('/savings', methods=['GET'])
 @token_required
+@conditional
 def view_savings(user):
     userdetails = user.userdetails
 
@@ -763,3 +826,72 @@ def view_savings(user):
         budget_total += budget.amount
     
     return render_template('savings.html', title='Savings', logged_in=True, bills=bills, budget_total=budget_total)
+
+def redirect_from_index(model, user, index, url):
+    """Redirect an old positional URL to the ID based URL of the same row
+
+    A 307 is used so form submissions to the old URLs keep their method and body,
+    and any query string is carried over.
+    """
+    item = utility.get_owned_by_index(model, user.userdetails, index)
+    if not item:
+        return redirect('/')
+    url = url.format(item.id)
+    if request.query_string:
+        url = f'{url}?{request.query_string.decode()}'
+    return redirect(url, code=307)
+
+@dashboard.route('/account/view/<account_index>')
+@token_required
+def view_account_by_index(user, account_index):
+    return redirect_from_index(Account, user, account_index, '/account/{}')
+
+@dashboard.route('/account/edit/<account_index>', methods=['GET', 'POST'])
+@token_required
+def edit_account_by_index(user, account_index):
+    return redirect_from_index(Account, user, account_index, '/account/{}/edit')
+
+@dashboard.route('/account/delete/<account_index>', methods=['GET', 'POST'])
+@token_required
+def delete_account_by_index(user, account_index):
+    return redirect_from_index(Account, user, account_index, '/account/{}/delete')
+
+@dashboard.route('/transaction/edit/<transaction_index>', methods=['GET', 'POST'])
+@token_required
+def edit_transaction_by_index(user, transaction_index):
+    return redirect_from_index(Transaction, user, transaction_index, '/transaction/{}/edit')
+
+@dashboard.route('/transaction/delete/<transaction_index>', methods=['GET', 'POST'])
+@token_required
+def delete_transaction_by_index(user, transaction_index):
+    return redirect_from_index(Transaction, user, transaction_index, '/transaction/{}/delete')
+
+@dashboard.route('/bill/edit/<bill_index>', methods=['GET', 'POST'])
+@token_required
+def edit_bill_by_index(user, bill_index):
+    return redirect_from_index(Bill, user, bill_index, '/bill/{}/edit')
+
+@dashboard.route('/bill/delete/<bill_index>', methods=['GET', 'POST'])
+@token_required
+def delete_bill_by_index(user, bill_index):
+    return redirect_from_index(Bill, user, bill_index, '/bill/{}/delete')
+
+@dashboard.route('/category/edit/<category_index>', methods=['GET', 'POST'])
+@token_required
+def edit_category_by_index(user, category_index):
+    return redirect_from_index(Category, user, category_index, '/category/{}/edit')
+
+@dashboard.route('/category/delete/<category_index>', methods=['GET', 'POST'])
+@token_required
+def delete_category_by_index(user, category_index):
+    return redirect_from_index(Category, user, category_index, '/category/{}/delete')
+
+@dashboard.route('/budget/edit/<budget_index>', methods=['GET', 'POST'])
+@token_required
+def edit_budget_by_index(user, budget_index):
+    return redirect_from_index(Budget, user, budget_index, '/budget/{}/edit')
+
+@dashboard.route('/budget/delete/<budget_index>', methods=['GET', 'POST'])
+@token_required
+def delete_budget_by_index(user, budget_index):
+    return redirect_from_index(Budget, user, budget_index, '/budget/{}/delete')
@@ -0,0 +1,103 @@
+"""Bill Schedule
+
+Works out when bills fall due. Occurrences are calculated directly from a
+bill's start date and occurence, jumping straight to the first one inside a
+window instead of stepping forward one occurence at a time from the start, so
+the cost depends on the size of the window and not on how old the bill is.
+
+Occurrences are returned as lightweight named tuples rather than Bill models.
+For forecasting, get_daily_totals works out what many bills cost on each day
+of a window at once.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from dontbudge.dashboard import utility
+
+Occurrence = namedtuple('Occurrence', [
+    'bill_id',
+    'name',
+    'amount',
+    'date'
+])
+
+def get_first_index(bill, day):
+    """Get the number of the first occurence of a bill on or after a date
+
+    Args:
+        bill -> dontbudge.api.models.Bill: Bill to get the occurence of
+        day -> datetime: Date the occurence must be on or after
+
+    Returns:
+        Integer n, where bill.start + n * occurence is the first due date on or
+        after the date. Never less than 0, since bills do not occur before they start.
+    """
+    if day <= bill.start:
+        return 0
+    step = utility.get_relative(bill.occurence)
+    index = utility.get_steps(bill.start, step, day)
+    if bill.start + step * index < day:
+        index += 1
+    return index
+
+def get_occurrences(bill, start, end):
+    """Get every occurence of a bill within a window
+
+    Args:
+        bill -> dontbudge.api.models.Bill: Bill to get the occurences of
+        start -> datetime: Inclusive start of the window
+        end -> datetime: Exclusive end of the window
+
+    Returns:
+        List of dontbudge.dashboard.schedule.Occurrence's in date order
+    """
+    step = utility.get_relative(bill.occurence)
+    first = get_first_index(bill, start)
+    last = get_first_index(bill, end)
+    return [Occurrence(bill.id, bill.name, bill.amount, bill.start + step * index) for index in range(first, last)]
+
+def count_occurrences(bill, start, end):
+    """Count the occurences of a bill within a window, without listing them"""
+    return max(get_first_index(bill, end) - get_first_index(bill, start), 0)
+
+def get_daily_totals(bills, start, days):
+    """Get the total amount due for many bills on each day of a window
+
+    Args:
+        bills -> List of dontbudge.api.models.Bill: Bills to total
+        start -> datetime: First day of the window
+        days -> Integer: Number of days in the window
+
+    Returns:
+        List of length days with the total amount due on each day
+    """
+    start = datetime(start.year, start.month, start.day)
+    totals = [0] * days
+    end = start + timedelta(days=days)
+    for bill in bills:
+        for occurrence in get_occurrences(bill, start, end):
+            totals[(occurrence.date - start).days] += occurrence.amount
+    return totals
+
+def get_due(userdetails):
+    """Get the bills due in and before the user's current period
+
+    Bills are due from their start date, which moves forward as they are paid,
+    so every occurence before the current period is still outstanding.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to get the bills of
+
+    Returns:
+        Tuple of the occurences due this period (in date order), the
+        occurences due before this period and the total amount of all of them
+    """
+    active = []
+    previous = []
+    total = 0
+    for bill in userdetails.bills:
+        previous.extend(get_occurrences(bill, bill.start, userdetails.period_start))
+        active.extend(get_occurrences(bill, userdetails.period_start, userdetails.period_end))
+        total += bill.amount * count_occurrences(bill, bill.start, userdetails.period_end)
+
+    active.sort(key=lambda occurrence: occurrence.date.date())
+    return active, previous, total
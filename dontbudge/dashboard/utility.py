@@ -1,8 +1,11 @@
 from collections import namedtuple
-from datetime import date
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, load_only
 from dateutil.relativedelta import relativedelta
 from dontbudge.database import db
-from dontbudge.api.models import Transaction
+from dontbudge.api.models import Transaction, Account, Category
+from dontbudge.api import queries
 
 Period = namedtuple('Period', [
     'start',
@@ -19,6 +22,14 @@ MenuItem = namedtuple('MenuTuple', [
     'link'
 ])
 
+Page = namedtuple('Page', [
+    'items',
+    'cursor'
+])
+
+PAGE_SIZE = 50
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
 def get_relative(code):
     switch = {
         '1W': relativedelta(weeks=1),
@@ -30,72 +41,207 @@ def get_relative(code):
 
     return switch.get(code)
 
-def get_transactions(userdetails):
-    """Get all transactions of a user
-    
-    Retrieves all transactions of the given user and returns a sorted list. The
-    transactions are in a named tuple Transaction, ready for use in templates.
+def get_owned(model, userdetails, id, *options):
+    """Get a single row of a model by ID, only if it belongs to the user
 
     Args:
-        userdetails -> dontbudge.api.models.UserDetails: User to get transactions of
-    
+        model -> dontbudge.database.db.Model: Model with a user_id column, e.g. Transaction
+        userdetails -> dontbudge.api.models.UserDetails: User the row must belong to
+        id -> Integer: Primary key of the row
+        options -> sqlalchemy.orm loader options, e.g. joinedload(Transaction.bill)
+
     Returns:
-        Sorted list of all dontbudge.dashboard.utility.Transaction's of the user
+        The row, or None if it does not exist or belongs to another user
     """
-    transactions = []
-    for transaction in userdetails.transactions:
-        transactions.append(transaction)
-    
-    transactions.sort(key = lambda transaction: transaction.date)
-    return transactions
-
-def get_account_transactions(account):
-    """Get all sorted transactions of an account"""
-    transactions = []
-    for transaction in account.transactions:
-        transactions.append(transaction)
-
-    transactions.sort(key = lambda transaction: transaction.date)
-    return transactions
+    return model.query.options(*options).filter_by(id=id, user_id=userdetails.id).first()
 
-def get_periods(userdetails):
+def get_owned_by_index(model, userdetails, index):
+    """Get a single row of a model by its position among the user's rows
+
+    Supports the old positional URLs, which indexed into relationship lists
+    such as UserDetails.transactions. Only the one row is loaded.
+
+    Args:
+        model -> dontbudge.database.db.Model: Model with a user_id column, e.g. Transaction
+        userdetails -> dontbudge.api.models.UserDetails: User the row must belong to
+        index -> String: Position of the row when ordered by ID
+
+    Returns:
+        The row, or None if the index is invalid or out of range
+    """
+    try:
+        index = int(index)
+    except ValueError:
+        return None
+    if index < 0:
+        return None
+    return model.query.filter_by(user_id=userdetails.id).order_by(model.id).offset(index).first()
+
+def encode_cursor(transaction):
+    """Encode the position of a transaction as a cursor for get_transaction_page"""
+    return f'{transaction.date.strftime(CURSOR_FORMAT)}-{transaction.id}'
+
+def decode_cursor(cursor):
+    """Decode a cursor into a (date, id) tuple, or None if it is missing or invalid"""
+    try:
+        day, id = cursor.split('-')
+        return datetime.strptime(day, CURSOR_FORMAT), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+def load_rows(query, show_account=True):
+    """Load only what transaction_rows.html displays of each transaction
+
+    The names of the transactions' categories, and accounts if they are shown,
+    are joined into the same query. Otherwise each row lazy loads its
+    category and account, costing a query for every distinct one on the page.
+
+    Args:
+        query -> sqlalchemy.orm.Query: Query of Transaction's
+        show_account -> Boolean: Whether the account of each row is displayed
+
+    Returns:
+        The query with its loader options set
+    """
+    options = [
+        load_only(Transaction.description, Transaction.date, Transaction.amount, Transaction.account_id, Transaction.category_id),
+        joinedload(Transaction.category).load_only(Category.name)
+    ]
+    if show_account:
+        options.append(joinedload(Transaction.account).load_only(Account.name))
+    return query.options(*options)
+
+def get_transaction_page(query, cursor=None, size=PAGE_SIZE):
+    """Get one page of transactions, newest first
+
+    Uses keyset pagination: the cursor is the (date, id) of the last transaction
+    of the previous page and the next page starts strictly after it, so the
+    database seeks straight to the page through the date indexes rather than
+    counting past an offset.
+
+    Args:
+        query -> sqlalchemy.orm.Query: Query of the Transaction's to page through
+        cursor -> String: Cursor returned with the previous page, None for the first page
+        size -> Integer: Number of transactions per page
+
+    Returns:
+        A dontbudge.dashboard.utility.Page of transactions and the cursor of the
+        next page, which is None on the last page
+    """
+    position = decode_cursor(cursor)
+    if position:
+        day, id = position
+        query = query.filter(or_(
+            Transaction.date < day,
+            and_(Transaction.date == day, Transaction.id < id)
+        ))
+
+    transactions = query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(size + 1).all()
+    if len(transactions) > size:
+        return Page(transactions[:size], encode_cursor(transactions[size - 1]))
+    return Page(transactions, None)
+
+def get_steps(anchor, range, day):
+    """Get how many whole ranges a date is from an anchor date
+
+    Finds n such that anchor + n * range <= day < anchor + (n + 1) * range,
+    where n is negative for dates before the anchor. Week based ranges divide
+    the number of days, and month based ranges divide the number of months
+    with a single correction for the day of the month.
+
+    Args:
+        anchor -> datetime: Date the steps are counted from
+        range -> dateutil.relativedelta.relativedelta: Step size, from get_relative
+        day -> datetime: Date to count the steps to
+
+    Returns:
+        Integer number of steps
+    """
+    if range.months or range.years:
+        step = range.years * 12 + range.months
+        months = (day.year - anchor.year) * 12 + day.month - anchor.month
+        steps = months // step
+        if anchor + range * steps > day:
+            steps -= 1
+        return steps
+
+    return (day - anchor) // timedelta(days=range.days)
+
+def get_period_index(userdetails, day):
+    """Get the index of the period a date falls in
+
+    The current period is index 0, the one before it -1 and so on. Dates on or
+    after the start of the current period all belong to the current period.
+    The index is calculated directly with get_steps rather than by stepping
+    back one period at a time.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User whose period settings to use
+        day -> datetime: Date to find the period of
+
+    Returns:
+        Integer index of the period, relative to the current period
+    """
+    if day >= userdetails.period_start:
+        return 0
+    return get_steps(userdetails.period_start, get_relative(userdetails.range), day)
+
+def get_period_from_index(userdetails, index):
+    """Get the period at the given index relative to the current period"""
     range = get_relative(userdetails.range)
-    periods = []
+    start = userdetails.period_start
+    return Period(start + range * index, start + range * (index + 1))
 
-    for transaction in get_transactions(userdetails):
-        start = userdetails.period_start
-        while transaction.date < start:
-            start -= range
-        period = Period(start, start+range)
-        if period not in periods:
-            periods.append(period)
+def get_period(userdetails, day):
+    """Get the period a date falls in
 
-    return periods
+    Dates on or after the start of the current period all belong to the current
+    period, matching how transactions are grouped in get_periods.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User whose period settings to use
+        day -> datetime: Date to find the period of
+
+    Returns:
+        The dontbudge.dashboard.utility.Period containing the date
+    """
+    return get_period_from_index(userdetails, get_period_index(userdetails, day))
+
+def get_periods(userdetails):
+    """Get every period a user has transactions in
+
+    Each distinct transaction date is mapped straight to its period index and
+    collected in a set, so this is a single pass over the dates.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to get periods of
+
+    Returns:
+        List of dontbudge.dashboard.utility.Period's, oldest first
+    """
+    dates = db.session.query(Transaction.date).filter(Transaction.user_id == userdetails.id).distinct()
+    indexes = {get_period_index(userdetails, day) for day, in dates}
+    return [get_period_from_index(userdetails, index) for index in sorted(indexes)]
 
 def get_budgets(userdetails):
-    # Get current period
-    periods = get_periods(userdetails)
-    budgets = []
-    if not periods:
-        for budget in userdetails.budgets:
-            budgets.append((budget, 0))
-    else:
-        period = periods[-1]
-
-        # Calculate used amounts for current period
-        for budget in userdetails.budgets:
-            used = 0
-            for transaction in budget.transactions:
-                if period.start <= transaction.date < period.end:
-                    used -= transaction.amount
-
-            budgets.append((budget, used))
-    
-    return budgets
+    """Get the budgets of a user with how much of each is used
+
+    Usage is counted over the period of the user's latest transaction.
 
-def get_account_balance(account):
-    balance = 0
-    for transaction in account.transactions:
-        balance += transaction.amount
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to get budgets of
+
+    Returns:
+        List of (dontbudge.api.models.Budget, used amount) tuples
+    """
+    latest = queries.get_latest_transaction_date(userdetails.id)
+    usage = {}
+    if latest is not None:
+        period = get_period(userdetails, latest)
+        usage = queries.get_budget_usage(userdetails.id, period.start, period.end)
 
-    return balance
+    budgets = []
+    for budget in userdetails.budgets:
+        budgets.append((budget, usage.get(budget.id, 0)))
+
+    return budgets
@@ -2,13 +2,121 @@
 
 Provides an SQLAlchemy ORM object for interacting with the database.
 
+SQLite is used by default. Any database SQLAlchemy supports can be used
+instead by setting SQLALCHEMY_DATABASE_URI, and PostgreSQL is supported for
+deployments with several workers writing at once. Server databases get a
+connection pool per worker, sized by DB_POOL_SIZE and DB_MAX_OVERFLOW, whose
+connections are checked before use and replaced after DB_POOL_RECYCLE seconds
+so ones dropped by the server or a proxy are never handed out.
+
+SQLite connections are tuned with the pragmas of a profile, SQLITE_PROFILE,
+applied as each connection is opened:
+
+* rollback: SQLite's own defaults, a rollback journal and a new connection
+  per request. Readers and writers in different workers block each other.
+* wal (default): Write-ahead logging, so readers never wait for a writer and
+  a writer never waits for readers. Commits are still synced to disk, so a
+  committed change survives a power cut. Connections are pooled so their
+  page cache and memory map are kept between requests.
+* fast: As wal, but commits are only synced at checkpoints. A power cut (not
+  a crash of the app) can lose the last few commits, but never corrupts the
+  database.
+
 Author: Josh Rogers (2021)
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.pool import QueuePool
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 1800
+
+SQLITE_PROFILE = 'wal'
+SQLITE_PROFILES = {
+    'rollback': {
+        'journal_mode': 'DELETE'
+    },
+    'wal': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY'
+    },
+    'fast': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY'
+    }
+}
 
 db = SQLAlchemy()
 
+def get_url(url):
+    """Normalise a database URL, accepting the postgres:// scheme many hosts give out"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def get_engine_options(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=POOL_RECYCLE, sqlite_profile=SQLITE_PROFILE):
+    """Get the SQLAlchemy engine options for a database URL
+
+    SQLite databases in the rollback profile are opened per request as
+    before. Other SQLite profiles pool their connections, sharing them between
+    request threads, and server databases get a tuned connection pool.
+    """
+    if url.startswith('sqlite'):
+        if sqlite_profile == 'rollback' or url in ('sqlite://', 'sqlite:///:memory:'):
+            return {}
+        return {
+            'poolclass': QueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'connect_args': {'check_same_thread': False}
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True
+    }
+
+def set_pragmas(pragmas):
+    """Get a connect event listener that applies pragmas to new SQLite connections"""
+    def listener(connection, record):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return listener
+
 def init_app(app):
     """Initialises the SQLAlchemy instance with the Flask app"""
+    url = get_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    profile = app.config.get('SQLITE_PROFILE', SQLITE_PROFILE)
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown SQLite profile {profile}, expected one of {", ".join(SQLITE_PROFILES)}')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    options = get_engine_options(
+        url,
+        app.config.get('DB_POOL_SIZE', POOL_SIZE),
+        app.config.get('DB_MAX_OVERFLOW', MAX_OVERFLOW),
+        app.config.get('DB_POOL_RECYCLE', POOL_RECYCLE),
+        profile
+    )
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
     db.init_app(app)
-    db.create_all(app=app)
\ No newline at end of file
+    if url.startswith('sqlite'):
+        event.listen(db.get_engine(app), 'connect', set_pragmas(SQLITE_PROFILES[profile]))
+    try:
+        db.create_all(app=app)
+    except DatabaseError:
+        # Another worker created some of the tables at the same time, which
+        # PostgreSQL reports as an error; the rest are created on a retry
+        db.create_all(app=app)
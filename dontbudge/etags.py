@@ -0,0 +1,72 @@
+"""ETags
+
+Conditional GET support for pages and API responses built only from a user's
+own data. Such a response can only change when the user's data version does,
+when the day changes (bills fall due and periods roll over) or when the app
+itself is upgraded, so its ETag is derived from those alone.
+
+A request whose If-None-Match carries the current ETag is answered with an
+empty 304 after authentication, without running the view, querying the
+user's data or rendering a template. Responses are marked 'private, no-cache'
+so browsers keep them but always revalidate.
+"""
+import hashlib
+import os
+from datetime import date
+from functools import wraps
+from flask import request, session, make_response, current_app
+
+_release = ''
+
+def get_release(root):
+    """Identify the installed code and templates by their modification times"""
+    stamps = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.endswith(('.py', '.html')):
+                path = os.path.join(directory, name)
+                stamps.append(f'{os.path.relpath(path, root)}:{os.stat(path).st_mtime_ns}')
+    return hashlib.sha1('\n'.join(sorted(stamps)).encode()).hexdigest()
+
+def get_etag(user):
+    """Get the ETag of the current request's response for a user
+
+    Args:
+        user -> dontbudge.auth.jwt.CurrentUser: Authenticated user
+
+    Returns:
+        String strong ETag
+    """
+    key = f'{_release}|{user.id}|{user.token_version}|{user.userdetails.version}|{date.today()}|{request.full_path}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def conditional(f):
+    """Answers a GET with 304 Not Modified if the client has the current version
+
+    Goes beneath token_required, since the ETag depends on the user. Requests
+    with flashed messages waiting to be shown always run the view, so the
+    messages are not lost.
+    """
+    @wraps(f)
+    def decorator(user, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+            return f(user, *args, **kwargs)
+
+        etag = get_etag(user)
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(f(user, *args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.update(('Cookie', 'Authorization'))
+        return response
+    return decorator
+
+def init_app(app):
+    """Identifies the running release, so upgrades change every ETag"""
+    global _release
+    _release = get_release(app.root_path)
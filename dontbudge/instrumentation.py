@@ -0,0 +1,201 @@
+"""Instrumentation
+
+Opt-in per-request measurements, enabled with the INSTRUMENTATION config.
+Every request records its wall time, the number of SQL statements it ran and
+the time spent in them (from SQLAlchemy engine events), and the time spent
+rendering templates. These are:
+
+* Aggregated per endpoint and served in the Prometheus text format at
+  /metrics. Each gunicorn worker keeps its own figures, labelled with its
+  process ID.
+* Sent back in a Server-Timing header, which browser developer tools show
+  alongside the request.
+* Logged as a warning when a request takes longer than SLOW_REQUEST_MS.
+
+A PROFILE_RATE share of requests are also run under cProfile. If a profiled
+request turns out to be slow, its profile is saved to PROFILE_DIR (if set)
+for snakeviz or pstats, and its most expensive functions are logged.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from flask import g, request, has_request_context
+from jinja2 import Template
+from sqlalchemy import event
+from dontbudge.database import db
+
+SLOW_REQUEST_MS = 500
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+PROFILE_LINES = 20
+
+class RequestStats:
+    """Measurements of the request being handled"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.profiler = None
+
+class Histogram:
+    """Cumulative Prometheus style histogram"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Per endpoint request metrics of this process"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.durations = {}
+        self.queries = {}
+        self.sql_seconds = {}
+        self.template_seconds = {}
+
+    def observe(self, endpoint, method, status, duration, stats):
+        with self.lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.setdefault(endpoint, Histogram(DURATION_BUCKETS)).observe(duration)
+            self.queries.setdefault(endpoint, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + stats.sql_time
+            self.template_seconds[endpoint] = self.template_seconds.get(endpoint, 0.0) + stats.template_time
+
+    def render(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        worker = os.getpid()
+        lines = []
+
+        def histogram(name, help, histograms):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} histogram')
+            for endpoint, values in sorted(histograms.items()):
+                labels = f'worker="{worker}",endpoint="{endpoint}"'
+                for bound, count in zip(values.buckets, values.counts):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {values.count}')
+                lines.append(f'{name}_sum{{{labels}}} {values.sum:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {values.count}')
+
+        def counter(name, help, values):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, value in sorted(values.items()):
+                lines.append(f'{name}{{worker="{worker}",endpoint="{endpoint}"}} {value:.6f}')
+
+        with self.lock:
+            lines.append('# HELP dontbudge_requests_total Requests handled')
+            lines.append('# TYPE dontbudge_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'dontbudge_requests_total{{worker="{worker}",endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            histogram('dontbudge_request_duration_seconds', 'Wall time of requests', self.durations)
+            histogram('dontbudge_request_queries', 'SQL statements run per request', self.queries)
+            counter('dontbudge_sql_seconds_total', 'Time spent running SQL statements', self.sql_seconds)
+            counter('dontbudge_template_seconds_total', 'Time spent rendering templates', self.template_seconds)
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def get_stats():
+    """Get the measurements of the current request, or None outside of an instrumented request"""
+    if not has_request_context():
+        return None
+    return g.get('instrumentation')
+
+class TimedTemplate(Template):
+    """Jinja template that adds its render time to the current request's"""
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats = get_stats()
+            if stats:
+                stats.template_time += time.perf_counter() - start
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    context._instrumentation_start = time.perf_counter()
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    stats = get_stats()
+    if stats:
+        stats.queries += 1
+        stats.sql_time += time.perf_counter() - context._instrumentation_start
+
+def save_profile(app, stats, endpoint, duration):
+    """Log the most expensive functions of a slow request, and save its profile"""
+    output = io.StringIO()
+    pstats.Stats(stats.profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    app.logger.warning('Profile of %s (%.0f ms):\n%s', endpoint, duration * 1000, output.getvalue())
+
+    directory = app.config.get('PROFILE_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{duration * 1000:.0f}ms.prof'
+        stats.profiler.dump_stats(os.path.join(directory, name))
+
+def init_app(app):
+    """Instruments the Flask app, if enabled by its INSTRUMENTATION config"""
+    if not app.config.get('INSTRUMENTATION'):
+        return
+
+    profile_rate = app.config.get('PROFILE_RATE', 0)
+    slow = app.config.get('SLOW_REQUEST_MS', SLOW_REQUEST_MS) / 1000
+
+    app.jinja_env.template_class = TimedTemplate
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_request():
+        stats = RequestStats()
+        g.instrumentation = stats
+        if profile_rate and random.random() < profile_rate:
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+    @app.after_request
+    def finish_request(response):
+        stats = get_stats()
+        if not stats:
+            return response
+        duration = time.perf_counter() - stats.start
+        if stats.profiler:
+            stats.profiler.disable()
+
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe(endpoint, request.method, response.status_code, duration, stats)
+        response.headers['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'render;dur={stats.template_time * 1000:.1f}'
+        )
+
+        if duration >= slow:
+            app.logger.warning(
+                'Slow request %s %s: %.0f ms, %d queries taking %.0f ms, %.0f ms rendering',
+                request.method, request.path, duration * 1000, stats.queries, stats.sql_time * 1000, stats.template_time * 1000
+            )
+            if stats.profiler:
+                save_profile(app, stats, endpoint, duration)
+        return response
+
+    @app.route('/metrics')
+    def view_metrics():
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,286 @@
+"""Jobs
+
+A queue of report jobs, for reports too slow to build within a request such as
+year-over-year totals or a full history export (see
+dontbudge.dashboard.reports). A request enqueues a job and returns straight
+away, and the client polls the job until its result is ready to download.
+
+Jobs are rows of the jobs table, so the queue is shared by every gunicorn
+worker and needs no separate broker. Each app process builds reports in its
+own pool of REPORT_WORKERS worker processes, started with spawn so each opens
+its own database connections (like any spawned process, they import the main
+module, so scripts that create the app keep anything else under
+`if __name__ == '__main__'`). A process claims the oldest queued job whenever
+it has a free worker: when a job is enqueued, when a queued job is polled and
+when one of its jobs finishes. Claims are conditional updates, so a job is
+only ever claimed by one process. The result is stored in the job's row.
+
+A user can have at most REPORT_USER_LIMIT jobs queued or running at once.
+Cancelling a queued job takes it off the queue, and a running job stops at its
+next chunk of rows. Jobs still running after TIMEOUT seconds, e.g. because
+their process was killed, are failed, and finished jobs are deleted after
+RETENTION.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import Flask, current_app
+from dontbudge import database
+from dontbudge.database import db
+from dontbudge.api.models import Job, UserDetails
+from dontbudge.dashboard import reports, exporter
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE = (QUEUED, RUNNING)
+
+WORKERS = 1
+USER_LIMIT = 3
+TIMEOUT = 1800
+RETENTION = timedelta(days=1)
+MAX_RESULT_SIZE = 64 * 1024 * 1024
+DATE_FORMAT = '%Y-%m-%d'
+
+# App config the worker processes need to open the database
+WORKER_CONFIG = ('SQLALCHEMY_DATABASE_URI', 'SQLITE_PROFILE')
+
+_workers = WORKERS
+_user_limit = USER_LIMIT
+_executor = None
+_pid = None
+# Worker count and app config the pool was started with
+_config = None
+_lock = threading.RLock()
+# Futures of the jobs running in this process's pool, by job ID
+_running = {}
+# App of a worker process
+_worker_app = None
+
+def configure(workers=WORKERS, user_limit=USER_LIMIT):
+    """Set the size of each process's worker pool and the number of active jobs per user"""
+    global _workers, _user_limit
+    _workers = workers
+    _user_limit = user_limit
+
+def init_worker(config):
+    """Set up a worker process with an app that only has the database"""
+    global _worker_app
+    _worker_app = Flask('dontbudge')
+    _worker_app.config.update(config)
+    _worker_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    _worker_app.config['DB_POOL_SIZE'] = 1
+    database.init_app(_worker_app)
+
+def get_executor(app):
+    """Get this process's worker pool, starting it on first use
+
+    Each process starts its own, as a pool inherited from a gunicorn master
+    does not work in its workers. A pool started for another database or
+    number of workers, e.g. by another app in the same process, is replaced.
+    """
+    global _executor, _pid, _config
+    config = {key: app.config[key] for key in WORKER_CONFIG if key in app.config}
+    if _pid != os.getpid() or _config != (_workers, config):
+        if _pid == os.getpid():
+            _executor.shutdown(wait=False)
+        context = multiprocessing.get_context('spawn')
+        _executor = ProcessPoolExecutor(_workers, mp_context=context, initializer=init_worker, initargs=(config,))
+        _pid = os.getpid()
+        _config = (_workers, config)
+        _running.clear()
+    return _executor
+
+def reset():
+    """Start a new worker pool on next use, after the current one broke"""
+    global _pid
+    with _lock:
+        _pid = None
+
+def get_filters(params):
+    """Turn the params stored with a job back into report filters"""
+    filters = dict(params or {})
+    for key in ('start', 'end'):
+        if filters.get(key):
+            filters[key] = datetime.strptime(filters[key], DATE_FORMAT)
+    return filters
+
+def is_running(job_id):
+    """Check whether a job is still running, and has not been cancelled or timed out"""
+    return db.session.query(Job.status).filter(Job.id == job_id).scalar() == RUNNING
+
+def finish(job_id, status, result=None, error=None):
+    """Record the outcome of a running job, unless it was cancelled or timed out meanwhile"""
+    Job.query.filter(Job.id == job_id, Job.status == RUNNING).update({
+        Job.status: status,
+        Job.result: result,
+        Job.size: len(result) if result is not None else None,
+        Job.error: error,
+        Job.finished: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+
+def build(job_id):
+    """Build the report of a running job and store the result"""
+    job = Job.query.filter_by(id=job_id).first()
+    userdetails = UserDetails.query.filter_by(id=job.user_id).first()
+    report = reports.get_report(userdetails, job.report, **get_filters(job.params))
+
+    chunks = []
+    size = 0
+    for chunk in exporter.encode(report, job.format):
+        chunks.append(chunk.encode())
+        size += len(chunks[-1])
+        if size > MAX_RESULT_SIZE:
+            finish(job_id, FAILED, error='The report is too large')
+            return
+        if not is_running(job_id):
+            return
+    finish(job_id, DONE, result=b''.join(chunks))
+
+def execute(job_id):
+    """Build the report of a claimed job, in a worker process"""
+    with _worker_app.app_context():
+        try:
+            build(job_id)
+        except Exception:
+            db.session.rollback()
+            _worker_app.logger.exception('Report job %s failed', job_id)
+            finish(job_id, FAILED, error='The report could not be built')
+        finally:
+            db.session.remove()
+
+def claim():
+    """Claim the oldest queued job
+
+    Returns:
+        Integer ID of the claimed job, or None if the queue is empty
+    """
+    candidates = [id for id, in db.session.query(Job.id).filter(Job.status == QUEUED).order_by(Job.id).limit(10)]
+    for id in candidates:
+        claimed = Job.query.filter(Job.id == id, Job.status == QUEUED).update({
+            Job.status: RUNNING,
+            Job.started: datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return id
+    return None
+
+def release(job_id):
+    """Put a claimed job back on the queue"""
+    Job.query.filter(Job.id == job_id, Job.status == RUNNING).update({
+        Job.status: QUEUED,
+        Job.started: None
+    }, synchronize_session=False)
+    db.session.commit()
+
+def finished(app, job_id, future):
+    """Free a job's worker once it finishes, and claim the next queued job"""
+    with _lock:
+        _running.pop(job_id, None)
+
+    def next_job():
+        with app.app_context():
+            try:
+                if not future.cancelled() and future.exception():
+                    # The worker process died, e.g. it ran out of memory, which breaks the pool
+                    reset()
+                    app.logger.error('Report job %s stopped: %s', job_id, future.exception())
+                    finish(job_id, FAILED, error='The report could not be built')
+                dispatch()
+            except Exception:
+                app.logger.exception('Could not claim the next report job')
+            finally:
+                db.session.remove()
+
+    # Called back from the pool's thread, so claim from a thread with a session of its own
+    threading.Thread(target=next_job, name='dontbudge-jobs', daemon=True).start()
+
+def dispatch():
+    """Start queued jobs on this process's free workers"""
+    app = current_app._get_current_object()
+    with _lock:
+        executor = get_executor(app)
+        while len(_running) < _workers:
+            job_id = claim()
+            if job_id is None:
+                break
+            try:
+                future = executor.submit(execute, job_id)
+            except BrokenProcessPool:
+                reset()
+                executor = get_executor(app)
+                future = executor.submit(execute, job_id)
+            except RuntimeError:
+                # The process is shutting down, so leave the job to another
+                release(job_id)
+                break
+            _running[job_id] = future
+            future.add_done_callback(lambda future, job_id=job_id: finished(app, job_id, future))
+
+def expire():
+    """Fail jobs that have run for longer than TIMEOUT, and delete old finished jobs"""
+    now = datetime.utcnow()
+    Job.query.filter(
+        Job.status == RUNNING,
+        Job.started < now - timedelta(seconds=TIMEOUT)
+    ).update({Job.status: FAILED, Job.error: 'The report timed out', Job.finished: now}, synchronize_session=False)
+    Job.query.filter(
+        Job.status.notin_(ACTIVE),
+        Job.finished < now - RETENTION
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+def enqueue(userdetails, report, format, params):
+    """Queue a report job for a user, and start it if a worker is free
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to report on
+        report -> String: One of dontbudge.dashboard.reports.REPORTS
+        format -> String: One of dontbudge.dashboard.exporter.FORMATS
+        params -> Dictionary: Filters of the report, with dates as YYYY-MM-DD strings
+
+    Returns:
+        The queued dontbudge.api.models.Job, or None if the user already has
+        the most jobs queued or running they are allowed
+    """
+    expire()
+    active = Job.query.filter(Job.user_id == userdetails.id, Job.status.in_(ACTIVE)).count()
+    if active >= _user_limit:
+        return None
+
+    job = Job(userdetails.id, report, format, params, QUEUED, datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    dispatch()
+    return job
+
+def cancel(job_id):
+    """Cancel a queued or running job
+
+    Returns:
+        Boolean whether the job was cancelled, False if it had already finished
+    """
+    cancelled = Job.query.filter(Job.id == job_id, Job.status.in_(ACTIVE)).update({
+        Job.status: CANCELLED,
+        Job.finished: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    with _lock:
+        future = _running.get(job_id)
+    if future:
+        future.cancel()
+    return bool(cancelled)
+
+def init_app(app):
+    """Configures the report job queue from the Flask app's config"""
+    configure(
+        app.config.get('REPORT_WORKERS', WORKERS),
+        app.config.get('REPORT_USER_LIMIT', USER_LIMIT)
+    )
@@ -0,0 +1,177 @@
+"""Migrations
+
+A lightweight schema migration path for existing databases. db.create_all only
+creates missing tables, so changes to tables that already exist (new indexes,
+new columns, ...) are made here instead.
+
+Each migration is a function registered with the @migration decorator and is
+run once, in the order it is defined. Applied migrations are recorded by name
+in the schema_migrations table. Migrations must be safe to run against a
+database that already has the change, e.g. one freshly made by create_all, or
+one being migrated by another gunicorn worker at the same time.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text, Numeric
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from dontbudge.database import db
+from dontbudge.api.models import Account, Bill, Budget, Transaction, PeriodSummary, UserDetails
+from dontbudge.auth.models import User
+
+MIGRATIONS = []
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('name', db.String(100), primary_key=True),
+    db.Column('applied', db.DateTime)
+)
+
+def migration(f):
+    """Registers a function as a migration"""
+    MIGRATIONS.append(f)
+    return f
+
+def create_indexes(table):
+    """Create any indexes declared on a model's table that do not exist yet"""
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            try:
+                index.create(bind=db.engine)
+            except (OperationalError, ProgrammingError):
+                # Created by another worker in the meantime
+                pass
+
+def add_columns(table, *names):
+    """Add columns declared on a model's table that do not exist yet
+
+    Args:
+        table -> sqlalchemy.Table: Table of the model, e.g. Model.__table__
+        names -> String: Names of the columns to add
+    """
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.columns[name]
+        ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}'
+        if column.server_default is not None:
+            ddl += f" DEFAULT '{column.server_default.arg}'"
+        if not column.nullable:
+            ddl += ' NOT NULL'
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(ddl))
+        except (OperationalError, ProgrammingError):
+            # Added by another worker in the meantime
+            pass
+
+@migration
+def transaction_indexes():
+    create_indexes(Transaction.__table__)
+
+@migration
+def period_summary_indexes():
+    create_indexes(PeriodSummary.__table__)
+
+@migration
+def userdetails_version():
+    add_columns(UserDetails.__table__, 'version')
+
+@migration
+def user_token_version():
+    add_columns(User.__table__, 'token_version')
+
+@migration
+def transaction_import_hash():
+    add_columns(Transaction.__table__, 'import_hash')
+    create_indexes(Transaction.__table__)
+
+@migration
+def transaction_null_references():
+    # Transactions saved without a bill, category or budget used to store the
+    # string 'None', which SQLite accepted in their integer columns
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        for column in ('bill_id', 'category_id', 'budget_id'):
+            connection.execute(text(f"UPDATE transactions SET {column} = NULL WHERE {column} = 'None'"))
+
+@migration
+def amounts_in_cents():
+    # Amounts were Numeric dollars and are now integer cents (dontbudge.money).
+    # Multiplying by 100 must happen exactly once, so the migration is recorded
+    # first, in the same database transaction: a worker migrating concurrently
+    # waits on it and then finds it already recorded.
+    columns = [
+        (Account.__table__, 'balance'),
+        (Bill.__table__, 'amount'),
+        (Budget.__table__, 'amount'),
+        (Transaction.__table__, 'amount'),
+        (PeriodSummary.__table__, 'income'),
+        (PeriodSummary.__table__, 'spending')
+    ]
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(schema_migrations.insert().values(name='amounts_in_cents', applied=datetime.now()))
+            inspector = inspect(connection)
+            for table, name in columns:
+                existing = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+                if not isinstance(existing.get(name), Numeric):
+                    # Created as integer cents by create_all
+                    continue
+                if connection.dialect.name == 'sqlite':
+                    # SQLite cannot change a column's type, but stores whatever it is given
+                    connection.execute(text(f'UPDATE {table.name} SET {name} = CAST(ROUND({name} * 100) AS INTEGER) WHERE {name} IS NOT NULL'))
+                else:
+                    connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {name} TYPE BIGINT USING ROUND({name} * 100)'))
+    except IntegrityError:
+        # Applied by another worker
+        pass
+
+@migration
+def bill_account():
+    add_columns(Bill.__table__, 'account_id')
+
+@migration
+def userdetails_user_id_index():
+    create_indexes(UserDetails.__table__)
+
+@migration
+def account_balances():
+    # Accounts created before balances were maintained have a NULL balance,
+    # rebuilt here from their history. An account's balance is only ever set
+    # from NULL once, so a worker migrating concurrently changes nothing.
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'UPDATE accounts SET balance = COALESCE((SELECT SUM(transactions.amount) FROM transactions WHERE transactions.account_id = accounts.id), 0) '
+            'WHERE balance IS NULL'
+        ))
+
+def get_pending():
+    """Get the migrations that have not been applied yet"""
+    schema_migrations.create(bind=db.engine, checkfirst=True)
+    applied = {row.name for row in db.session.execute(schema_migrations.select())}
+    return [f for f in MIGRATIONS if f.__name__ not in applied]
+
+def upgrade():
+    """Apply every pending migration
+
+    Returns:
+        List of the names of the migrations applied
+    """
+    applied = []
+    for f in get_pending():
+        f()
+        try:
+            db.session.execute(schema_migrations.insert().values(name=f.__name__, applied=datetime.now()))
+            db.session.commit()
+        except IntegrityError:
+            # Recorded by another worker in the meantime
+            db.session.rollback()
+        applied.append(f.__name__)
+    return applied
+
+def init_app(app):
+    """Applies pending migrations to the app's database"""
+    with app.app_context():
+        upgrade()
@@ -0,0 +1,53 @@
+"""Money
+
+Amounts are stored as whole numbers of cents in BIGINT columns. The database
+sums integers exactly and cheaply, where SQLite would otherwise store Numeric
+columns as floating point, and rounding happens once, when an amount is saved.
+
+The Money column type converts to and from Decimal dollars at the edges, so
+models, forms, templates and the API keep working in Decimal. Code that adds
+up many amounts can select them as raw cents with cents() and sum plain
+integers, converting only the totals back with from_cents().
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.sql.expression import type_coerce
+
+CENT = Decimal('0.01')
+# Largest amount accepted from users, leaving room to sum many in 64 bits
+MAX_AMOUNT = Decimal(10) ** 12
+
+def to_cents(amount):
+    """Convert an amount of dollars to an integer number of cents
+
+    Args:
+        amount -> Decimal, Integer or String: Amount in dollars, rounded half up to the cent
+
+    Returns:
+        Integer number of cents
+    """
+    return int(Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+def from_cents(cents):
+    """Convert an integer number of cents to a Decimal amount of dollars, e.g. 1250 to Decimal('12.50')"""
+    return Decimal(cents).scaleb(-2)
+
+def cents(column):
+    """Select a Money column or expression as its raw integer cents"""
+    return type_coerce(column, BigInteger)
+
+class Money(TypeDecorator):
+    """Column type storing a Decimal amount of dollars as integer cents"""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_cents(value)
@@ -0,0 +1,259 @@
+"""Scheduler
+
+Background jobs that keep every user's data current without waiting for them
+to visit. For each user, a run:
+
+* Pays bills set to be paid automatically from an account, posting a
+  transaction for every occurrence that has fallen due and moving the bill on
+  to its next occurrence, just as linking a transaction to it by hand does.
+* Rolls the user on to the period containing today, however many periods have
+  ended, taking a snapshot of each (see dontbudge.dashboard.aggregation).
+* Takes the snapshots of closed periods that do not have one yet, so period
+  pages never calculate them on a request.
+
+Runs happen every SCHEDULER_INTERVAL seconds in a background thread of each app
+process when SCHEDULER is set, or in a separate process with
+`flask scheduler run`. Either way a run first takes a lease on a row of the
+locks table, so only one process runs at a time across every gunicorn worker
+and host, and the lease is then held until the next run is due. A lease held
+by a process that died expires on its own.
+"""
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from dontbudge.database import db
+from dontbudge.api.models import UserDetails, Account, Bill, Transaction, PeriodSummary
+from dontbudge.api import balances, snapshots, versions
+from dontbudge.dashboard import aggregation, utility
+
+LOCK = 'scheduler'
+INTERVAL = 3600
+LEASE = 600
+MAX_PAYMENTS = 100
+
+locks = db.Table(
+    'locks',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('owner', db.String(100)),
+    db.Column('expires', db.DateTime)
+)
+
+Run = namedtuple('Run', [
+    'users',
+    'payments',
+    'periods',
+    'snapshots'
+])
+
+# Data version of each user when their snapshots were last precomputed here
+_precomputed = {}
+
+def get_owner():
+    """Identify this process and thread to other lease holders"""
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+def acquire(name, owner, seconds):
+    """Take or extend a lease, if it is free, expired or already ours
+
+    Args:
+        name -> String: Name of the lease
+        owner -> String: Identity of the process taking it
+        seconds -> Integer: How long to hold it for
+
+    Returns:
+        Boolean whether the lease is held
+    """
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=seconds)
+    try:
+        db.session.execute(locks.insert().values(name=name, owner=owner, expires=expires))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+
+    result = db.session.execute(locks.update().where(
+        locks.c.name == name,
+        or_(locks.c.owner == owner, locks.c.expires < now)
+    ).values(owner=owner, expires=expires))
+    db.session.commit()
+    return result.rowcount == 1
+
+def pay_bills(userdetails, today):
+    """Pay every due occurrence of a user's automatically paid bills
+
+    Each occurrence moves the bill on with a conditional update first, so an
+    occurrence paid by hand at the same moment is never paid twice. The caller
+    is responsible for committing.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to pay the bills of
+        today -> date: Bills due on or before this day are paid
+
+    Returns:
+        Integer number of transactions posted
+    """
+    end = datetime.combine(today + timedelta(days=1), datetime.min.time())
+    accounts = {id for id, in db.session.query(Account.id).filter(Account.user_id == userdetails.id)}
+    bills = Bill.query.filter(
+        Bill.user_id == userdetails.id,
+        Bill.account_id.isnot(None),
+        Bill.start < end
+    ).all()
+
+    dates = []
+    for bill in bills:
+        if bill.account_id not in accounts or bill.amount is None:
+            continue
+        step = utility.get_relative(bill.occurence)
+        due = bill.start
+        # Bounded, so a bill started long ago is caught up over several runs
+        for _ in range(MAX_PAYMENTS):
+            if due >= end:
+                break
+            moved = Bill.query.filter_by(id=bill.id, start=due).update({Bill.start: due + step}, synchronize_session=False)
+            if not moved:
+                break
+            transaction = Transaction(userdetails.id, bill.account_id, bill.name, due, bill.amount * -1, bill_id=bill.id)
+            db.session.add(transaction)
+            balances.apply(transaction)
+            dates.append(due)
+            due += step
+
+    if dates:
+        snapshots.invalidate_from(userdetails, min(dates))
+    return len(dates)
+
+def precompute(userdetails):
+    """Take the snapshot of every closed period of a user that does not have one
+
+    Skipped if the user's data has not changed since it last ran in this process.
+
+    Args:
+        userdetails -> dontbudge.api.models.UserDetails: User to take snapshots of
+
+    Returns:
+        Integer number of snapshots taken
+    """
+    if _precomputed.get(userdetails.id) == userdetails.version:
+        return 0
+
+    existing = {(start, end) for start, end in db.session.query(PeriodSummary.start, PeriodSummary.end).filter(PeriodSummary.user_id == userdetails.id)}
+    taken = 0
+    for period in utility.get_periods(userdetails):
+        if snapshots.is_closed(userdetails, period) and (period.start, period.end) not in existing:
+            snapshots.take(userdetails, period)
+            taken += 1
+    if taken:
+        db.session.commit()
+    _precomputed[userdetails.id] = userdetails.version
+    return taken
+
+def run_once(today=None, owner=None):
+    """Bring every user up to date
+
+    Each user is committed separately, and a user that fails is logged and
+    skipped. If an owner is given, its lease is extended as the run goes and
+    the run stops should it be lost.
+
+    Args:
+        today -> date: Date to bring users up to, defaults to today
+        owner -> String: Identity of the process holding the scheduler lease
+
+    Returns:
+        A dontbudge.scheduler.Run of what was done
+    """
+    today = today or date.today()
+    ids = [id for id, in db.session.query(UserDetails.id).order_by(UserDetails.id)]
+    renewed = time.monotonic()
+    users = payments = periods = taken = 0
+    for id in ids:
+        if owner and time.monotonic() - renewed > LEASE / 3:
+            if not acquire(LOCK, owner, LEASE):
+                current_app.logger.warning('Scheduler lease lost, stopping the run')
+                break
+            renewed = time.monotonic()
+
+        try:
+            userdetails = UserDetails.query.filter_by(id=id).first()
+            if userdetails is None:
+                continue
+            paid = pay_bills(userdetails, today)
+            if paid:
+                versions.bump(userdetails)
+                db.session.commit()
+            payments += paid
+            periods += aggregation.update_period(userdetails, today)
+            taken += precompute(userdetails)
+            users += 1
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Scheduler failed for user %s', id)
+    return Run(users, payments, periods, taken)
+
+def run(interval=INTERVAL, owner=None):
+    """Bring every user up to date, unless another process holds the lease
+
+    The lease is kept for an interval afterwards, so the other processes wait
+    for the next run to be due.
+
+    Args:
+        interval -> Integer: Seconds until the next run is due
+        owner -> String: Identity of this process, defaults to its host, PID and thread
+
+    Returns:
+        A dontbudge.scheduler.Run, or None if another process holds the lease
+    """
+    owner = owner or get_owner()
+    if not acquire(LOCK, owner, LEASE):
+        return None
+    result = run_once(owner=owner)
+    acquire(LOCK, owner, interval)
+    return result
+
+def start(app):
+    """Start running the scheduler every interval in a background thread"""
+    interval = app.config.get('SCHEDULER_INTERVAL', INTERVAL)
+
+    def loop():
+        while True:
+            with app.app_context():
+                try:
+                    result = run(interval)
+                    if result:
+                        app.logger.info('Scheduler run: %s', result)
+                except Exception:
+                    app.logger.exception('Scheduler run failed')
+                finally:
+                    db.session.remove()
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name='dontbudge-scheduler', daemon=True).start()
+
+def init_app(app):
+    """Runs the scheduler in the background of every app process, if enabled by its SCHEDULER config
+
+    The thread is started by the first request a process handles, so it runs
+    in gunicorn's workers rather than in its master or in CLI commands.
+    """
+    if not app.config.get('SCHEDULER'):
+        return
+
+    started = {}
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_scheduler():
+        pid = os.getpid()
+        if started.get('pid') == pid:
+            return
+        with lock:
+            if started.get('pid') != pid:
+                start(app)
+                started['pid'] = pid
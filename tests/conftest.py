@@ -0,0 +1,77 @@
+"""Test fixtures
+
+The tests run against the database at DONTBUDGE_DATABASE_URL, e.g.
+postgresql://postgres@localhost/dontbudge_test, or a throwaway SQLite file
+when it is not set. Every table in the database is dropped before each test,
+so never point it at a database whose data you want to keep.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'test')
+
+from sqlalchemy import create_engine, MetaData
+import dontbudge
+from dontbudge import database
+from dontbudge.database import db
+from dontbudge.auth import jwt
+
+DATABASE_URL = os.environ.get('DONTBUDGE_DATABASE_URL')
+USERNAME = 'bob'
+PASSWORD = 'secret1'
+
+@pytest.fixture
+def database_url(tmp_path):
+    """URL of an empty database"""
+    if not DATABASE_URL:
+        return f'sqlite:///{tmp_path / "test.sqlite3"}'
+    engine = create_engine(database.get_url(DATABASE_URL))
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    metadata.drop_all(bind=engine)
+    engine.dispose()
+    return DATABASE_URL
+
+@pytest.fixture
+def make_app(database_url, monkeypatch):
+    """Get a function that creates an app on the test database, as a new worker would"""
+    monkeypatch.setattr(dontbudge, 'DATABASE_URL', database_url)
+    # Users of one test's database must not be authenticated from the
+    # versions cached for another's
+    jwt._verified.entries.clear()
+    jwt._versions.entries.clear()
+    apps = []
+
+    def make():
+        app = dontbudge.create_app()
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as a newly registered user"""
+    client = app.test_client()
+    client.post('/register', data={'username': USERNAME, 'password': PASSWORD, 'password_confirm': PASSWORD})
+    response = client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+    assert response.status_code == 302
+    return client
+
+@pytest.fixture
+def api_headers(client):
+    """Headers authenticating API requests as the client's user"""
+    response = client.post('/api/v1/token', json={'username': USERNAME, 'password': PASSWORD})
+    return {'Authorization': f'Bearer {response.get_json()["token"]}'}
@@ -0,0 +1,75 @@
+"""Tests of the REST API"""
+import pytest
+from sqlalchemy import text
+from dontbudge.database import db
+from dontbudge.api.models import Account, Transaction
+
+@pytest.mark.parametrize('amount, error', [
+    ('NaN', 'amount must be a number'),
+    ('-Infinity', 'amount must be a number'),
+    ('"sNaN"', 'amount must be a number'),
+    ('"ten"', 'amount must be a number'),
+    ('-12.345', 'amount can not be smaller than a cent'),
+    ('0.001', 'amount can not be smaller than a cent'),
+    ('1e12', 'amount must be less than 1000000000000'),
+    ('1e30', 'amount must be less than 1000000000000')
+])
+def test_invalid_amounts(client, api_headers, amount, error):
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main'}, headers=api_headers).get_json()['id']
+    body = f'{{"account_id": {account_id}, "description": "Shop", "amount": {amount}}}'
+    response = client.post('/api/v1/transactions', data=body, content_type='application/json', headers=api_headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+def test_amounts_are_kept_to_the_cent(client, api_headers):
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main'}, headers=api_headers).get_json()['id']
+    for amount, stored in (('-12.34', '-12.34'), ('5', '5.00'), ('0.10', '0.10'), (2.5, '2.50')):
+        response = client.post('/api/v1/transactions', json={'account_id': account_id, 'description': 'Shop', 'amount': amount}, headers=api_headers)
+        assert response.status_code == 201
+        assert response.get_json()['amount'] == stored
+
+def test_ids_are_not_booleans(client, api_headers):
+    # JSON true would otherwise be taken as the ID 1
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main'}, headers=api_headers).get_json()['id']
+    assert account_id == 1
+    response = client.post('/api/v1/transactions', json={'account_id': True, 'description': 'Shop', 'amount': '1'}, headers=api_headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'account_id does not refer to one of your accounts'
+
+    response = client.post('/api/v1/batch', headers=api_headers, json={'operations': [
+        {'action': 'update', 'resource': 'accounts', 'id': True, 'data': {'name': 'Renamed'}}
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'id must be an integer'
+
+def test_failed_batch_changes_nothing(app, client, api_headers):
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '10'}, headers=api_headers).get_json()['id']
+    with app.app_context():
+        # As an account from before balances were maintained
+        db.session.execute(text('UPDATE accounts SET balance = NULL'))
+        db.session.commit()
+
+    response = client.post('/api/v1/batch', headers=api_headers, json={'operations': [
+        {'action': 'update', 'resource': 'accounts', 'id': account_id, 'data': {'name': 'Renamed'}},
+        {'action': 'create', 'resource': 'transactions', 'data': {'account_id': account_id, 'description': 'Pay', 'amount': '5'}},
+        {'action': 'create', 'resource': 'transactions', 'data': {'account_id': account_id, 'description': 'Shop', 'amount': 'bad'}}
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 2
+
+    with app.app_context():
+        account = Account.query.filter_by(id=account_id).first()
+        assert account.name == 'Main'
+        assert account.balance is None
+        assert Transaction.query.filter_by(account_id=account_id).count() == 1
+    assert client.get(f'/api/v1/accounts/{account_id}', headers=api_headers).get_json()['balance'] == '10.00'
+
+def test_forecast(client, api_headers):
+    client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '100'}, headers=api_headers)
+    response = client.get('/api/v1/forecast?periods=1', headers=api_headers)
+    assert response.status_code == 200
+    forecast = response.get_json()
+    assert forecast['accounts'][0]['name'] == 'Main'
+    assert len(forecast['total']) == forecast['days']
+    assert client.get('/api/v1/forecast?periods=1', headers={**api_headers, 'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/v1/forecast', headers={'Authorization': 'Bearer invalid'}).get_json() == {'error': 'Authentication required'}
@@ -0,0 +1,62 @@
+"""Tests of logging in and out with JWT tokens"""
+import datetime
+import hashlib
+import jwt as pyjwt
+from sqlalchemy import text
+import dontbudge
+from dontbudge.database import db
+from dontbudge.auth.models import User
+from conftest import USERNAME, PASSWORD
+
+def login(app):
+    client = app.test_client()
+    response = client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+    assert response.status_code == 302
+    return client
+
+def get_token(client):
+    return next(cookie.value for cookie in client.cookie_jar if cookie.name == 'token')
+
+def test_logout_only_revokes_its_own_token(app, client, api_headers):
+    other = login(app)
+    token = get_token(client)
+    assert client.get('/logout').status_code == 302
+
+    # The logged out token is rejected, the user's other sessions and API tokens are not
+    client.set_cookie('localhost', 'token', token)
+    assert client.get('/account/view').headers['Location'].endswith('/login')
+    assert other.get('/account/view').status_code == 200
+    assert other.get('/api/v1/accounts', headers=api_headers).status_code == 200
+    assert login(app).get('/account/view').status_code == 200
+
+def test_logout_of_token_without_id_revokes_every_token(app, client, api_headers):
+    with app.app_context():
+        user = User.query.first()
+        claims = {'id': user.id, 'username': user.username, 'ver': user.token_version, 'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)}
+    old = app.test_client()
+    old.set_cookie('localhost', 'token', pyjwt.encode(claims, dontbudge.SECRET))
+    assert old.get('/account/view').status_code == 200
+    old.get('/logout')
+    assert client.get('/api/v1/accounts', headers=api_headers).status_code == 401
+
+def test_deleted_user_is_not_authenticated(app, client, api_headers):
+    assert client.get('/account/view').status_code == 200
+    with app.app_context():
+        # Deleted by another worker, while this one still has the user's token version cached
+        db.session.execute(text('DELETE FROM userdetails'))
+        db.session.execute(text('DELETE FROM users'))
+        db.session.commit()
+    assert client.get('/account/view').headers['Location'].endswith('/login')
+    assert client.get('/api/v1/accounts', headers=api_headers).status_code == 401
+
+def test_api_token_upgrades_legacy_password(app, client):
+    with app.app_context():
+        User.query.first().password = hashlib.md5(PASSWORD.encode()).hexdigest()
+        db.session.commit()
+
+    assert client.post('/api/v1/token', json={'username': USERNAME, 'password': 'wrong'}).status_code == 401
+    response = client.post('/api/v1/token', json={'username': USERNAME, 'password': PASSWORD})
+    assert response.status_code == 200
+    with app.app_context():
+        assert User.query.first().password.startswith('scrypt$')
+    assert client.post('/api/v1/token', json={'username': USERNAME, 'password': PASSWORD}).status_code == 200
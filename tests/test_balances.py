@@ -0,0 +1,20 @@
+"""Tests of the materialised account balances"""
+from sqlalchemy import text
+from dontbudge.database import db
+
+def test_rebuild_clears_cached_balances(app, client, api_headers):
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '10'}, headers=api_headers).get_json()['id']
+    with app.app_context():
+        db.session.execute(text('UPDATE accounts SET balance = balance + 500'))
+        db.session.commit()
+    assert client.get('/api/v1/summary', headers=api_headers).get_json()['accounts'][0]['balance'] == '15.00'
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['balances', 'verify'])
+    assert result.exit_code == 1
+    assert f'Account {account_id} (Main): stored 15.00, expected 10.00' in result.output
+
+    result = runner.invoke(args=['balances', 'rebuild'])
+    assert 'Rebuilt 1 balance(s).' in result.output
+    assert client.get('/api/v1/summary', headers=api_headers).get_json()['accounts'][0]['balance'] == '10.00'
+    assert runner.invoke(args=['balances', 'verify']).exit_code == 0
@@ -0,0 +1,199 @@
+"""Tests of the database layer, run against SQLite or PostgreSQL (see conftest)"""
+import csv
+import hashlib
+import io
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, inspect, text, MetaData, Table, Column, Integer, String, DateTime, Numeric, ForeignKey, JSON
+from sqlalchemy.exc import DatabaseError
+from dontbudge import database, migrations
+from dontbudge.database import db
+from dontbudge.api import balances
+from dontbudge.api.models import Account, Bill, Budget, Transaction, PeriodSummary, UserDetails
+from dontbudge.auth.models import User
+from dontbudge.dashboard import exporter
+
+def create_legacy_database(url):
+    """Create the tables as they were before any migration, with amounts in Numeric dollars, and a user with some data"""
+    metadata = MetaData()
+    users = Table('users', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('username', String(100), unique=True),
+        Column('password', String(100))
+    )
+    userdetails = Table('userdetails', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id')),
+        Column('name', String(15)),
+        Column('range', String(4)),
+        Column('period_start', DateTime),
+        Column('period_end', DateTime)
+    )
+    accounts = Table('accounts', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('userdetails.id', ondelete='CASCADE')),
+        Column('name', String(100)),
+        Column('balance', Numeric(12, 2))
+    )
+    bills = Table('bills', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('userdetails.id')),
+        Column('start', DateTime),
+        Column('name', String(50)),
+        Column('occurence', String(4)),
+        Column('amount', Numeric(12, 2))
+    )
+    budgets = Table('budgets', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('userdetails.id')),
+        Column('name', String(100)),
+        Column('amount', Numeric(12, 2))
+    )
+    Table('categories', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('userdetails.id')),
+        Column('name', String(100))
+    )
+    transactions = Table('transactions', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('userdetails.id')),
+        Column('account_id', Integer, ForeignKey('accounts.id')),
+        Column('bill_id', Integer, ForeignKey('bills.id')),
+        Column('category_id', Integer, ForeignKey('categories.id')),
+        Column('budget_id', Integer, ForeignKey('budgets.id')),
+        Column('description', String(100)),
+        Column('date', DateTime),
+        Column('amount', Numeric(12, 2))
+    )
+    period_summaries = Table('period_summaries', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('userdetails.id')),
+        Column('start', DateTime),
+        Column('end', DateTime),
+        Column('income', Numeric(12, 2)),
+        Column('spending', Numeric(12, 2)),
+        Column('categories', JSON),
+        Column('budgets', JSON)
+    )
+
+    start = datetime(2021, 11, 1)
+    engine = create_engine(database.get_url(url))
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(users.insert().values(id=1, username='bob', password=hashlib.md5(b'secret1').hexdigest()))
+        connection.execute(userdetails.insert().values(id=1, user_id=1, name='bob', range='2W', period_start=start, period_end=start + timedelta(weeks=2)))
+        connection.execute(accounts.insert().values(id=1, user_id=1, name='Main', balance=Decimal('1012.84')))
+        connection.execute(accounts.insert().values(id=2, user_id=1, name='Savings', balance=None))
+        connection.execute(bills.insert().values(id=1, user_id=1, start=start, name='Rent', occurence='1M', amount=Decimal('500.50')))
+        connection.execute(budgets.insert().values(id=1, user_id=1, name='Groceries', amount=Decimal('200')))
+        connection.execute(transactions.insert(), [
+            {'id': 1, 'user_id': 1, 'account_id': 1, 'description': 'Initial Balance', 'date': start, 'amount': Decimal('1000')},
+            {'id': 2, 'user_id': 1, 'account_id': 1, 'description': 'Refund', 'date': start + timedelta(days=1), 'amount': Decimal('13.34')},
+            {'id': 3, 'user_id': 1, 'account_id': 1, 'budget_id': 1, 'description': 'Shop', 'date': start + timedelta(days=2), 'amount': Decimal('-0.50')},
+            {'id': 4, 'user_id': 1, 'account_id': 2, 'description': 'Save', 'date': start + timedelta(days=3), 'amount': Decimal('50.25')}
+        ])
+        connection.execute(period_summaries.insert().values(id=1, user_id=1, start=start - timedelta(weeks=2), end=start, income=Decimal('12.34'), spending=Decimal('0.01'), categories={}, budgets={}))
+    engine.dispose()
+
+def test_upgrade_legacy_database(database_url, make_app):
+    create_legacy_database(database_url)
+    app = make_app()
+
+    with app.app_context():
+        assert migrations.get_pending() == []
+        inspector = inspect(db.engine)
+        columns = {table: {column['name']: column for column in inspector.get_columns(table)} for table in ('users', 'userdetails', 'bills', 'transactions')}
+        assert not columns['users']['token_version']['nullable']
+        assert not columns['userdetails']['version']['nullable']
+        assert 'account_id' in columns['bills']
+        assert 'import_hash' in columns['transactions']
+        assert 'ix_userdetails_user_id' in {index['name'] for index in inspector.get_indexes('userdetails')}
+
+        # Existing rows get the server default of the new NOT NULL columns
+        assert User.query.filter_by(id=1).first().token_version == 0
+        assert UserDetails.query.filter_by(id=1).first().version == 0
+
+        # Amounts are stored as integer cents
+        assert db.session.execute(text('SELECT balance FROM accounts WHERE id = 1')).scalar() == 101284
+        assert sorted(db.session.execute(text('SELECT amount FROM transactions')).scalars()) == [-50, 1334, 5025, 100000]
+        assert db.session.execute(text('SELECT income, spending FROM period_summaries')).one() == (1234, 1)
+        assert Account.query.filter_by(id=1).first().balance == Decimal('1012.84')
+        assert Bill.query.filter_by(id=1).first().amount == Decimal('500.50')
+        assert Budget.query.filter_by(id=1).first().amount == Decimal('200.00')
+        assert PeriodSummary.query.filter_by(id=1).first().income == Decimal('12.34')
+        # Balances that were never set are rebuilt from their history
+        assert Account.query.filter_by(id=2).first().balance == Decimal('50.25')
+        assert balances.verify() == []
+
+    # Migrations are only applied once, however many workers start
+    make_app()
+    with app.app_context():
+        assert Transaction.query.filter_by(id=2).first().amount == Decimal('13.34')
+
+    # The legacy MD5 password still logs in
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'bob', 'password': 'secret1'})
+    assert response.status_code == 302
+    assert client.get('/account/view').status_code == 200
+
+def test_create_all_retry(make_app, monkeypatch):
+    create_all = db.create_all
+    calls = []
+
+    def create_all_once_failing(*args, **kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            # As if another worker were creating the tables at the same time
+            create_all(*args, **kwargs)
+            raise DatabaseError('CREATE TABLE', {}, Exception('duplicate key value violates unique constraint'))
+        return create_all(*args, **kwargs)
+
+    monkeypatch.setattr(db, 'create_all', create_all_once_failing)
+    app = make_app()
+    assert len(calls) == 2
+    with app.app_context():
+        assert set(inspect(db.engine).get_table_names()) >= {table.name for table in db.metadata.sorted_tables}
+
+def test_api_round_trip(client, api_headers):
+    account = client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '100.10'}, headers=api_headers).get_json()
+    budget = client.post('/api/v1/budgets', json={'name': 'Groceries', 'amount': '50'}, headers=api_headers).get_json()
+    response = client.post('/api/v1/batch', headers=api_headers, json={'operations': [
+        {'action': 'create', 'resource': 'transactions', 'data': {'account_id': account['id'], 'description': 'Shop', 'amount': '-20.05', 'budget_id': budget['id']}},
+        {'action': 'create', 'resource': 'transactions', 'data': {'account_id': account['id'], 'description': 'Pay', 'amount': '1000'}}
+    ]})
+    assert response.status_code == 200
+
+    account = client.get(f'/api/v1/accounts/{account["id"]}', headers=api_headers).get_json()
+    assert Decimal(account['balance']) == Decimal('1080.05')
+    summary = client.get('/api/v1/summary', headers=api_headers).get_json()
+    assert summary['accounts'][0]['balance'] == '1080.05'
+    assert summary['budgets'][0]['used'] == '20.05'
+    for path in ('/', '/account/view', '/period/view/0', '/budget/view', '/savings'):
+        assert client.get(path).status_code == 200
+
+def test_export_transactions(app, client, api_headers):
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main'}, headers=api_headers).get_json()['id']
+    count = exporter.BATCH_SIZE * 2 + 1
+    start = datetime(2021, 1, 1)
+    with app.app_context():
+        userdetails_id = UserDetails.query.first().id
+        db.session.bulk_insert_mappings(Transaction, [
+            {'user_id': userdetails_id, 'account_id': account_id, 'description': f'Transaction {i}', 'date': start + timedelta(hours=i), 'amount': Decimal(i) / 100}
+            for i in range(count)
+        ])
+        db.session.commit()
+
+    # Fetched through a streaming result, a batch at a time
+    response = client.get('/export/transactions.csv')
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['id', 'date', 'description', 'amount', 'account', 'category', 'budget', 'bill']
+    assert len(rows) == count + 1
+    assert [row[2] for row in rows[1:]] == [f'Transaction {i}' for i in range(count)]
+    assert rows[-1][3] == f'{Decimal(count - 1) / 100:.2f}'
+
+    response = client.get(f'/export/transactions.ndjson?account={account_id}&start=2021-01-02&end=2021-01-03')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['description'] for line in lines] == [f'Transaction {i}' for i in range(24, 48)]
+    assert lines[0]['account'] == 'Main'
@@ -0,0 +1,123 @@
+"""Tests of importing bank exports"""
+import io
+from datetime import datetime
+from decimal import Decimal
+import pytest
+from dontbudge.api import balances, importer
+from dontbudge.api.models import Account, Transaction, UserDetails
+
+@pytest.fixture
+def account_id(client, api_headers):
+    return client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '100'}, headers=api_headers).get_json()['id']
+
+def run_import(app, account_id, text, format='csv', **kwargs):
+    """Import an export into the account, returning the ImportResult and the account's balance"""
+    with app.app_context():
+        userdetails = UserDetails.query.first()
+        account = Account.query.filter_by(id=account_id).first()
+        result = importer.import_transactions(userdetails, account, io.StringIO(text), format, **kwargs)
+        assert balances.verify() == []
+        return result, Account.query.filter_by(id=account_id).first().balance
+
+def test_amounts_are_kept_to_the_cent(app, account_id):
+    result, balance = run_import(app, account_id, 'date,description,amount\n2022-01-03,Shop,0.005\n2022-01-03,Shop,0.005\n2022-01-04,Pay,12.5\n')
+    assert result == importer.ImportResult(read=3, imported=1, duplicates=0, skipped=2)
+    assert balance == Decimal('112.50')
+
+    # The same row written with trailing zeros is a duplicate
+    result, balance = run_import(app, account_id, 'date,description,amount\n2022-01-04,Pay,12.50\n2022-01-04,Pay,12.500\n')
+    assert result == importer.ImportResult(read=2, imported=1, duplicates=1, skipped=0)
+    assert balance == Decimal('125.00')
+
+@pytest.mark.parametrize('text, amount', [
+    ('12', Decimal('12.00')),
+    ('-0.5', Decimal('-0.50')),
+    ('1,234.50', Decimal('1234.50')),
+    ('$-12.00', Decimal('-12.00')),
+    ('(12.00)', Decimal('-12.00')),
+    ('($1,000.10)', Decimal('-1000.10')),
+    (' £ 5.25 ', Decimal('5.25')),
+    ('+3.00 USD', Decimal('3.00')),
+    ('', None),
+    ('n/a', None),
+    ('1.2.3', None),
+    ('1000000000000', None)
+])
+def test_parse_amount(text, amount):
+    assert importer.parse_amount(text) == amount
+
+def test_parse_csv_with_debit_and_credit_columns():
+    text = 'Date,Details,Money Out,Money In,Type\n03/01/2022,Shop,£12.50,,Food\n04/01/2022,Pay,,"£1,000.00",\n05/01/2022,Bad,,,\nnot a date,Bad,1.00,,\n'
+    rows = list(importer.parse_csv(io.StringIO(text), importer.Columns('Date', 'Details', None, 'Money Out', 'Money In', 'Type'), '%d/%m/%Y'))
+    assert rows == [
+        importer.Row(datetime(2022, 1, 3), 'Shop', Decimal('-12.50'), 'Food', None),
+        importer.Row(datetime(2022, 1, 4), 'Pay', Decimal('1000.00'), None, None),
+        None,
+        None
+    ]
+
+OFX = '''OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20220103120000<TRNAMT>-12.50<FITID>A1<NAME>Shop</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20220104<TRNAMT>1000.00<FITID>A2<MEMO>Pay</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>bad<TRNAMT>-1.00<FITID>A3</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+'''
+
+def test_parse_ofx(monkeypatch):
+    # Tiny reads cut tags and records across blocks
+    monkeypatch.setattr(importer, 'READ_SIZE', 7)
+    assert list(importer.parse_ofx(io.StringIO(OFX))) == [
+        importer.Row(datetime(2022, 1, 3), 'Shop', Decimal('-12.50'), None, 'A1'),
+        importer.Row(datetime(2022, 1, 4), 'Pay', Decimal('1000.00'), None, 'A2'),
+        None
+    ]
+
+def test_parse_qif():
+    text = "!Type:Bank\nD1/ 3'22\nT-12.50\nPShop\nLFood\n^\nD01/04/2022\nT1,000.00\nMPay\n^\nDsoon\nT1\n^\n"
+    assert list(importer.parse_qif(io.StringIO(text))) == [
+        importer.Row(datetime(2022, 1, 3), 'Shop', Decimal('-12.50'), 'Food', None),
+        importer.Row(datetime(2022, 1, 4), 'Pay', Decimal('1000.00'), None, None),
+        None
+    ]
+
+def test_reimport_skips_duplicates(app, account_id):
+    rows = [f'2022-01-{day:02},Shop,(1.{day:02})' for day in range(1, 13)]
+    # The same purchase twice on one day is two transactions
+    rows.append('2022-01-12,Shop,(1.12)')
+    export = 'date,description,amount\n' + '\n'.join(rows) + '\n'
+
+    result, balance = run_import(app, account_id, export, chunk_size=5)
+    assert result == importer.ImportResult(read=13, imported=13, duplicates=0, skipped=0)
+    assert balance == Decimal('100') - sum(Decimal(f'1.{day:02}') for day in range(1, 13)) - Decimal('1.12')
+
+    result, again = run_import(app, account_id, export, chunk_size=5)
+    assert result == importer.ImportResult(read=13, imported=0, duplicates=13, skipped=0)
+    assert again == balance
+
+    # An overlapping export only adds its new rows
+    overlapping = 'date,description,amount\n' + '\n'.join(rows[-3:] + ['2022-01-13,Shop,-2.00', '2022-01-14,Pay,$50']) + '\n'
+    result, after = run_import(app, account_id, overlapping, chunk_size=2)
+    assert result == importer.ImportResult(read=5, imported=2, duplicates=3, skipped=0)
+    assert after == balance + Decimal('48.00')
+    with app.app_context():
+        assert Transaction.query.filter_by(account_id=account_id).count() == 1 + 13 + 2
+
+def test_reimport_ofx_by_fitid(app, account_id):
+    result, balance = run_import(app, account_id, OFX, 'ofx')
+    assert result == importer.ImportResult(read=3, imported=2, duplicates=0, skipped=1)
+    assert balance == Decimal('1087.50')
+
+    # The bank corrected a description, the FITID still identifies the row
+    result, again = run_import(app, account_id, OFX.replace('<NAME>Shop', '<NAME>Shop Ltd'), 'ofx')
+    assert result == importer.ImportResult(read=3, imported=0, duplicates=2, skipped=1)
+    assert again == balance
+
+def test_import_route(client, account_id):
+    export = (io.BytesIO(b'date,description,amount\n2022-01-03,Shop,-12.50\n'), 'export.csv')
+    response = client.post('/transaction/import', data={'account': account_id, 'format': 'auto', 'file': export}, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert client.get(f'/account/{account_id}').status_code == 200
+    assert b'87.50' in client.get('/account/view').data
@@ -0,0 +1,115 @@
+"""Tests of the report job queue"""
+import time
+from datetime import datetime, timedelta
+import pytest
+from dontbudge import jobs
+from dontbudge.database import db
+from dontbudge.api.models import Job, UserDetails
+
+def add_job(app, status=jobs.QUEUED, report='years'):
+    with app.app_context():
+        job = Job(UserDetails.query.first().id, report, 'csv', {}, status, datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+def get_status(app, job_id):
+    with app.app_context():
+        return db.session.query(Job.status).filter(Job.id == job_id).scalar()
+
+@pytest.fixture
+def queue(monkeypatch):
+    """Keep queued jobs on the queue, rather than starting them in worker processes"""
+    monkeypatch.setattr(jobs, 'dispatch', lambda: None)
+
+def test_claim_and_finish(app, client, queue):
+    first = add_job(app)
+    second = add_job(app)
+    with app.app_context():
+        assert jobs.claim() == first
+        assert jobs.claim() == second
+        assert jobs.claim() is None
+
+        jobs.build(first)
+        jobs.finish(second, jobs.FAILED, error='The report could not be built')
+        # A job is only finished once
+        jobs.finish(second, jobs.DONE, result=b'')
+    assert get_status(app, first) == jobs.DONE
+    assert get_status(app, second) == jobs.FAILED
+    with app.app_context():
+        assert Job.query.filter_by(id=first).first().result.startswith(b'year,')
+
+def test_released_job_is_claimed_again(app, client, queue):
+    job_id = add_job(app)
+    with app.app_context():
+        assert jobs.claim() == job_id
+        jobs.release(job_id)
+        assert jobs.claim() == job_id
+
+def test_cancelled_job_is_not_finished(app, client, api_headers, queue):
+    queued = add_job(app)
+    response = client.delete(f'/api/v1/reports/{queued}', headers=api_headers)
+    assert response.get_json()['status'] == jobs.CANCELLED
+
+    running = add_job(app)
+    with app.app_context():
+        assert jobs.claim() == running
+        assert jobs.cancel(running)
+        assert not jobs.is_running(running)
+        jobs.finish(running, jobs.DONE, result=b'')
+        assert jobs.claim() is None
+    assert get_status(app, running) == jobs.CANCELLED
+
+    # A finished job is deleted
+    response = client.delete(f'/api/v1/reports/{running}', headers=api_headers)
+    assert response.get_json() == {'deleted': True, 'id': running}
+    assert get_status(app, running) is None
+
+def test_expire(app, client, queue):
+    stuck = add_job(app)
+    old = add_job(app, jobs.DONE)
+    with app.app_context():
+        assert jobs.claim() == stuck
+        past = datetime.utcnow() - timedelta(seconds=jobs.TIMEOUT + 1)
+        Job.query.filter_by(id=stuck).update({Job.started: past})
+        Job.query.filter_by(id=old).update({Job.finished: datetime.utcnow() - jobs.RETENTION - timedelta(seconds=1)})
+        db.session.commit()
+        jobs.expire()
+    assert get_status(app, stuck) == jobs.FAILED
+    assert get_status(app, old) is None
+
+def test_user_limit(client, api_headers, queue):
+    for i in range(jobs.USER_LIMIT):
+        assert client.post('/api/v1/reports', json={'report': 'years'}, headers=api_headers).status_code == 202
+    assert client.post('/api/v1/reports', json={'report': 'years'}, headers=api_headers).status_code == 429
+
+def wait_for(client, api_headers, job_id, timeout=60):
+    """Poll a job until it finishes"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/v1/reports/{job_id}', headers=api_headers).get_json()
+        if job['status'] not in jobs.ACTIVE:
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f'Report job {job_id} did not finish')
+
+def test_lifecycle(app, client, api_headers):
+    client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '12.50'}, headers=api_headers)
+    response = client.post('/api/v1/reports', json={'report': 'years', 'format': 'csv'}, headers=api_headers)
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.headers['Location'].endswith(f'/api/v1/reports/{job_id}')
+
+    assert wait_for(client, api_headers, job_id)['status'] == jobs.DONE
+    response = client.get(f'/api/v1/reports/{job_id}/result', headers=api_headers)
+    assert response.status_code == 200
+    assert response.data.startswith(b'year,')
+    assert b'12.50' in response.data
+
+    # A report that raises fails its job
+    with app.app_context():
+        failing = jobs.enqueue(UserDetails.query.first(), 'bogus', 'csv', {}).id
+    job = wait_for(client, api_headers, failing)
+    assert job['status'] == jobs.FAILED
+    assert job['error'] == 'The report could not be built'
+    assert client.get(f'/api/v1/reports/{failing}/result', headers=api_headers).status_code == 409
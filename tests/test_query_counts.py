@@ -0,0 +1,44 @@
+"""Tests that the dashboard routes stay within the query bounds of benchmarks/suite.py
+
+The bounds hold whatever the size of the user's history, so they are checked
+against users of two sizes: a route whose queries grow with the data (an N+1
+lazy load) fails on the larger one.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from dontbudge.database import db
+from dontbudge.auth.models import User
+from dontbudge.auth.jwt import create_token
+from suite import QUERY_BOUNDS, QueryCounter, clear_cache, get_route_cases
+from synthetic import Profile, generate
+
+PROFILES = {
+    'small': Profile(accounts=2, categories=3, budgets=2, bills=2, years=1, per_day=1),
+    'larger': Profile(accounts=4, categories=6, budgets=4, bills=4, years=2, per_day=3)
+}
+
+@pytest.mark.parametrize('profile', PROFILES.values(), ids=PROFILES.keys())
+def test_query_bounds(app, profile):
+    with app.app_context():
+        userdetails_id = generate('benchmark', profile, seed=1)
+        token = create_token(User.query.filter_by(username='benchmark').first(), True)
+        counter = QueryCounter(db.engine)
+    client = app.test_client()
+    client.set_cookie('localhost', 'token', token)
+
+    cases = get_route_cases(client, userdetails_id)
+    assert {case for case, url in cases} == set(QUERY_BOUNDS)
+    for case, url in cases:
+        # Built from the database, then from the derived data cache
+        for cached in (False, True):
+            if not cached:
+                clear_cache()
+            start = counter.count
+            response = client.get(url)
+            assert response.status_code == 200, (case, response.status_code)
+            queries = counter.count - start
+            assert queries <= QUERY_BOUNDS[case], f'{case}{" (cached)" if cached else ""}: {queries} queries, bound is {QUERY_BOUNDS[case]}'
@@ -0,0 +1,75 @@
+"""Tests of the closed-form bill schedule"""
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytest
+from dontbudge.dashboard import schedule, utility
+
+Bill = namedtuple('Bill', ['id', 'name', 'amount', 'start', 'occurence'])
+
+def make_bill(start, occurence, amount='10.00'):
+    return Bill(1, 'Bill', Decimal(amount), start, occurence)
+
+def step_through(bill, start, end):
+    """Every due date of a bill in a window, found by counting occurences up from its start"""
+    step = utility.get_relative(bill.occurence)
+    dates = []
+    index = 0
+    while bill.start + step * index < end:
+        if bill.start + step * index >= start:
+            dates.append(bill.start + step * index)
+        index += 1
+    return dates
+
+def due_dates(bill, start, end):
+    return [occurrence.date for occurrence in schedule.get_occurrences(bill, start, end)]
+
+def test_month_end_start():
+    bill = make_bill(datetime(2022, 1, 31), '1M')
+    assert due_dates(bill, datetime(2022, 1, 1), datetime(2022, 7, 1)) == [
+        datetime(2022, 1, 31), datetime(2022, 2, 28), datetime(2022, 3, 31),
+        datetime(2022, 4, 30), datetime(2022, 5, 31), datetime(2022, 6, 30)
+    ]
+    # Short months do not pull later occurences earlier, even years on
+    assert due_dates(bill, datetime(2024, 2, 1), datetime(2024, 4, 1)) == [datetime(2024, 2, 29), datetime(2024, 3, 31)]
+    assert due_dates(bill, datetime(2022, 3, 1), datetime(2022, 3, 31)) == []
+
+def test_quarterly_and_yearly_steps():
+    quarterly = make_bill(datetime(2021, 11, 30), '1Q')
+    assert due_dates(quarterly, datetime(2022, 1, 1), datetime(2023, 1, 1)) == [
+        datetime(2022, 2, 28), datetime(2022, 5, 30), datetime(2022, 8, 30), datetime(2022, 11, 30)
+    ]
+    yearly = make_bill(datetime(2020, 2, 29), '1Y')
+    assert due_dates(yearly, datetime(2021, 1, 1), datetime(2025, 1, 1)) == [
+        datetime(2021, 2, 28), datetime(2022, 2, 28), datetime(2023, 2, 28), datetime(2024, 2, 29)
+    ]
+    assert schedule.count_occurrences(yearly, datetime(2020, 2, 29), datetime(2030, 2, 28)) == 10
+
+def test_bill_starting_after_the_window():
+    bill = make_bill(datetime(2022, 6, 15), '1W')
+    assert due_dates(bill, datetime(2022, 1, 1), datetime(2022, 6, 15)) == []
+    assert schedule.count_occurrences(bill, datetime(2022, 1, 1), datetime(2022, 6, 15)) == 0
+    assert schedule.get_first_index(bill, datetime(2022, 1, 1)) == 0
+    # The window's end is exclusive, and its start inclusive
+    assert due_dates(bill, datetime(2022, 6, 15), datetime(2022, 6, 23)) == [datetime(2022, 6, 15), datetime(2022, 6, 22)]
+
+@pytest.mark.parametrize('occurence', ['1W', '2W', '1M', '1Q', '1Y'])
+def test_many_periods(occurence):
+    bills = [make_bill(start, occurence) for start in (datetime(2001, 1, 31), datetime(2003, 8, 29), datetime(2010, 2, 28), datetime(2012, 2, 29))]
+    # Fortnightly periods over twenty years
+    periods = [datetime(2000, 1, 3) + timedelta(weeks=2) * i for i in range(522)]
+    for bill in bills:
+        dates = step_through(bill, periods[0], periods[-1])
+        for start, end in zip(periods, periods[1:]):
+            expected = dates[bisect_left(dates, start):bisect_left(dates, end)]
+            assert due_dates(bill, start, end) == expected, (bill.start, start)
+            assert schedule.count_occurrences(bill, start, end) == len(expected)
+
+    start = datetime(2011, 12, 1)
+    end = start + timedelta(days=3 * 365)
+    expected = [0] * (end - start).days
+    for bill in bills:
+        for day in step_through(bill, start, end):
+            expected[(day - start).days] += bill.amount
+    assert schedule.get_daily_totals(bills, start, (end - start).days) == expected
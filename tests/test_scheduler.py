@@ -0,0 +1,69 @@
+"""Tests of the background scheduler and its lease"""
+import threading
+from datetime import date, datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from dontbudge import scheduler
+from dontbudge.database import db
+from dontbudge.api import balances
+from dontbudge.api.models import Bill, Transaction, UserDetails
+
+def get_expiry(name):
+    return db.session.execute(scheduler.locks.select().where(scheduler.locks.c.name == name)).one().expires
+
+def test_lease(app):
+    with app.app_context():
+        assert scheduler.acquire('test', 'a', 60)
+        assert not scheduler.acquire('test', 'b', 60)
+
+        # The holder renews it
+        expires = get_expiry('test')
+        assert scheduler.acquire('test', 'a', 600)
+        assert get_expiry('test') > expires
+
+        # An expired lease is taken over, after which its old holder is locked out
+        db.session.execute(scheduler.locks.update().values(expires=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        assert scheduler.acquire('test', 'b', 60)
+        assert not scheduler.acquire('test', 'a', 60)
+
+def test_run_stops_when_lease_is_lost(app, client, monkeypatch):
+    # Renew the lease before every user
+    monkeypatch.setattr(scheduler, 'LEASE', 0)
+    with app.app_context():
+        assert scheduler.acquire(scheduler.LOCK, 'other', 60)
+        assert scheduler.run_once(owner='me').users == 0
+        assert scheduler.run_once().users == 1
+
+def test_competing_schedulers(app, client, api_headers):
+    account_id = client.post('/api/v1/accounts', json={'name': 'Main', 'balance': '1000'}, headers=api_headers).get_json()['id']
+    start = date.today() - relativedelta(months=3)
+    client.post('/api/v1/bills', headers=api_headers, json={'name': 'Rent', 'occurence': '1M', 'start': start.isoformat(), 'amount': '100', 'account_id': account_id})
+
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def compete(owner):
+        with app.app_context():
+            try:
+                barrier.wait()
+                results[owner] = scheduler.run(interval=3600, owner=owner)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=compete, args=(owner,)) for owner in ('first', 'second')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Exactly one ran, and the lease keeps the other out until the next run is due
+    runs = [result for result in results.values() if result is not None]
+    assert len(runs) == 1
+    assert runs[0].payments == 4
+    loser = next(owner for owner, result in results.items() if result is None)
+    with app.app_context():
+        assert scheduler.run(owner=loser) is None
+        assert Transaction.query.filter(Transaction.bill_id.isnot(None)).count() == 4
+        assert Bill.query.first().start.date() == start + relativedelta(months=4)
+        assert balances.verify() == []
+        assert UserDetails.query.first().version > 0